@@ -1,22 +1,61 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 import sys
-import operator
 import random
 
+import numpy as np
+
 #Usage example: python ClusterStrings.py sequences.txt 5
 
 #Input: sequences.txt simple text file where each line represents a sequence
 #       The second arg is the number of sequences you wish to choose.
 
-#Output: sequences_hamm.txt, sequences_sort.txt, sequences_rand.txt
-
-def hamdist(str1, str2):
-    diffs = 0
-    for ch1, ch2 in zip(str1, str2):
-        if ch1 != ch2:
-            diffs += 1
-    return diffs
+#Output: sequences_hamm.txt, sequences_sort.txt, sequences_rand.txt, sequences_rand2.txt, sequences_div.txt
+#        sequences_div.txt holds the num_seq most diverse sequences (max-min Hamming distance, farthest-point sampling).
+
+#Bytes of temporary comparison array allowed per chunk of a distance calculation.
+CHUNK_BYTES = 64 * 1024 * 1024
+
+def encode(str_list):
+    """
+    Encode sequences as a uint8 matrix, one row per sequence.  Shorter sequences are padded with 0.
+    """
+    length = max([len(seq) for seq in str_list] + [1])
+    codes = np.zeros((len(str_list), length), dtype=np.uint8)
+    for idx, seq in enumerate(str_list):
+        codes[idx, :len(seq)] = np.frombuffer(seq.encode('ascii'), dtype=np.uint8)
+    return codes
+
+def hamming_to(codes, ref):
+    """
+    Hamming distance from every row of codes to one encoded sequence.  Only the positions both sequences have are
+    compared.
+    """
+    rows = max(1, CHUNK_BYTES // max(1, codes.shape[1]))
+    dists = np.empty(len(codes), dtype=np.int32)
+    for start in range(0, len(codes), rows):
+        block = codes[start:start + rows]
+        diff = (block != ref) & (block != 0) & (ref != 0)
+        dists[start:start + rows] = diff.sum(axis=1)
+    return dists
+
+def maxmin_pick(codes, num_seq, start=0):
+    """
+    Pick num_seq maximally diverse rows by farthest-point sampling: starting from row start, repeatedly pick the row
+    whose Hamming distance to its nearest already picked row is largest.  Returns the picked row indices in order.
+    """
+    num_seq = min(num_seq, len(codes))
+    if num_seq <= 0:
+        return []
+    picked = [start]
+    mindist = hamming_to(codes, codes[start])
+    mindist[start] = -1
+    while len(picked) < num_seq:
+        idx = int(np.argmax(mindist))
+        picked.append(idx)
+        np.minimum(mindist, hamming_to(codes, codes[idx]), out=mindist)
+        mindist[picked] = -1
+    return picked
 
 def main(args):
 
@@ -31,14 +70,19 @@ def main(args):
     outfile_sort = '%s%d_sort.txt' % (file,num_seq)
     outfile_rand = '%s%d_rand.txt' % (file,num_seq)
     outfile_rand2 = '%s%d_rand2.txt' % (file,num_seq)
+    outfile_div = '%s%d_div.txt' % (file,num_seq)
+
+    #Unique sequences, in order of first appearance, sorted by Hamming distance to the first sequence.
+    unique = list(dict.fromkeys(str_list))
+    codes = encode(unique)
+    dists = hamming_to(codes, codes[0])
+    sorted_hamm = [unique[idx] for idx in np.argsort(dists, kind='stable')]
+
+    selected_div = [unique[idx] for idx in maxmin_pick(codes, num_seq)]
 
-    dist_dict = { seq:hamdist(str_list[0],seq) for seq in str_list }
-    sorted_hamm_t = sorted(dist_dict.items(), key=operator.itemgetter(1))
-    sorted_hamm = [ key for key,val in sorted_hamm_t]
-    
     random.shuffle(str_list)
-    
-    step = (len(str_list)-1)/(num_seq-1)
+
+    step = max(1, (len(str_list)-1)//max(1, num_seq-1))
     end = len(str_list)
 
     selected_hamm = sorted_hamm[0:end:step]
@@ -53,12 +97,13 @@ def main(args):
     sort_out = open(outfile_sort,"w")
     rand_out = open(outfile_rand,"w")
     rand2_out = open(outfile_rand2,"w")
+    div_out = open(outfile_div,"w")
 
     hamm_out.write("\n".join(selected_hamm))
     sort_out.write("\n".join(selected_sort))
     rand_out.write("\n".join(selected_rand))
     rand2_out.write("\n".join(selected_rand2))
+    div_out.write("\n".join(selected_div))
 if __name__ == "__main__":
 
     main(sys.argv)
-
@@ -1,63 +1,369 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
+"""
+ConvertSeqTransfac.py converts a file of aligned sequences (one per line, e.g. the designed sequences of a run) into a
+TRANSFAC position frequency matrix, written to <input name>.transfac.
+
+Sequences are read in large blocks and encoded to uint8 alphabet indices with a lookup table, and a (width x alphabet)
+count matrix is accumulated with np.bincount.  The alphabet is the 20 amino acids, a gap ('-' or '.') and X, which
+every other letter counts as.  Gaps and X aren't written, and frequencies are over the amino acids at each position,
+unless --gaps is given (then the gap column is written, and gaps count towards the frequencies).  Lines shorter than
+the first line are padded with gaps.  The columns are in alphabetical order (ACDEFGHIKLMNPQRSTVWY), not the dict
+order of the Python 2 version (ACEDGFIHKMLNQPSRTWVY).
+
+With --weighted, each line is a sequence followed by its weight, e.g. "ACDEF 0.25".
+
+Counts can be built in parts (e.g. one job per output file) and saved with --counts, and the .npz count files given
+as inputs later, along with any sequence files.  All inputs are summed, so the same matrix comes out however the
+sequences were split.  Several sequence files are counted in parallel with --processes.  In Python, PositionCounts
+keeps a count matrix in memory and adds batches of sequences to it as they arrive (see desmatrix_remove_wt.py).
+
+Requires numpy.
+
+Usage: ConvertSeqTransfac.py sequences.txt [offset]
+       ConvertSeqTransfac.py part1.txt part2.txt part3.npz --offset 1 --output all.transfac --processes 3
+       ConvertSeqTransfac.py part1.txt --counts part1.npz
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import argparse
+import os
 import sys
 
-def main(args):
-    infile=args[1]
-    if len(args) == 3:
-        offset=int(args[2])
+import numpy as np
+
+# The amino acids, in the order the columns have always been written.
+AMINO_ACIDS = 'ACDEFGHIKLMNPQRSTVWY'
+GAP = '-'
+UNKNOWN = 'X'
+ALPHABET = AMINO_ACIDS + GAP + UNKNOWN
+
+GAP_INDEX = ALPHABET.index(GAP)
+UNKNOWN_INDEX = ALPHABET.index(UNKNOWN)
+
+# Byte -> alphabet index.  Lower case letters count as upper case, '.' as a gap.
+LOOKUP = np.full(256, UNKNOWN_INDEX, dtype=np.uint8)
+for _idx, _letter in enumerate(ALPHABET):
+    LOOKUP[ord(_letter)] = _idx
+    LOOKUP[ord(_letter.lower())] = _idx
+LOOKUP[ord('.')] = GAP_INDEX
+
+# Bytes of sequence file read at a time.
+BLOCK_SIZE = 1 << 24
+
+
+class TransfacError(Exception):
+    """
+    Exception class for input files that can't be counted or merged.
+    """
+
+
+def read_blocks(filename: str, block_size: int = BLOCK_SIZE) -> Iterator[List[bytes]]:
+    """
+    Read the non-blank lines of a file in large blocks.
+
+    :param filename: The file.
+    :param block_size: Roughly the number of bytes read at a time.
+    :return: An iterator over lists of lines, without line endings.
+    """
+
+    with open(filename, 'rb') as infile:
+        rest = b''
+        while True:
+            block = infile.read(block_size)
+            if not block:
+                break
+            lines = (rest + block).split(b'\n')
+            rest = lines.pop()
+            lines = [line.rstrip(b'\r') for line in lines]
+            yield [line for line in lines if line.strip()]
+        if rest.strip():
+            yield [rest.rstrip(b'\r')]
+
+
+def encode(lines: List[bytes], width: int) -> np.ndarray:
+    """
+    Encode sequences to alphabet indices.
+
+    :param lines: The sequences.
+    :param width: The motif width.  Longer sequences are cut, shorter ones padded with gaps.
+    :return: A (sequences x width) uint8 array of indices into ALPHABET.
+    """
+
+    if all(len(line) == width for line in lines):
+        raw = np.frombuffer(b''.join(lines), dtype=np.uint8).reshape(len(lines), width)
     else:
-        offset=1
-
-    fh = open( infile, "r" )
-    nextline = fh.readline()
-    
-    motifWidth = len(nextline.strip())
-    
-    weightMatrix = [{
-                    'A':0.0,'C':0.0,'D':0.0,'E':0.0,'F':0.0,
-                    'G':0.0,'H':0.0,'I':0.0,'K':0.0,'L':0.0,
-                    'M':0.0,'N':0.0,'P':0.0,'Q':0.0,'R':0.0,
-                    'S':0.0,'T':0.0,'W':0.0,'Y':0.0,'V':0.0
-                    } for k in range(motifWidth)]
-    
-    while nextline:
-        for k in range(motifWidth):
-            weightMatrix[k][nextline[k]] += 1
-        nextline = fh.readline()
-
-    sums = [ sum( weightMatrix[k].values() ) for k in range(motifWidth) ];
-
-    if sums[0] == 0.0:
-        freqMatrix = [dict(( key , val) for (key,val) in weightMatrix[k].iteritems() )
-                    for k in range(motifWidth)]
+        raw = np.full((len(lines), width), ord(GAP), dtype=np.uint8)
+        for idx, line in enumerate(lines):
+            line = line[:width]
+            raw[idx, :len(line)] = np.frombuffer(line, dtype=np.uint8)
+    return LOOKUP[raw]
+
+
+def accumulate(counts: np.ndarray, codes: np.ndarray, weights: Optional[np.ndarray] = None):
+    """
+    Add encoded sequences to a count matrix, in place.
+
+    :param counts: The (width x alphabet) count matrix.
+    :param codes: The (sequences x width) encoded sequences.
+    :param weights: The weight of each sequence, or None to count each one once.
+    """
+
+    width = counts.shape[0]
+    cells = (codes.astype(np.intp) + np.arange(width, dtype=np.intp) * len(ALPHABET)).ravel()
+    if weights is not None:
+        weights = np.broadcast_to(weights[:, np.newaxis], codes.shape).ravel()
+    counts += np.bincount(cells, weights=weights, minlength=counts.size).reshape(counts.shape)
+
+
+def count_file(filename: str, weighted: bool = False, block_size: int = BLOCK_SIZE) -> np.ndarray:
+    """
+    Count a sequence file.  The motif width is the length of the first sequence.
+
+    :param filename: The sequence file.
+    :param weighted: Whether each line is a sequence and its weight.
+    :param block_size: Roughly the number of bytes read at a time.
+    :return: The (width x alphabet) count matrix.
+    """
+
+    counts = None
+    for lines in read_blocks(filename, block_size):
+        weights = None
+        if weighted:
+            fields = [line.split() for line in lines]
+            if any(len(field) < 2 for field in fields):
+                raise TransfacError("{name} has a line without a weight.".format(name=filename))
+            lines = [field[0] for field in fields]
+            weights = np.array([float(field[1]) for field in fields], dtype=np.float64)
+        if counts is None:
+            counts = np.zeros((len(lines[0].strip()), len(ALPHABET)), dtype=np.float64)
+        accumulate(counts, encode([line.strip() for line in lines], counts.shape[0]), weights)
+    if counts is None:
+        raise TransfacError("{name} has no sequences.".format(name=filename))
+    return counts
+
+
+def _count_job(args: Tuple[str, bool]) -> np.ndarray:
+    """
+    Count one sequence file in a worker process.
+
+    :param args: A tuple of (filename, weighted).
+    :return: The count matrix.
+    """
+
+    return count_file(*args)
+
+
+def save_counts(filename: str, counts: np.ndarray):
+    """
+    Save a count matrix to merge later.
+
+    :param filename: The .npz file.
+    :param counts: The count matrix.
+    """
+
+    with open(filename, 'wb') as outfile:
+        np.savez(outfile, counts=counts, alphabet=np.array(ALPHABET))
+
+
+def load_counts(filename: str) -> np.ndarray:
+    """
+    Load a count matrix saved by save_counts.
+
+    :param filename: The .npz file.
+    :return: The count matrix.
+    """
+
+    with np.load(filename) as data:
+        if str(data['alphabet']) != ALPHABET:
+            raise TransfacError("{name} was counted with a different alphabet.".format(name=filename))
+        return data['counts']
+
+
+def merge_counts(parts: List[np.ndarray]) -> np.ndarray:
+    """
+    Sum count matrices of the same motif.
+
+    :param parts: The count matrices.
+    :return: The total count matrix.
+    """
+
+    widths = set(part.shape[0] for part in parts)
+    if len(widths) != 1:
+        raise TransfacError("Can't merge counts of different motif widths: {widths}".format(
+            widths=', '.join(str(width) for width in sorted(widths))))
+    return np.sum(parts, axis=0)
+
+
+def frequencies(counts: np.ndarray, gaps: bool = False) -> Tuple[str, np.ndarray]:
+    """
+    Turn a count matrix into frequencies.  Positions without counts keep their (zero) counts.
+
+    :param counts: The count matrix.
+    :param gaps: Whether to keep the gap column and count gaps towards the frequencies.
+    :return: A tuple of (the letters of the columns, the (width x letters) frequency matrix).
+    """
+
+    letters = AMINO_ACIDS + GAP if gaps else AMINO_ACIDS
+    kept = counts[:, :len(letters)]
+    sums = kept.sum(axis=1, keepdims=True)
+    return letters, np.divide(kept, sums, out=kept.copy(), where=sums != 0)
+
+
+def write_transfac(filename: str, letters: str, freqs: np.ndarray, offset: int = 1):
+    """
+    Write a frequency matrix in TRANSFAC format.
+
+    :param filename: The output file.
+    :param letters: The letters of the columns.
+    :param freqs: The (width x letters) frequency matrix.
+    :param offset: The number of the first position.
+    """
+
+    lines = ["ID Matrix\nPO" + ''.join("\t" + letter for letter in letters) + "\n"]
+    for pos, row in enumerate(freqs.tolist(), offset):
+        lines.append(str(pos) + ''.join("\t%0.4f" % val for val in row) + "\n")
+    with open(filename, 'w') as transfac:
+        transfac.write(''.join(lines))
+
+
+class PositionCounts:
+    """
+    A count matrix kept in memory and updated as batches of sequences arrive, so earlier batches are never re-read.
+    """
+
+    def __init__(self, counts: Optional[np.ndarray] = None):
+        """
+        Initialization of PositionCounts.
+
+        :param counts: A (width x alphabet) count matrix to start from, or None to start empty (the width is then set
+        by the first sequences added).
+        """
+
+        self.counts = counts
+
+
+    @classmethod
+    def load(cls, filename: str) -> 'PositionCounts':
+        """
+        :return: The counts saved in a .npz file, or empty counts if the file doesn't exist yet.
+        """
+
+        return cls(load_counts(filename) if os.path.exists(filename) else None)
+
+
+    def save(self, filename: str):
+        """
+        Save the counts to a .npz file.
+        """
+
+        if self.counts is None:
+            raise TransfacError("No sequences have been counted.")
+        save_counts(filename, self.counts)
+
+
+    def add_counts(self, counts: np.ndarray):
+        """
+        Add a count matrix (e.g. one loaded with load_counts).
+        """
+
+        self.counts = counts.copy() if self.counts is None else merge_counts([self.counts, counts])
+
+
+    def add_sequences(self, sequences: List[str], weights: Optional[List[float]] = None):
+        """
+        Add a batch of sequences.
+
+        :param sequences: The sequences.
+        :param weights: The weight of each sequence, or None to count each one once.
+        """
+
+        lines = [seq.strip().encode('ascii') for seq in sequences]
+        lines = [line for line in lines if line]
+        if not lines:
+            return
+        if self.counts is None:
+            self.counts = np.zeros((len(lines[0]), len(ALPHABET)), dtype=np.float64)
+        accumulate(self.counts, encode(lines, self.counts.shape[0]),
+                   None if weights is None else np.asarray(weights, dtype=np.float64))
+
+
+    def add_file(self, filename: str, weighted: bool = False):
+        """
+        Add a sequence file, or a .npz count file.
+        """
+
+        self.add_counts(load_counts(filename) if filename.endswith('.npz') else count_file(filename, weighted))
+
+
+    def frequencies(self, gaps: bool = False) -> Tuple[str, np.ndarray]:
+        """
+        :return: The letters of the columns and the frequency matrix (see frequencies()).
+        """
+
+        if self.counts is None:
+            raise TransfacError("No sequences have been counted.")
+        return frequencies(self.counts, gaps)
+
+
+def build_counts(inputs: List[str], weighted: bool = False, processes: int = 1) -> np.ndarray:
+    """
+    Count sequence files and merge them with saved .npz count files.
+
+    :param inputs: Sequence files and .npz count files.
+    :param weighted: Whether each line of the sequence files is a sequence and its weight.
+    :param processes: Number of sequence files counted at once.
+    :return: The total count matrix.
+    """
+
+    seqfiles = [name for name in inputs if not name.endswith('.npz')]
+    parts = [load_counts(name) for name in inputs if name.endswith('.npz')]
+    jobs = [(name, weighted) for name in seqfiles]
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts.extend(pool.map(_count_job, jobs))
     else:
-        freqMatrix = [dict(( key , val/sums[k]) for (key,val) in weightMatrix[k].iteritems() )
-                    for k in range(motifWidth)]
-    
-    tokens=infile.rsplit('.',1)
-    file=tokens[0]
-    outfile= '%s.transfac' % (file)
-
-    transfac = open(outfile,"w")
-            
-    transfac.write("ID Matrix\nPO")
-    
-    for key,val in freqMatrix[1].iteritems():
-        transfac.write("\t" + key)
-    
-    transfac.write("\n")
-    
-    for k in range(motifWidth):
-        transfac.write(str(k+offset))
-        
-        for key,val in freqMatrix[k].iteritems():
-            transfac.write("\t")
-            transfac.write("%0.4f" %val)
-            
-        transfac.write("\n")
+        parts.extend(_count_job(job) for job in jobs)
+    return merge_counts(parts)
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    # The old interface was "ConvertSeqTransfac.py infile [offset]".
+    if len(argv) == 2 and argv[1].lstrip('-').isdigit() and not os.path.exists(argv[1]):
+        argv = [argv[0], '--offset', argv[1]]
+
+    parser = argparse.ArgumentParser(description='Convert aligned sequences to a TRANSFAC position frequency matrix.')
+    parser.add_argument('inputs', nargs='+', help='Sequence files (one sequence per line) and .npz count files saved '
+                        'with --counts.')
+    parser.add_argument('--offset', type=int, default=1, help='The number of the first position, defaults to 1.')
+    parser.add_argument('--output', type=str, help='The TRANSFAC file, defaults to the first input with its extension '
+                        'replaced by .transfac.')
+    parser.add_argument('--counts', type=str, help='Save the merged counts to this .npz file instead of writing a '
+                        'TRANSFAC file.')
+    parser.add_argument('--weighted', action='store_true', help='Each line is a sequence followed by its weight.')
+    parser.add_argument('--gaps', action='store_true', help='Write a gap column and count gaps towards the '
+                        'frequencies.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of sequence files counted at once.')
+    args = parser.parse_args(argv)
+
+    try:
+        counts = build_counts(args.inputs, args.weighted, args.processes)
+    except TransfacError as err:
+        sys.exit(str(err))
+
+    if args.counts is not None:
+        save_counts(args.counts, counts)
+        return
+
+    outfile = args.output if args.output is not None else '%s.transfac' % (args.inputs[0].rsplit('.', 1)[0])
+    letters, freqs = frequencies(counts, args.gaps)
+    write_transfac(outfile, letters, freqs, args.offset)
+
 
 if __name__ == "__main__":
-    #infile = '/Users/arubenstein/Downloads/sorted_complete.txt'
-    #outfile = '/Users/arubenstein/Dropbox/Research/Khare Lab/Mean Field/Design/HCV.transfac'
-    
-    main(sys.argv)
+    main(sys.argv[1:])
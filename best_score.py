@@ -1,77 +1,79 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 ##Usage: best_score.py pdblist.txt myscores.sc topnum
+##   or: best_score.py -s myscores.sc -n topnum Cluster*.txt
 ##pdblist.txt is a list of PDB names to search for in the score file.
 ##myscores.sc is a Rosetta scorefile.
-##Both files should be in the current directory.
-##pdblist.txt must not have the extensions listed.  To do this with ls, use the following command:
+##pdblist.txt may list names with or without the .pdb extension.  To make one with ls, use the following command:
 ##ls | sed -e 's/\..*$//' > pdblist.txt
 ##topnum is the number of top scores to return.  For example topnum=10 returns the top 10 scores.
+##The second form reads the scorefile once and reports the best poses of every list file given (e.g. one per cluster).
+##In both forms, the best poses are appended to bestscores.txt.
 
-import os, sys, csv
-
-pdbfilelist = sys.argv[1]
-pdblist = open(pdbfilelist, 'r')
-myscores = sys.argv[2]
-scorefile = open(myscores, 'r')
-topnum = sys.argv[3]
-
-csvscores = []
-
-#Convert each line of the score file to a list, and put each of those lists into another list.
-for line in scorefile:
-	line = line.split()
-	csvscores.append(line)
-	
-#Go through the header row and determine what column total_score and description are in.
-colnum = 0
-for col in csvscores[1]:
-	if (col == 'total_score'):
-		totalcol = colnum
-	if (col == 'description'):
-		namecol = colnum
-	colnum = colnum + 1
-
-bestscores = []
-
-#For each file in the list of PDBs
-for posefile in pdblist:
-	#Set that we haven't found this pose yet
-	foundpose = False
-	#Go through each row, keeping track of which number we're on
-	rownum = 0
-	for row in csvscores:
-		#Make sure we are not in a header row
-		if ((len(csvscores[rownum]) <= namecol) or (len(csvscores[rownum]) <= totalcol)):
-			rownum = rownum + 1
-			continue
-		#See if that row contains the score for the current PDB file in the list
-		if (csvscores[rownum][namecol] == posefile.rstrip()):
-			#If so, indicate that we've found the pose
-			foundpose = True
-			#Add the pose to the list
-			bestscores.append((csvscores[rownum][namecol],csvscores[rownum][totalcol]))
-			#And since we've found our target, break out of the for loop
-			break
-		rownum = rownum + 1
-	
-	if (foundpose == False):
-		print "WARNING: The output PDB " + posefile + " given in " + pdbfilelist + " was not found in " + myscores
-		
-#Sort the list on the totalscore element
-bestscores = sorted(bestscores, key=lambda item: item[1])
-#Remove the worst scoring poses until we have the desired number left.
-while (len(bestscores) > int(topnum)):
-	bestscores.pop(0)
-
-#Reverse the list so that we get the answers in order of best to worst energy.
-bestscores.reverse()
-
-outfile = open('bestscores.txt', 'a')
-
-print "From the list of output PDBs given in " + myscores + ", the best " + topnum + " scoring poses are:"
-for idx in range(len(bestscores)):
-	print bestscores[idx][0] + ": " + bestscores[idx][1]
-	outfile.write(bestscores[idx][0] + '.pdb\n')
-
-outfile.close()
\ No newline at end of file
+import argparse
+import sys
+
+from scorefile import ScoreFile, read_names
+
+
+def parse_args(argv):
+    """
+    Parse the command line, accepting both the original positional form and the multi-list form.
+
+    :param argv: The command line arguments, excluding the script name.
+    :return: An argparse namespace with lists, scorefile, topnum and term.
+    """
+
+    parser = argparse.ArgumentParser(description='Report the best scoring poses from one or more lists of poses.')
+    parser.add_argument('lists', nargs='+', help='List file(s) of pose names.  Without -s, this is '
+                        '"pdblist.txt myscores.sc [topnum]".')
+    parser.add_argument('-s', '--scorefile', type=str, help='The Rosetta scorefile.  If given, every positional '
+                        'argument is a list file.')
+    parser.add_argument('-n', '--topnum', type=int, help='The number of top scores to return per list, defaults to 1.')
+    parser.add_argument('-t', '--term', type=str, default='total_score', help='The score term to rank by, '
+                        'defaults to total_score.')
+    args = parser.parse_args(argv)
+
+    # Original form: pdblist.txt myscores.sc [topnum]
+    if args.scorefile is None:
+        if len(args.lists) not in (2, 3):
+            parser.error('Without -s, give exactly: pdblist.txt myscores.sc [topnum]')
+        if len(args.lists) == 3:
+            args.topnum = int(args.lists[2])
+        args.scorefile = args.lists[1]
+        args.lists = args.lists[:1]
+
+    if args.topnum is None:
+        args.topnum = 1
+
+    return args
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    args = parse_args(argv)
+
+    # Read the scorefile once, keeping only the column we rank by.
+    scores = ScoreFile(args.scorefile, columns=[args.term])
+
+    with open('bestscores.txt', 'a') as outfile:
+        for pdbfilelist in args.lists:
+            missing = []
+            bestscores = scores.top_n(read_names(pdbfilelist), args.topnum, term=args.term, missing=missing)
+
+            for posefile in missing:
+                print("WARNING: The output PDB " + posefile + " given in " + pdbfilelist + " was not found in " +
+                      args.scorefile)
+
+            print("From the list of output PDBs given in " + pdbfilelist + ", the best " + str(args.topnum) +
+                  " scoring poses are:")
+            for name, score in bestscores:
+                print(name + ": " + str(score))
+                outfile.write(name + '.pdb\n')
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,144 +1,170 @@
-#!/usr/bin/env python
+#!/usr/bin/env python3
 
 """Make non-backbone heavy atom coordinate constraints from an
-input PDB file. """
+input PDB file.
+
+Usage: constraint.py <input.pdb> [<input2.pdb> ...] width stdev
+Inputs can also be directories (every .pdb file in them) or text files
+listing PDB files, one per line.  Each PDB file gets <name>_sc.cst next
+to it; several files are processed in parallel (--processes).
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+
+import argparse
+import os
+
+import numpy as np
+
+# One record per heavy atom.  Coordinates are kept in a separate (N, 3) array.
+ATOM_DTYPE = np.dtype([('name', 'U4'), ('resn', 'U3'), ('chain', 'U1'), ('resi', 'U4'), ('insert', 'U1')])
+
+BACKBONE = ['C', 'CA', 'N', 'O', 'OXT']
+
+# Atoms whose constraint is made ambiguous with their partner, to accommodate -flipHNQ.
+AMBIGUOUS = {('ASN', 'OD1'): ('OD1', 'ND2'), ('ASN', 'ND2'): ('OD1', 'ND2'),
+             ('GLN', 'OE1'): ('OE1', 'NE2'), ('GLN', 'NE2'): ('OE1', 'NE2'),
+             ('HIS', 'ND1'): ('ND1', 'CD2'), ('HIS', 'CD2'): ('ND1', 'CD2'),
+             ('HIS', 'CE1'): ('CE1', 'NE2'), ('HIS', 'NE2'): ('CE1', 'NE2')}
 
- 
-import os, sys
 
 class Residue:
-    def __init__(self,chain,resi,insert,resn):
-        self.atoms_ = []
-        self.chain_=chain
-        self.resi_=resi
-        self.insert_=insert
-        self.resn_=resn
-        self.pose_=None
-    def compare(self,chain,resi,insert,resn):
-        return (self.chain_==chain and self.resi_==resi and
-                self.insert_==insert and self.resn_==resn)
-
-    def add_atom(self, atom):
-        self.atoms_.append(atom)
-    def pose_num(self, num):
-        self.pose_=num
-
-class Atom:
-    def __init__(self, name, x, y, z):
-        self.name_ =name
-        self.x_=x
-        self.y_=y
-        self.z_=z
-
-def find_CA(residues):
-    for res in residues:
-        for atom in res.atoms_:
-            if atom.name_.strip() == 'CA':
-                return ' '.join((atom.name_, str(res.pose_)))
-    return None
-    
-def main(filename, width, stdev):
-    if filename.endswith('.pdb'):
-        tag = filename[:-4]
-    else:
-        tag = filename
+    """A residue: its identity and the range of its atoms in the atom arrays."""
+    __slots__ = ('chain_', 'resi_', 'insert_', 'resn_', 'start_', 'end_', 'pose_')
+
+    def __init__(self, chain, resi, insert, resn, start):
+        self.chain_ = chain
+        self.resi_ = resi
+        self.insert_ = insert
+        self.resn_ = resn
+        self.start_ = start
+        self.end_ = start
+        self.pose_ = None
+
+    def compare(self, chain, resi, insert, resn):
+        return (self.chain_ == chain and self.resi_ == resi and
+                self.insert_ == insert and self.resn_ == resn)
 
-    chains = {}
+
+def read_pdb(filename):
+    """Read the heavy atoms of a PDB file in one pass.
+
+    Returns the atoms (a structured array of ATOM_DTYPE), their (N, 3)
+    coordinates and the residues, in file order."""
+    records = []
+    coords = []
     residues = []
     curres = None
-    f = open(filename)
-    try:
+    with open(filename) as f:
         for line in f:
             if not (line.startswith('ATOM') or line.startswith('HETATM')):
                 continue
             atom = line[12:16]
-            if atom[0] == 'H' or atom[1]=='H':
-                continue # ignore hydrogens completely
+            if atom[0] == 'H' or atom[1] == 'H':
+                continue  # ignore hydrogens completely
             chain = line[21]
             resi = line[22:26]
             resn = line[17:20].upper()
             insert = line[26]
-            x = line[30:38]
-            y = line[38:46]
-            z = line[46:54]
-            if curres is None or not curres.compare(chain,resi,insert,resn):
-                curres = Residue(chain,resi,insert,resn)
-                chains.setdefault(chain,[]).append(curres)
+            if curres is None or not curres.compare(chain, resi, insert, resn):
+                curres = Residue(chain, resi, insert, resn, len(records))
                 residues.append(curres)
-            curres.add_atom(Atom(atom,x,y,z))
-    finally:
-        f.close()
-
-    #Stupid hack to convert from PDB numbering to pose numbering
-    chns = chains.keys()
-    chns.sort()
-    num = 1
-    for c in chns:
-        for i, r in enumerate(chains[c]):
-            r.pose_num(num)
-            num += 1
-            
-    ref = None
-    f = open(tag+'_sc.cst','w')
-    try:
-        for res in residues:
-            resn = res.resn_
-            pose = str(res.pose_)
-            for atom in res.atoms_:
-                sname = atom.name_.strip()
-                name = atom.name_
-                x = atom.x_
-                y = atom.y_
-                z = atom.z_
-                
-                if sname == 'CA':
-                    ref = ' '.join((name, str(res.pose_)))
-                if sname in ['C','CA','N','O','OXT']:
-                    continue # ignore backbone atoms for constraints
-                    # Note that 'O' also excludes water.
-                if ref is None:
-                    ref = find_CA(residues)
-                    if ref is None:
-                        raise ValueError("Pose must have CA *somwehere*!")
-                
-                if resn == 'ASN' and sname in ['OD1','ND2']: # Accomodate -flipHNQ
-                    f.write("AmbiguousConstraint\n")
-                    f.write(' '.join(["CoordinateConstraint",'OD1',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write(' '.join(["CoordinateConstraint",'ND2',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write("END_AMBIGUOUS\n")
-                elif resn == 'GLN' and sname in ['OE1','NE2']: # Accomodate -flipHNQ
-                    f.write("AmbiguousConstraint\n")
-                    f.write(' '.join(["CoordinateConstraint",'OE1',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write(' '.join(["CoordinateConstraint",'NE2',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write("END_AMBIGUOUS\n")
-                elif resn == 'HIS' and sname in ['ND1','CD2']: # Accomodate -flipHNQ
-                    f.write("AmbiguousConstraint\n")
-                    f.write(' '.join(["CoordinateConstraint",'ND1',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write(' '.join(["CoordinateConstraint",'CD2',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write("END_AMBIGUOUS\n")
-                elif resn == 'HIS' and sname in ['CE1','NE2']: # Accomodate -flipHNQ
-                    f.write("AmbiguousConstraint\n")
-                    f.write(' '.join(["CoordinateConstraint",'CE1',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write(' '.join(["CoordinateConstraint",'NE2',pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-                    f.write("END_AMBIGUOUS\n")
-                else:
-                    f.write(' '.join(["CoordinateConstraint",name,pose,ref,x,y,z,
-                                  "BOUNDED","0",width,stdev,"0.5","tag"])+'\n')
-    finally:
-        f.close()
-        
-            
+            records.append((atom, resn, chain, resi, insert))
+            coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+            curres.end_ = len(records)
+    atoms = np.array(records, dtype=ATOM_DTYPE)
+    return atoms, np.array(coords, dtype=np.float64).reshape(-1, 3), residues
+
+
+def make_constraints(filename, width, stdev):
+    """Build the constraint file text for one PDB file."""
+    atoms, coords, residues = read_pdb(filename)
+
+    # Stupid hack to convert from PDB numbering to pose numbering:
+    # residues are numbered chain by chain, with the chains in sorted order.
+    # (sorted() is stable, so residues keep their file order within a chain)
+    for num, res in enumerate(sorted(residues, key=lambda res: res.chain_), 1):
+        res.pose_ = num
+    pose = np.empty(len(atoms), dtype=np.int64)
+    for res in residues:
+        pose[res.start_:res.end_] = res.pose_
+
+    # Each atom is constrained relative to the last CA before it, or
+    # (before the first CA) to the first CA of the file.
+    snames = np.char.strip(atoms['name'])
+    isca = snames == 'CA'
+    lastca = np.maximum.accumulate(np.where(isca, np.arange(len(atoms)), -1)) if len(atoms) else np.array([], dtype=int)
+    sidechain = ~np.isin(snames, BACKBONE)  # Note that 'O' also excludes water.
+    if sidechain.any() and (lastca[sidechain] == -1).any():
+        if not isca.any():
+            raise ValueError("Pose must have CA *somwehere*!")
+        lastca = np.where(lastca == -1, np.argmax(isca), lastca)
+
+    tail = ' '.join(["BOUNDED", "0", width, stdev, "0.5", "tag"]) + '\n'
+    names = atoms['name'].tolist()
+    resns = atoms['resn'].tolist()
+    snames = snames.tolist()
+    pose = pose.tolist()
+    xyz = ['%8.3f %8.3f %8.3f' % tuple(row) for row in coords.tolist()]
+    lines = []
+    for idx in np.nonzero(sidechain)[0].tolist():
+        ca = lastca[idx]
+        body = ' '.join((str(pose[idx]), names[ca], str(pose[ca]), xyz[idx], tail))
+        pair = AMBIGUOUS.get((resns[idx], snames[idx]))
+        if pair is None:
+            lines.append("CoordinateConstraint " + names[idx] + ' ' + body)
+        else:
+            lines.append("AmbiguousConstraint\n")
+            for partner in pair:
+                lines.append("CoordinateConstraint " + partner + ' ' + body)
+            lines.append("END_AMBIGUOUS\n")
+    return ''.join(lines)
+
+
+def main(filename, width, stdev):
+    if filename.endswith('.pdb'):
+        tag = filename[:-4]
+    else:
+        tag = filename
+
+    text = make_constraints(filename, width, stdev)
+    with open(tag + '_sc.cst', 'w') as f:
+        f.write(text)
+    return tag + '_sc.cst'
+
+
+def _main_job(args):
+    return main(*args)
+
+
+def find_pdbs(inputs):
+    """Expand directories and list files into PDB file names."""
+    pdbs = []
+    for name in inputs:
+        if os.path.isdir(name):
+            pdbs.extend(os.path.join(name, pdb) for pdb in sorted(os.listdir(name)) if pdb.endswith('.pdb'))
+        elif name.endswith('.pdb'):
+            pdbs.append(name)
+        else:
+            with open(name) as listfile:
+                pdbs.extend(line.strip() for line in listfile if line.strip())
+    return pdbs
+
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print "Usage: sidechain_cst.py <input.pdb> width stdev"
+    parser = argparse.ArgumentParser(prog='sidechain_cst.py', description='Make non-backbone heavy atom coordinate '
+                                     'constraints from PDB files.')
+    parser.add_argument('inputs', nargs='+', help='PDB files, directories of PDB files, or files listing PDB files.')
+    parser.add_argument('width', type=str)
+    parser.add_argument('stdev', type=str)
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Number of PDB files processed '
+                        'at once, defaults to the number of CPUs.')
+    args = parser.parse_args()
+
+    jobs = [(pdb, args.width, args.stdev) for pdb in find_pdbs(args.inputs)]
+    if args.processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=args.processes) as pool:
+            list(pool.map(_main_job, jobs))
     else:
-        main(sys.argv[1],sys.argv[2],sys.argv[3])
+        for job in jobs:
+            _main_job(job)
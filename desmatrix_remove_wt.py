@@ -1,110 +1,151 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 ##Usage: desmatrix_remove_wt.py wtseq.txt matrix.txt des_matrix.csv
+##       desmatrix_remove_wt.py wtseq.txt des_matrix.csv --sequences seqs1.txt [seqs2.txt ...] [--counts design.npz]
 ##wtseq.txt is a file with the native sequence as a single line of one-letter AA codes.
 ##matrix.txt is the design matrix file generated by ConvertSeqTransfac.py
 ##The script re-generates the matrix.txt file, discarding residues that all have the same identity, and that identity matches the WT.
 ##The file is written out in CSV format to des_matrix.csv
+##
+##With --sequences, the matrix is built straight from the designed sequences (or .npz counts) in memory, without writing
+##a .transfac file first.  With --counts, the counts of earlier batches are read from (and the new total saved back to)
+##that file, so each new batch of sequences is only read once.
+##Fixed WT positions are found by comparing frequencies as numbers, so any formatting of the matrix file works.
 
-import os, sys, csv
-
-wtseqname = sys.argv[1]
-wtseqfile = open(wtseqname, 'r')
-wtseq = wtseqfile.readlines()
-inmatrixname = sys.argv[2]
-matrixfile = open(inmatrixname, 'r')
-matrix = matrixfile.readlines()
-outname = sys.argv[3]
-outfile = open(outname, 'a')
-
-#Read in the native sequence to a string, wt.
-wt = wtseq[0]
-
-#The second line should be read in as the header row.
-headers = matrix[1].split()
-
-#Starting at the third line, read each line in, convert to a list, and place in a list of lists.  The first column is the position, and the next 20 correspond to each AA.
-pos = []
-linenum = 0
-
-for line in matrix:
-	if ( linenum > 1 ):
-		line = line.split()
-		pos.append(line)
-	linenum = linenum + 1
-	
-#Each item in pos is an amino acid position.
-
-#Create an empty list for output.
-outputlist = []
-
-#Loop over each item in pos.
-for posidx,aalist in enumerate(pos):
-	#Assume that the position is designed.
-	designedpos = True
-	#Check if any of the list items are '1.0000'
-	for seqidx,seqpct in enumerate(aalist):
-		if ( seqpct == '1.0000' ):
-			#If so, check if it matches the WT sequence
-			if ( wt[posidx] == headers[seqidx] ):
-				#If so, we have 100% WT.  Indicate that this position has not been designed, and skip to the next position.
-				designedpos = False
-				break
-	#We have checked each AA in the list.  If we did not encounter a 1.000 at the WT position, write the line the an output list.
-	if ( designedpos ):
-		aalist.append(wt[posidx])	#Add the WT AA identity to the end of the line before writing out.
-		outputlist.append(aalist)
-
-headers.append('wtid')
-outfile.write(','.join(map(str,headers)))
-outfile.write('\n')		
-for position in outputlist:
-	outfile.write(','.join(map(str,position)))
-	outfile.write('\n')
-
-'''	
-#Go through the header row and determine what column total_score and description are in.
-colnum = 0
-for col in csvscores[1]:
-	if (col == 'total_score'):
-		totalcol = colnum
-	if (col == 'description'):
-		namecol = colnum
-	colnum = colnum + 1
-
-bestscore = 999999999999.9
-bestpose = ''
-	
-#For each file in the list of PDBs
-for posefile in pdblist:
-	#Set that we haven't found this pose yet
-	foundpose = False
-	#Go through each row, keeping track of which number we're on
-	rownum = 0
-	for row in csvscores:
-		#Make sure we are not in a header row
-		if ((len(csvscores[rownum]) <= namecol) or (len(csvscores[rownum]) <= totalcol)):
-			rownum = rownum + 1
-			continue
-		#See if that row contains the score for the current PDB file in the list
-		if (csvscores[rownum][namecol] == posefile.rstrip()):
-			#If so, indicate that we've found the pose
-			foundpose = True
-			#If so, check if that pose has a better score than the current pose
-			if (float(csvscores[rownum][totalcol]) < float(bestscore)):
-				#If it has a better score, replace bestscore with total_score, and replace bestpose with description.
-				bestscore = csvscores[rownum][totalcol]
-				bestpose = csvscores[rownum][namecol]
-			#And since we've found our target, break out of the for loop
-			break
-		rownum = rownum + 1
-	
-	if (foundpose == False):
-		print "WARNING: The output PDB " + posefile + " given in " + pdbfilelist + " was not found in " + myscores
-
-print "From the list of output PDBs given in " + myscores + ", the best scoring pose is " + bestpose
-print "It has a total_score of " + str(bestscore)
-
-outfile = open('bestscores.txt', 'a')
-outfile.write(bestpose + '.pdb\n')
-'''
\ No newline at end of file
+from typing import List, Tuple
+
+import argparse
+import sys
+
+import numpy as np
+
+from ConvertSeqTransfac import PositionCounts, TransfacError
+
+# How far from 1 a WT frequency read from a matrix file can be and still count as fixed: half of the last digit
+# ConvertSeqTransfac.py writes.
+MATRIX_TOLERANCE = 5e-5
+
+
+def read_wt(filename: str) -> str:
+    """
+    Read the native sequence: the first line of a file.
+    """
+
+    with open(filename, 'r') as wtfile:
+        return wtfile.readline().strip()
+
+
+def read_matrix(filename: str) -> Tuple[List[str], List[List[str]], np.ndarray]:
+    """
+    Read a TRANSFAC matrix file.
+
+    :param filename: The matrix file.
+    :return: A tuple of (the header row, the rows of every position as strings, the (positions x letters)
+    frequencies).
+    """
+
+    with open(filename, 'r') as matrixfile:
+        lines = matrixfile.readlines()
+    #The second line is the header row, then each line is a position followed by one value per AA.
+    headers = lines[1].split()
+    rows = [line.split() for line in lines[2:] if line.strip()]
+    freqs = np.array([[float(value) for value in row[1:]] for row in rows], dtype=np.float64)
+    return headers, rows, freqs.reshape(len(rows), len(headers) - 1)
+
+
+def fixed_wt(letters: List[str], freqs: np.ndarray, wt: str, tolerance: float = 0.0) -> np.ndarray:
+    """
+    Find the positions that weren't designed: every sequence has the WT identity there.
+
+    :param letters: The letters of the frequency columns.
+    :param freqs: The (positions x letters) frequencies.  Position i is WT residue wt[i].
+    :param wt: The native sequence.
+    :param tolerance: How far below 1 the WT frequency can be.
+    :return: A boolean array, True at fixed WT positions.
+    """
+
+    if len(wt) < len(freqs):
+        raise TransfacError("The WT sequence has {wt} residues, but the matrix has {positions} positions.".format(
+            wt=len(wt), positions=len(freqs)))
+    columns = {letter: col for col, letter in enumerate(letters)}
+    wtcols = np.array([columns.get(aa, -1) for aa in wt[:len(freqs)]], dtype=np.intp)
+    known = wtcols >= 0
+    wtfreqs = np.where(known, freqs[np.arange(len(freqs)), np.where(known, wtcols, 0)], 0.0)
+    return known & (wtfreqs >= 1.0 - tolerance)
+
+
+def write_design_matrix(filename: str, headers: List[str], rows: List[List[str]], wt: str, fixed: np.ndarray):
+    """
+    Append the designed positions to a CSV design matrix, each with its WT identity in a final wtid column.
+
+    :param filename: The CSV file.
+    :param headers: The header row.
+    :param rows: The rows of every position, as strings.
+    :param wt: The native sequence.
+    :param fixed: The fixed WT positions, which are left out.
+    """
+
+    lines = [','.join(headers + ['wtid']) + '\n']
+    for posidx, row in enumerate(rows):
+        if not fixed[posidx]:
+            lines.append(','.join(row + [wt[posidx]]) + '\n')
+    with open(filename, 'a') as outfile:
+        outfile.write(''.join(lines))
+
+
+def design_matrix(counts: PositionCounts, wt: str, outname: str, offset: int = 1):
+    """
+    Write the CSV design matrix of counted sequences, leaving out the fixed WT positions.
+
+    :param counts: The counted sequences.
+    :param wt: The native sequence.
+    :param outname: The CSV file, appended to.
+    :param offset: The number of the first position.
+    """
+
+    letters, freqs = counts.frequencies()
+    rows = [[str(pos)] + ["%0.4f" % val for val in row] for pos, row in enumerate(freqs.tolist(), offset)]
+    write_design_matrix(outname, ['PO'] + list(letters), rows, wt, fixed_wt(list(letters), freqs, wt))
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Write the designed positions of a design matrix as CSV, with '
+                                     'their WT identities.')
+    parser.add_argument('wtseq', type=str, help='A file with the native sequence as its first line.')
+    parser.add_argument('files', nargs='+', help='matrix.txt des_matrix.csv, or only des_matrix.csv with '
+                        '--sequences.')
+    parser.add_argument('--sequences', nargs='+', default=[], help='Build the matrix from these sequence files '
+                        '(or .npz counts saved by ConvertSeqTransfac.py --counts).')
+    parser.add_argument('--counts', type=str, help='With --sequences, the counts of earlier batches, updated with '
+                        'the new sequences.')
+    parser.add_argument('--weighted', action='store_true', help='Each line of the sequence files is a sequence '
+                        'followed by its weight.')
+    parser.add_argument('--offset', type=int, default=1, help='The number of the first position, with --sequences.')
+    args = parser.parse_args(argv)
+
+    try:
+        wt = read_wt(args.wtseq)
+        if args.sequences or args.counts is not None:
+            if len(args.files) != 1:
+                parser.error('With --sequences, give only the output CSV.')
+            counts = PositionCounts.load(args.counts) if args.counts is not None else PositionCounts()
+            for filename in args.sequences:
+                counts.add_file(filename, args.weighted)
+            if args.counts is not None:
+                counts.save(args.counts)
+            design_matrix(counts, wt, args.files[0], args.offset)
+        else:
+            if len(args.files) != 2:
+                parser.error('Give the matrix file and the output CSV.')
+            headers, rows, freqs = read_matrix(args.files[0])
+            write_design_matrix(args.files[1], headers, rows, wt, fixed_wt(headers[1:], freqs, wt, MATRIX_TOLERANCE))
+    except TransfacError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,35 +1,137 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
-##Usage: ext_cd-hit <clusterfile>
+##Usage: ext_cd-hit.py <clusterfile>
+##   or: ext_cd-hit.py <clusterfile> -s myscores.sc [-n topnum] [--bestscores bestscores.txt] [--centers clustcenters.txt]
 ##<clusterfile> is the CD-HIT output cluster file.
 ##It should list clusters starting with >Cluster #, followed by a list (one per line) of all PDB files in the cluster.
-##This script will extract each PDB file name (w/o .pdb extension) into a text file for each cluster.
-
-import os, sys, string
-from string import whitespace
-
-clusterfilename = sys.argv[1]
-clusterfile = open(clusterfilename, 'r')
-
-#Set a variable cur_cluster to be the current cluster.
-cur_cluster = ''
-
-#For each line in the cluster file
-for line in clusterfile:
-	#Check if the current line is the start of a new cluster.  If so, set the new cur_cluster and skip to the next line.
-	if (line[0] == '>'):
-		#Close any open file.
-		try:
-			writefile
-		except:
-			print
-		else:
-			writefile.close()
-			
-		#Generate the name of the text file, and then open it as a writeable file.
-		cur_cluster = line.translate(None, whitespace).replace('>','') + '.txt'
-		writefile = open(cur_cluster, 'w')
-		continue
-	
-	#For each line, take out the PDB filename (excluding .pdb) and write it to the current cluster file.
-	writefile.write((line.split('>')[1].split('.pdb')[0]) + '\n')
\ No newline at end of file
+##The first form extracts each PDB file name (w/o .pdb extension) into a text file for each cluster.
+##The second form reads the scorefile once and streams the cluster file, writing no files per cluster.  For each cluster
+##it prints the representative (the CD-HIT * line), the size and the topnum best members by score, one line per member:
+##cluster, size, representative, rank, member, score.
+##--bestscores appends the best members (as best_score.py does) and --centers the representatives, one bare name (without .pdb) per line.
+
+from typing import Iterator, List, Tuple
+
+import argparse
+import sys
+
+from scorefile import PDB_EXTENSIONS, ScoreFile, ScoreFileError
+
+# The columns of the table written in the second form.
+CLUSTER_HEADER = ['cluster', 'size', 'representative', 'rank', 'member', 'score']
+
+
+def member_name(line: str) -> str:
+    """
+    Take the PDB file name (w/o .pdb extension) out of a cluster member line, e.g. "0	120aa, >name.pdb... *".
+
+    :param line: The member line.
+    :return: The pose name.
+    """
+
+    name = line.split('>', 1)[1].split('...', 1)[0].strip()
+    for ext in PDB_EXTENSIONS:
+        if ext in name:
+            return name.split(ext, 1)[0]
+    return name
+
+
+def iter_clusters(filename: str) -> Iterator[Tuple[str, str, List[str]]]:
+    """
+    Stream a CD-HIT cluster file, one cluster at a time.
+
+    :param filename: The .clstr file.
+    :return: An iterator over (cluster name, representative, members) tuples.  The name has its whitespace removed
+    (e.g. Cluster12); the representative is '' if no member line is marked with *.
+    """
+
+    cluster = None
+    representative = ''
+    members = []
+    with open(filename, 'r') as clusterfile:
+        for line in clusterfile:
+            if not line.strip():
+                continue
+            if line[0] == '>':
+                if cluster is not None:
+                    yield cluster, representative, members
+                cluster = ''.join(line[1:].split())
+                representative = ''
+                members = []
+                continue
+            name = member_name(line)
+            members.append(name)
+            if line.rstrip().endswith('*'):
+                representative = name
+    if cluster is not None:
+        yield cluster, representative, members
+
+
+def split_clusters(filename: str):
+    """
+    Write the members of each cluster to <cluster name>.txt.
+
+    :param filename: The .clstr file.
+    """
+
+    for cluster, _, members in iter_clusters(filename):
+        with open(cluster + '.txt', 'w') as writefile:
+            writefile.write(''.join(name + '\n' for name in members))
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Split a CD-HIT cluster file, or report the representative, size and '
+                                     'best members of every cluster.')
+    parser.add_argument('clusterfile', type=str, help='The CD-HIT .clstr file.')
+    parser.add_argument('-s', '--scorefile', type=str, help='The Rosetta scorefile.  If given, no cluster files are '
+                        'written; the best members of every cluster are printed instead.')
+    parser.add_argument('-n', '--topnum', type=int, default=1, help='The number of best members per cluster, defaults '
+                        'to 1.')
+    parser.add_argument('-t', '--term', type=str, default='total_score', help='The score term to rank by, defaults to '
+                        'total_score.')
+    parser.add_argument('--output', type=str, default='-', help='The output table, defaults to stdout.')
+    parser.add_argument('--bestscores', type=str, help='Append the best members to this file.')
+    parser.add_argument('--centers', type=str, help='Append the cluster representatives to this file.')
+    args = parser.parse_args(argv)
+
+    if args.scorefile is None:
+        split_clusters(args.clusterfile)
+        return
+
+    try:
+        scores = ScoreFile(args.scorefile, columns=[args.term])
+    except ScoreFileError as err:
+        sys.exit(str(err))
+
+    outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+    bestfile = open(args.bestscores, 'a') if args.bestscores is not None else None
+    centerfile = open(args.centers, 'a') if args.centers is not None else None
+    missing = []
+    try:
+        outfile.write('\t'.join(CLUSTER_HEADER) + '\n')
+        for cluster, representative, members in iter_clusters(args.clusterfile):
+            best = scores.top_n(members, args.topnum, term=args.term, missing=missing)
+            outfile.write(''.join('\t'.join([cluster, str(len(members)), representative, str(rank), name, str(score)])
+                                  + '\n' for rank, (name, score) in enumerate(best, 1)))
+            if not best:
+                outfile.write('\t'.join([cluster, str(len(members)), representative, 'NA', 'NA', 'NA']) + '\n')
+            if bestfile is not None:
+                bestfile.write(''.join(name + '.pdb\n' for name, _ in best))
+            if centerfile is not None and representative:
+                centerfile.write(representative + '\n')
+    finally:
+        for afile in [outfile, bestfile, centerfile]:
+            if afile is not None and afile is not sys.stdout:
+                afile.close()
+
+    if missing:
+        print("WARNING: {num} cluster members were not found in {name}, e.g. {example}".format(
+            num=len(missing), name=args.scorefile, example=missing[0]), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+generate_constraints.py generates enzdes style constraints given a constraint specification file and PDB files.  It
+is a port of generate_constraints.pl that reads the specification once and handles any number of PDB files per run.
+
+The specification file has two lines per constraint, one for each residue: chain, residue number and three atom names.
+For every PDB file, each atom line is indexed once by (chain, residue number, atom name), and the distance, angles and
+torsions of all the constraints are computed together with NumPy.  The output is byte-identical to
+generate_constraints.pl, including its quirks (the 4-character residue3 field, the 3.14159 used for torsions, and an
+atom that isn't found keeping its position from the previous constraint).
+
+Requires numpy.
+
+Usage: generate_constraints.py cst_spec.txt 1ABC.pdb                   (to stdout, like the perl script)
+       generate_constraints.py cst_spec.txt *.pdb --outdir csts        (csts/<name>.cst for each PDB file)
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import argparse
+import math
+import os
+import re
+import sys
+
+import numpy as np
+
+# perl's numeric conversion of a string: leading whitespace, then the longest prefix that is a number.
+PERL_NUMBER = re.compile(r'\s*([+-]?(?:\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?))')
+
+# The PDB lines of a constraint, in the order generate_constraints.pl names them (pdbLineOne to pdbLineSix).
+SLOTS = 6
+
+
+class ConstraintError(Exception):
+    """
+    Exception class for specification files or PDB files that constraints can't be generated from.
+    """
+
+
+def perl_num(text: str) -> float:
+    """
+    Convert a string to a number the way perl does, so fields compare and parse exactly as in the perl script.
+
+    :param text: The string.
+    :return: The number, 0 if the string doesn't start with one.
+    """
+
+    match = PERL_NUMBER.match(text)
+    return float(match.group(1)) if match else 0.0
+
+
+def perl_split(text: str) -> List[str]:
+    """
+    Split a string like perl's split /\\s+/: a leading empty field is kept, trailing empty fields are dropped.
+
+    :param text: The string.
+    :return: The fields.
+    """
+
+    fields = re.split(r'\s+', text)
+    while fields and fields[-1] == '':
+        fields.pop()
+    return fields
+
+
+def read_spec(filename: str) -> List[Tuple[List[str], List[str]]]:
+    """
+    Read a constraint specification file.
+
+    :param filename: The specification file.
+    :return: One (first residue fields, second residue fields) tuple per constraint.  Each has the chain, residue
+    number and three atom names.
+    """
+
+    with open(filename, 'r') as specfile:
+        lines = specfile.read().split('\n')
+    if lines and lines[-1] == '':
+        lines.pop()
+    if len(lines) % 2 != 0:
+        raise ConstraintError("Error: Uneven number of constraint lines.")
+
+    constraints = []
+    for idx in range(0, len(lines), 2):
+        first = (perl_split(lines[idx]) + [''] * 5)[:5]
+        second = (perl_split(lines[idx + 1]) + [''] * 5)[:5]
+        constraints.append((first, second))
+    return constraints
+
+
+def index_pdb(filename: str) -> Dict[Tuple[str, float, str], str]:
+    """
+    Index the atom lines of a PDB file by (chain, residue number, atom name).  When several lines share a key, the
+    last one is kept, as in the perl script.
+
+    :param filename: The PDB file.
+    :return: A dictionary of key to PDB line.
+    """
+
+    index = {}
+    atomtype = ''
+    with open(filename, 'r') as pdbfile:
+        for line in pdbfile:
+            line = line[:-1] if line.endswith('\n') else line
+            if not (line.startswith('ATOM') or line.startswith('HETATM')):
+                continue
+            fields = perl_split(line[12:16])
+            # An all-blank atom name leaves the previous one in place.
+            if len(fields) == 1:
+                atomtype = fields[0]
+            elif len(fields) > 1:
+                atomtype = fields[1]
+            index[(line[21:22], perl_num(line[22:26]), atomtype)] = line
+    return index
+
+
+def _coords(line: str) -> Tuple[float, float, float]:
+    return perl_num(line[30:38]), perl_num(line[38:46]), perl_num(line[46:54])
+
+
+def _acos(values: np.ndarray) -> List[float]:
+    """
+    Arc cosines as Math::Trig computes them for real arguments, atan2(sqrt(1 - z*z), z).  Computed one value at a time
+    with the C library, so the results match perl to the last bit.
+
+    :param values: The cosines.
+    :return: The angles, in radians.
+    """
+
+    return [math.atan2(math.sqrt(max(0.0, 1 - z * z)), z) for z in values.tolist()]
+
+
+def _check(denominator: np.ndarray, pdbname: str):
+    if (denominator == 0).any():
+        raise ConstraintError("Illegal division by zero computing the constraints of {name} (are all of the atoms "
+                              "in the specification present?).".format(name=pdbname))
+
+
+def distances(a: np.ndarray, b: np.ndarray) -> List[str]:
+    """
+    :return: The distances between the points of a and b, formatted as getDistance.
+    """
+
+    dist = np.sqrt((a[:, 0] - b[:, 0]) ** 2 + (a[:, 1] - b[:, 1]) ** 2 + (a[:, 2] - b[:, 2]) ** 2)
+    return ['%4.2f' % value for value in dist.tolist()]
+
+
+def angles(a: np.ndarray, b: np.ndarray, c: np.ndarray, pdbname: str) -> List[str]:
+    """
+    :return: The angles a-b-c in degrees, formatted as get_angle.
+    """
+
+    ba = a - b
+    bc = c - b
+    lenba = np.sqrt(ba[:, 0] ** 2 + ba[:, 1] ** 2 + ba[:, 2] ** 2)
+    lenbc = np.sqrt(bc[:, 0] ** 2 + bc[:, 1] ** 2 + bc[:, 2] ** 2)
+    _check(lenba, pdbname)
+    _check(lenbc, pdbname)
+    uba = ba / lenba[:, np.newaxis]
+    ubc = bc / lenbc[:, np.newaxis]
+    cos = uba[:, 0] * ubc[:, 0] + uba[:, 1] * ubc[:, 1] + uba[:, 2] * ubc[:, 2]
+    return ['%4.3f' % (value * 180.0 / math.pi) for value in _acos(cos)]
+
+
+def torsions(a: np.ndarray, b: np.ndarray, c: np.ndarray, d: np.ndarray, pdbname: str) -> List[str]:
+    """
+    :return: The torsions a-b-c-d in degrees, formatted as getTorsionABCD.
+    """
+
+    ba = b - a
+    bc = b - c
+    cb = -1 * bc
+    cd = c - d
+    p = np.stack([ba[:, 1] * bc[:, 2] - ba[:, 2] * bc[:, 1], ba[:, 2] * bc[:, 0] - ba[:, 0] * bc[:, 2],
+                  ba[:, 0] * bc[:, 1] - ba[:, 1] * bc[:, 0]], axis=1)
+    q = np.stack([cb[:, 1] * cd[:, 2] - cb[:, 2] * cd[:, 1], cb[:, 2] * cd[:, 0] - cb[:, 0] * cd[:, 2],
+                  cb[:, 0] * cd[:, 1] - cb[:, 1] * cd[:, 0]], axis=1)
+    lenq = np.sqrt(q[:, 0] * q[:, 0] + q[:, 1] * q[:, 1] + q[:, 2] * q[:, 2])
+    lenp = np.sqrt(p[:, 0] * p[:, 0] + p[:, 1] * p[:, 1] + p[:, 2] * p[:, 2])
+    signden = np.sqrt(ba[:, 0] * ba[:, 0] + ba[:, 1] * ba[:, 1] + ba[:, 2] * ba[:, 2]) * lenq
+    _check(signden, pdbname)
+    _check(lenp * lenq, pdbname)
+    sign = np.where((ba[:, 0] * q[:, 0] + ba[:, 1] * q[:, 1] + ba[:, 2] * q[:, 2]) / signden >= 0, -1.0, 1.0)
+    cos = (p[:, 0] * q[:, 0] + p[:, 1] * q[:, 1] + p[:, 2] * q[:, 2]) / (lenp * lenq)
+    return ['%4.2f' % (value * (180 / 3.14159) * angle) for value, angle in zip(sign.tolist(), _acos(cos))]
+
+
+def generate(constraints: List[Tuple[List[str], List[str]]], pdbname: str) -> str:
+    """
+    Generate the enzdes constraint blocks for one PDB file.
+
+    :param constraints: The constraints, as read by read_spec.
+    :param pdbname: The PDB file.
+    :return: The constraint file text.
+    """
+
+    index = index_pdb(pdbname)
+
+    # As in the perl script, an atom that isn't found keeps the line (and residue type) of the previous constraint.
+    slots = [''] * SLOTS
+    restype = ['', '']
+    lines = []
+    restypes = []
+    for first, second in constraints:
+        for residx, (chain, resnum, *names) in enumerate((first, second)):
+            for atomidx, name in enumerate(names):
+                line = index.get((chain, perl_num(resnum), name))
+                if line is None:
+                    print("WARNING: {name} of {chain} {resnum} was not found in {pdb}.".format(
+                        name=name, chain=chain, resnum=resnum, pdb=pdbname), file=sys.stderr)
+                    continue
+                slots[residx * 3 + atomidx] = line
+                if atomidx == 0:
+                    restype[residx] = line[17:21]
+        lines.append(list(slots))
+        restypes.append(tuple(restype))
+
+    if not lines:
+        return ''
+    xyz = np.array([[_coords(line) for line in row] for row in lines], dtype=np.float64)
+    one, two, three, four, five, six = (xyz[:, slot] for slot in range(SLOTS))
+
+    distance_ab = distances(one, four)
+    angle_a = angles(two, one, four, pdbname)
+    angle_b = angles(one, four, five, pdbname)
+    torsion_a = torsions(three, two, one, four, pdbname)
+    torsion_ab = torsions(two, one, four, five, pdbname)
+    torsion_b = torsions(one, four, five, six, pdbname)
+
+    out = []
+    for idx, (first, second) in enumerate(constraints):
+        out.append("CST::BEGIN\n")
+        out.append(" TEMPLATE:: ATOM_MAP: 1 atom_name: " + ' '.join(first[2:5]) + "\n")
+        out.append(" TEMPLATE:: ATOM_MAP: 1 residue3: " + restypes[idx][0] + "\n\n")
+        out.append(" TEMPLATE:: ATOM_MAP: 2 atom_name: " + ' '.join(second[2:5]) + "\n")
+        out.append(" TEMPLATE:: ATOM_MAP: 2 residue3: " + restypes[idx][1] + "\n\n")
+        out.append(" CONSTRAINT:: distanceAB: " + distance_ab[idx] + " 0.2 100 0 0\n")
+        out.append(" CONSTRAINT:: angle_A: " + angle_a[idx] + " 10.0 10.0 360.0 1\n")
+        out.append(" CONSTRAINT:: angle_B: " + angle_b[idx] + " 10.0 10.0 360.0 1\n")
+        out.append(" CONSTRAINT:: torsion_A: " + torsion_a[idx] + " 20.0 10.0 360.0 1\n")
+        out.append(" CONSTRAINT:: torsion_AB: " + torsion_ab[idx] + " 20.0 10.0 360.0 1\n")
+        out.append(" CONSTRAINT:: torsion_B: " + torsion_b[idx] + " 20.0 10.0 360.0 1\n\n")
+        out.append(" ALGORITHM_INFO:: match_positions\n")
+        out.append(" ALGORITHM_INFO::END\n")
+        out.append("CST::END\n")
+    return ''.join(out)
+
+
+def output_name(pdbname: str, outdir: Optional[str], suffix: str) -> str:
+    """
+    :return: The constraint file for a PDB file: <outdir>/<name><suffix>, or next to the PDB file.
+    """
+
+    name = os.path.basename(pdbname)
+    for ext in ['.gz', '.pdb']:
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    return os.path.join(outdir if outdir is not None else os.path.dirname(pdbname), name + suffix)
+
+
+def _generate_job(args: Tuple[List[Tuple[List[str], List[str]]], str, Optional[str], str]) -> str:
+    """
+    Generate and write the constraints of one PDB file in a worker process.
+
+    :param args: A tuple of (constraints, pdbname, outdir, suffix).
+    :return: The constraint file written.
+    """
+
+    constraints, pdbname, outdir, suffix = args
+    text = generate(constraints, pdbname)
+    filename = output_name(pdbname, outdir, suffix)
+    with open(filename, 'w') as cstfile:
+        cstfile.write(text)
+    return filename
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Generate enzdes style constraints from a constraint specification '
+                                     'file and PDB files.')
+    parser.add_argument('spec', type=str, help='The constraint specification file: two lines per constraint, each '
+                        'with chain, residue number and three atom names.')
+    parser.add_argument('pdbs', nargs='+', help='The PDB files.')
+    parser.add_argument('--outdir', type=str, help='Write <outdir>/<name>.cst for each PDB file.  With a single PDB '
+                        'file and no --outdir, the constraints are printed, like generate_constraints.pl.')
+    parser.add_argument('--suffix', type=str, default='.cst', help='Suffix of the constraint files, defaults to .cst.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of PDB files processed at once.')
+    args = parser.parse_args(argv)
+
+    try:
+        constraints = read_spec(args.spec)
+    except ConstraintError as err:
+        # generate_constraints.pl prints this to stdout and exits successfully.
+        print(str(err))
+        return
+
+    try:
+        if len(args.pdbs) == 1 and args.outdir is None:
+            sys.stdout.write(generate(constraints, args.pdbs[0]))
+            return
+        if args.outdir is not None:
+            os.makedirs(args.outdir, exist_ok=True)
+        jobs = [(constraints, pdbname, args.outdir, args.suffix) for pdbname in args.pdbs]
+        if args.processes > 1:
+            with ProcessPoolExecutor(max_workers=args.processes) as pool:
+                list(pool.map(_generate_job, jobs))
+        else:
+            for job in jobs:
+                _generate_job(job)
+    except ConstraintError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
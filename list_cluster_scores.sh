@@ -1,7 +1,4 @@
 #!/bin/bash
 
-for clusterfile in Cluster*.txt; do
-	best_score.py $clusterfile ../../score_mg.sc
-	done
-	
-grep '*' 1452821557.fas.1.clstr | sed -e 's/.*>//g' | sed -e 's/.pdb.*//g' >> clustcenters.txt
\ No newline at end of file
+#Read the merged scorefile once, stream the cluster file, and report the representative, size and best pose of every cluster.
+ext_cd-hit.py 1452821557.fas.1.clstr -s ../../score_mg.sc -n 1 --bestscores bestscores.txt --centers clustcenters.txt > cluster_scores.tsv
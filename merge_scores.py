@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+merge_scores.py merges the per-job scorefiles in */ into one scorefile, like merge_score.sh and merge_vistsv.sh, and
+writes a columnar binary cache of the result next to it (see scorecache.py).
+
+The per-job scorefiles are read concurrently.  Files written with different score terms are reconciled into the union
+of their columns (missing values are written as NA), and a description that appears more than once (e.g. from a
+requeued job) is only kept once, from the most recently modified scorefile.
+
+Run it again after more jobs have finished to update the merged file: only scorefiles that are new or changed since
+the last merge are read.
+
+Usage: merge_scores.py                    (*/*.sc -> score_mg.sc)
+       merge_scores.py --format tsv       (*/*_scores.tsv -> score_mg.tsv)
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Set, Tuple
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+
+from scorefile import file_stamp, iter_rows, to_float
+
+# Default source pattern and output file for each supported format.
+FORMATS = {'sc': ('*/*.sc', 'score_mg.sc'),
+           'tsv': ('*/*_scores.tsv', 'score_mg.tsv')}
+
+# Value written for a score term that a scorefile doesn't have.
+MISSING = 'NA'
+
+# Number of rows buffered before they are appended to the columnar cache.
+CACHE_CHUNK = 100000
+
+
+class MergeError(Exception):
+    """
+    Exception class for scorefiles that can't be merged.
+    """
+
+
+class SourceTable:
+    """
+    The parsed contents of one per-job scorefile.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Read a per-job scorefile.
+
+        :param filename: The scorefile to read.
+        """
+
+        self.filename = filename
+        self.stamp = file_stamp(filename)
+        self.header = []
+        self.header_line = ''
+        self.rows = []
+        self.lines = []
+
+        rows = iter_rows(filename, with_lines=True)
+        try:
+            self.header, self.header_line = next(rows)
+        except StopIteration:
+            return
+        for fields, line in rows:
+            # Skip truncated rows (e.g. from a job killed while writing).
+            if len(fields) != len(self.header):
+                continue
+            self.rows.append(fields)
+            self.lines.append(line if line.endswith('\n') else line + '\n')
+
+
+def find_sources(pattern: str, output: str) -> List[str]:
+    """
+    Find the per-job scorefiles to merge.
+
+    :param pattern: The glob pattern for the per-job scorefiles.
+    :param output: The merged scorefile, which is never a source.
+    :return: The sorted list of scorefiles.
+    """
+
+    output = os.path.abspath(output)
+    return [name for name in sorted(glob.glob(pattern)) if os.path.abspath(name) != output]
+
+
+def read_sources(names: List[str], threads: int) -> List[SourceTable]:
+    """
+    Read per-job scorefiles concurrently.  Reading is dominated by filesystem latency, so threads are enough.
+
+    :param names: The scorefiles to read.
+    :param threads: The number of reader threads.
+    :return: The parsed scorefiles, in the order of names.
+    """
+
+    with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+        return list(pool.map(SourceTable, names))
+
+
+def union_header(header: List[str], others: List[List[str]], namecol: str) -> List[str]:
+    """
+    Add any columns of others missing from header, keeping the name column last.
+
+    :param header: The starting header (may be empty).
+    :param others: Further headers to reconcile.
+    :param namecol: The name of the column holding the pose name.
+    :return: The reconciled header.
+    """
+
+    merged = [col for col in header if col != namecol]
+    seen = set(merged)
+    for other in others:
+        for col in other:
+            if col != namecol and col not in seen:
+                merged.append(col)
+                seen.add(col)
+    return merged + [namecol]
+
+
+def pick_rows(sources: List[SourceTable], namecol: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Choose which row to keep for every description in sources.  The row from the most recently modified scorefile
+    wins; within one scorefile, the last row wins.
+
+    :param sources: The parsed per-job scorefiles.
+    :param namecol: The name of the column holding the pose name.
+    :return: A dictionary of description to (source index, row index).
+    """
+
+    winners = {}
+    for srcidx, source in enumerate(sources):
+        if not source.header:
+            continue
+        namepos = source.header.index(namecol)
+        for rowidx, fields in enumerate(source.rows):
+            name = fields[namepos]
+            previous = winners.get(name)
+            if previous is None or sources[previous[0]].stamp['mtime'] <= source.stamp['mtime']:
+                winners[name] = (srcidx, rowidx)
+    return winners
+
+
+class MergedWriter:
+    """
+    Writes rows to the merged text scorefile (and optionally its columnar cache) in the merged column layout.
+    """
+
+    def __init__(self, outfile, header: List[str], fmt: str, namecol: str, cache=None):
+        """
+        Initialization of MergedWriter.
+
+        :param outfile: The open text output file.
+        :param header: The merged header.
+        :param fmt: sc or tsv.
+        :param namecol: The name of the column holding the pose name.
+        :param cache: A ScoreCache to append the rows to, or None.
+        """
+
+        self.outfile = outfile
+        self.header = header
+        self.fmt = fmt
+        self.namecol = namecol
+        self.cache = cache
+        self.columns = [col for col in header if col != namecol]
+        self._names = []
+        self._values = {col: [] for col in self.columns}
+
+
+    def write_header(self):
+        """
+        Write the header line (and SEQUENCE: line, for .sc files).
+        """
+
+        if self.fmt == 'sc':
+            self.outfile.write('SEQUENCE: \n')
+            self.outfile.write('SCORE: ' + ' '.join(self.header) + '\n')
+        else:
+            self.outfile.write('\t'.join(self.header) + '\n')
+
+
+    def add(self, fields: List[str], line: str, source_header: List[str]):
+        """
+        Write one row.
+
+        :param fields: The row's fields, in the order of source_header.
+        :param line: The row's original text, written unchanged if source_header matches the merged header.
+        :param source_header: The header of the file the row came from.
+        """
+
+        values = dict(zip(source_header, fields))
+        if source_header == self.header:
+            self.outfile.write(line)
+        else:
+            fields = [values.get(col, MISSING) for col in self.header]
+            if self.fmt == 'sc':
+                self.outfile.write('SCORE: ' + ' '.join(fields) + '\n')
+            else:
+                self.outfile.write('\t'.join(fields) + '\n')
+
+        if self.cache is not None:
+            self._names.append(values[self.namecol])
+            for col in self.columns:
+                self._values[col].append(to_float(values.get(col, MISSING)))
+            if len(self._names) >= CACHE_CHUNK:
+                self.flush()
+
+
+    def flush(self):
+        """
+        Append the buffered rows to the cache.
+        """
+
+        if self.cache is not None and self._names:
+            self.cache.append(self._names, self._values)
+            self._names = []
+            self._values = {col: [] for col in self.columns}
+
+
+def merge(pattern: str, output: str, fmt: str, namecol: str = 'description', rebuild: bool = False,
+          use_cache: bool = True, threads: int = 16) -> int:
+    """
+    Merge the per-job scorefiles into output.  If output already exists, it is updated with the rows of scorefiles
+    that are new or changed since it was last merged.
+
+    :param pattern: The glob pattern for the per-job scorefiles.
+    :param output: The merged scorefile.
+    :param fmt: sc or tsv.
+    :param namecol: The name of the column holding the pose name, defaults to description.
+    :param rebuild: Re-merge every file from scratch.
+    :param use_cache: Write the columnar cache alongside the merged text file.
+    :param threads: The number of threads used to read scorefiles.
+    :return: The number of rows added or replaced.
+    """
+
+    cache = None
+    if use_cache:
+        from scorecache import ScoreCache, ScoreCacheError, cache_dir
+        try:
+            cache = ScoreCache.for_scorefile(output)
+        except ScoreCacheError:
+            cache = None
+
+    update = os.path.exists(output) and not rebuild
+    # With a current merge record, only the scorefiles that are new or have changed since need to be read.
+    current = update and cache is not None
+
+    names = find_sources(pattern, output)
+    if current:
+        known = cache.sources
+        names = [name for name in names if name not in known or
+                 {'mtime': known[name]['mtime'], 'size': known[name]['size']} != file_stamp(name)]
+
+    sources = read_sources(names, threads)
+    for source in sources:
+        if source.header and namecol not in source.header:
+            raise MergeError("No {namecol} column in {name}.".format(namecol=namecol, name=source.filename))
+    winners = pick_rows(sources, namecol)
+
+    old_header = []
+    old_names = set()  # type: Set[str]
+    if update:
+        if current:
+            old_header = cache.header
+            old_names = set(cache.names())
+        else:
+            rows = iter_rows(output)
+            old_header = next(rows, [])
+            if old_header and namecol not in old_header:
+                raise MergeError("No {namecol} column in {output}.".format(namecol=namecol, output=output))
+            namepos = old_header.index(namecol) if old_header else 0
+            old_names = {fields[namepos] for fields in rows if len(fields) == len(old_header)}
+
+    header = union_header(old_header, [source.header for source in sources if source.header], namecol)
+
+    # Rows can simply be appended unless the columns changed, rows are being replaced, or the cache must be rebuilt.
+    rewrite = not update or header != old_header or not old_names.isdisjoint(winners) or (use_cache and not current)
+    if not winners and not rewrite:
+        # Nothing to add, but remember the (empty) scorefiles that were read.
+        if cache is not None:
+            for source in sources:
+                cache.sources[source.filename] = dict(source.stamp, rows=0)
+            cache.save(output)
+        return 0
+    if not winners and not update:
+        return 0
+
+    newcache = None
+    if rewrite:
+        tmpname = output + '.tmp'
+        outfile = open(tmpname, 'w')
+        if use_cache:
+            newcache = ScoreCache.create(cache_dir(output) + '.tmp', header, namecol)
+            if current:
+                newcache.manifest['sources'] = cache.sources
+    else:
+        outfile = open(output, 'a')
+        newcache = cache
+
+    with outfile:
+        writer = MergedWriter(outfile, header, fmt, namecol, newcache)
+        if rewrite:
+            writer.write_header()
+        if rewrite and update:
+            # Carry over the existing rows that aren't being replaced.
+            rows = iter_rows(output, with_lines=True)
+            next(rows, None)
+            namepos = old_header.index(namecol)
+            for fields, line in rows:
+                if len(fields) != len(old_header) or fields[namepos] in winners:
+                    continue
+                writer.add(fields, line if line.endswith('\n') else line + '\n', old_header)
+        for srcidx, source in enumerate(sources):
+            if not source.header:
+                continue
+            namepos = source.header.index(namecol)
+            for rowidx, fields in enumerate(source.rows):
+                if winners[fields[namepos]] == (srcidx, rowidx):
+                    writer.add(fields, source.lines[rowidx], source.header)
+        writer.flush()
+
+    if rewrite:
+        os.replace(tmpname, output)
+        if newcache is not None:
+            shutil.rmtree(cache_dir(output), ignore_errors=True)
+            os.rename(newcache.directory, cache_dir(output))
+            newcache.directory = cache_dir(output)
+
+    if newcache is not None:
+        for source in sources:
+            newcache.sources[source.filename] = dict(source.stamp, rows=len(source.rows))
+        newcache.save(output)
+
+    return len(winners)
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Merge the per-job scorefiles in */ into one scorefile, with a '
+                                     'columnar cache for fast loading.  Re-running only merges new or changed '
+                                     'scorefiles.')
+    parser.add_argument('--format', type=str, default='sc', choices=sorted(FORMATS.keys()),
+                        help='sc merges */*.sc into score_mg.sc, tsv merges */*_scores.tsv into score_mg.tsv.')
+    parser.add_argument('--pattern', type=str, help='Glob pattern of the scorefiles to merge (overrides --format).')
+    parser.add_argument('--output', type=str, help='The merged scorefile (overrides --format).')
+    parser.add_argument('--namecol', type=str, default='description', help='The pose name column.')
+    parser.add_argument('--threads', type=int, default=16, help='Number of threads reading scorefiles, defaults to '
+                        '16.')
+    parser.add_argument('--rebuild', action='store_true', help='Re-merge everything, replacing the merged file.')
+    parser.add_argument('--no_cache', action='store_true', help="Don't write the columnar cache (doesn't need "
+                        "numpy, but without its merge record every scorefile is re-read on update).")
+    args = parser.parse_args(argv)
+
+    pattern = args.pattern if args.pattern is not None else FORMATS[args.format][0]
+    output = args.output if args.output is not None else FORMATS[args.format][1]
+
+    try:
+        added = merge(pattern, output, args.format, args.namecol, args.rebuild, not args.no_cache, args.threads)
+    except MergeError as err:
+        sys.exit(str(err))
+    print("Merged {added} rows into {output}.".format(added=added, output=output))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,85 +1,138 @@
-#This script is meant to be run within PyMOL.
-#It will consider a list of PDB files in the current directory.
-#For all PDB files, it will calculate the RMSD to all other PDB files over the selection specified in selector.
-#The results will be output in a bcl clutster compatible table.
-
-#Set up python and pymol initialization.
-from pymol import cmd
-import os, sys
-
-#Reinitialize pymol.
-pymol.rcinit
-
-selector="decoy and name CA"	#PyMOL selector for the RMSD calculation.
-
-#Intialize variables for the list of pdbfiles and length of longest PDB name.
-pdblist = []
-longstring = 0
-
-#Iterate over all files in the current directory.
-for file in sorted(os.listdir(os.getcwd())):
-	#If the file is a PDB file, load it and add it to the list of pdb files.
-	#All pdb files will be loaded into the object "decoy", so we have a single multi-state object.
-	if file.endswith(".pdb"):
-		cmd.load(file, "decoy")
-		pdblist.append(file)	
-		#If the filename is longer than the longest filename to date, store that new length in longstring.
-		if len(file) > longstring: longstring = len(file)
-
-#Intialize variables for the current RMSD list, and a master list containing the full table of RMSDs.
-rmslist = []
-#Add the top-left corner prefix to the table.
-masterlist = [["bcl::storage::Table<double>"]]
-#Add the top-row list of PDB files to the master list.
-masterlist[0].extend(pdblist)
-
-#Iterate over all PDB files in the pdb file list by index.
-for idx in range(0,len(pdblist)):
-	#Clear the list of RMSDs.
-	rmslist = []
-	#Add the current pdb filename to the left column of the row.
-	rmslist = [pdblist[idx]]
-	#Extend rmslist with the intra-state RMSDs between all states and state idx+1.
-	#It is idx+1 because PyMOL starts counting at state 1, and python is indexed at 0.
-	#Only atoms in selector are considered.
-	rmslist.extend(cmd.intra_rms_cur(selector, idx+1))
-	#For the self-self comparison, replace the RMSD value of -1.0 with 0.
-	for n,i in enumerate(rmslist):
-		if i==-1.0: rmslist[n]=0
-	#print rmslist
-	#We now have a list containing the name of the PDB file followed by the RMSD to all PDB files.
-	#Append this to the masterlist.
-	masterlist.append( rmslist )
-	
-#print masterlist
-
-#Open the rmsds.txt file for output.
-rmsd_file = open("rmsds.txt", "a")
-#rmsd_file.write(masterlist)
-
-longstring = longstring + 2
-
-#Set up formating strings for the first and subsequent lines in the file.
-firstfrmt = '{:'+str(longstring)+'s}' + len(pdblist) * ('{:>'+str(longstring)+'s}')
-frmt = '{:'+str(longstring)+'s}' + len(pdblist) * ('{:>'+str(longstring)+'f}')
-#print frmt
-
-#Set up flag variable for the first line of the pdb file.
-first = True
-
-#Iterate over the outer list in the list-of-lists.  This is the list of lines.
-for line in masterlist:
-	#If this is the first line, write to the output file using the firstfrmt formatting string.
-	if (first):
-		#print(firstfrmt.format(*line))
-		rmsd_file.write(firstfrmt.format(*line))
-		rmsd_file.write('\n')
-		first = False
-	#If it is a data line, write to the output file using the frmt formatting string.
-	else:
-		#print(frmt.format(*line))
-		rmsd_file.write(frmt.format(*line))
-		rmsd_file.write('\n')
-		
-#We're done.  Close the output file.
-rmsd_file.close()
+#!/usr/bin/env python3
+"""
+paired_rmsds.py calculates the RMSD between every pair of PDB files in the current directory.
+The results are output in a bcl cluster compatible table (rmsds.txt).
+
+It used to run inside PyMOL; it now parses the PDB files itself (see rmsd_matrix.py) and needs only numpy.
+The PyMOL selector "decoy and name CA" is the default selection; see --help for the selection options.
+Note that each pair is superimposed before the RMSD is calculated.  Use --no_fit to reproduce PyMOL's intra_rms_cur,
+which compares the coordinates as they are.
+
+For large sets, use --tiles to split the matrix into tiles (see rmsd_tiles.py) that are computed by --processes local
+processes or, with --slurm, by a SLURM array submitted through slurmit.py.  Rerunning the same command resumes a
+killed calculation; once every tile exists, the table (and/or an .npy matrix with --npy) is assembled.  Tiles are
+stored as float32, so tiled tables can differ from untiled ones in the last printed digit.
+"""
+
+import argparse
+import os
+import shlex
+import subprocess
+import sys
+
+from pdbatoms import AtomSelection
+from rmsd_matrix import DEFAULT_BLOCK, load_coords, rmsd_matrix, write_bcl_table
+from rmsd_tiles import DEFAULT_TILE, TileError, TileSet
+
+
+def submit_tiles(tiles: TileSet, jobname: str, slurm_args: str) -> int:
+    """
+    Submit the missing tiles of a tile set as a SLURM array, one tile per array element, using slurmit.py.
+
+    :param tiles: The prepared TileSet.
+    :param jobname: The SLURM job name.
+    :param slurm_args: Extra arguments for slurmit.py (e.g. "--partition main --mem 4000").
+    :return: The exit code of slurmit.py.
+    """
+
+    from slurmit import array_spec
+
+    missing = tiles.missing()
+    if not missing:
+        print("All tiles in {directory} are already computed.".format(directory=tiles.directory))
+        return 0
+
+    scriptdir = os.path.dirname(os.path.abspath(__file__))
+    directory = os.path.abspath(tiles.directory)
+    command = " ".join([shlex.quote(sys.executable), shlex.quote(os.path.join(scriptdir, 'paired_rmsds.py')),
+                        "--tiles", shlex.quote(directory), "--tile_index", "$job"])
+    slurmit = [sys.executable, os.path.join(scriptdir, 'slurmit.py'), '--job', jobname, '--array',
+               array_spec(missing), '--outfiles', os.path.join(directory, 'tile_%a'), '--command', command]
+    slurmit.extend(shlex.split(slurm_args))
+    return subprocess.call(slurmit)
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Calculate the all-vs-all RMSD table of a set of PDB files, in '
+                                     'bcl::storage::Table<double> format.')
+    parser.add_argument('pdbs', nargs='*', help='The PDB files.  Defaults to every .pdb file in the current '
+                        'directory.')
+    parser.add_argument('--atoms', type=str, default='CA', help='Comma-separated atom names to use, or "all".  '
+                        'Defaults to CA.')
+    parser.add_argument('--chains', type=str, help='Chain IDs to use, e.g. AB.  Defaults to all chains.')
+    parser.add_argument('--residues', type=str, help='Residue numbers to use, e.g. 1-100,120.  Defaults to all.')
+    parser.add_argument('--no_fit', action='store_true', help='Do not superimpose the structures (like PyMOL '
+                        'intra_rms_cur).')
+    parser.add_argument('--output', type=str, default='rmsds.txt', help='The output table, defaults to rmsds.txt.')
+    parser.add_argument('--block', type=int, default=DEFAULT_BLOCK, help='Number of structures per block of the '
+                        'calculation.  Bounds the memory used for intermediates.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of processes used to read PDB files and, '
+                        'with --tiles, to compute tiles.')
+
+    tile_group = parser.add_argument_group("tiles", "Arguments for tiled calculations of large sets.")
+    tile_group.add_argument('--tiles', type=str, help='Directory holding the tiles of the calculation.  Created (and '
+                            'the PDB files parsed) on the first run; later runs resume from it.')
+    tile_group.add_argument('--tile_size', type=int, default=DEFAULT_TILE, help='Number of structures per side of a '
+                            'tile, defaults to {tile}.'.format(tile=DEFAULT_TILE))
+    tile_group.add_argument('--tile_index', type=int, help='Compute only this tile and exit (used by SLURM array '
+                            'elements).')
+    tile_group.add_argument('--slurm', action='store_true', help='Submit the missing tiles as a SLURM array via '
+                            'slurmit.py instead of computing them here.  Rerun without --slurm to assemble.')
+    tile_group.add_argument('--slurm_job', type=str, default='rmsd_tiles', help='SLURM job name for --slurm.')
+    tile_group.add_argument('--slurm_args', type=str, default='', help='Extra slurmit.py arguments for --slurm, '
+                            'given with "=", e.g. --slurm_args="--partition main --mem 4000".')
+    tile_group.add_argument('--npy', type=str, help='Also assemble the matrix into this memory-mapped .npy file.')
+    tile_group.add_argument('--no_table', action='store_true', help='Do not write the BCL table (e.g. with --npy).')
+    args = parser.parse_args(argv)
+
+    if args.tiles is None:
+        if args.tile_index is not None or args.slurm or args.npy or args.no_table:
+            parser.error('--tile_index, --slurm, --npy and --no_table need --tiles.')
+
+    # Reopening an existing tile directory skips parsing the PDB files.
+    tiles = None
+    if args.tiles is not None:
+        try:
+            tiles = TileSet(args.tiles)
+        except TileError:
+            if args.tile_index is not None:
+                sys.exit(str(sys.exc_info()[1]))
+
+    if tiles is None:
+        pdblist = args.pdbs
+        if not pdblist:
+            pdblist = [name for name in sorted(os.listdir(os.getcwd())) if name.endswith(".pdb")]
+        if not pdblist:
+            sys.exit("No PDB files found.")
+
+        selection = AtomSelection.from_args(args.atoms, args.chains, args.residues)
+        coords = load_coords(pdblist, selection, args.processes)
+        names = [os.path.basename(name) for name in pdblist]
+
+        if args.tiles is None:
+            matrix = rmsd_matrix(coords, fit=not args.no_fit, block=args.block)
+            write_bcl_table(args.output, names, [matrix])
+            return
+        tiles = TileSet.prepare(args.tiles, names, coords, tile=args.tile_size, fit=not args.no_fit)
+
+    if args.tile_index is not None:
+        tiles.compute(args.tile_index)
+        return
+
+    if args.slurm:
+        sys.exit(submit_tiles(tiles, args.slurm_job, args.slurm_args))
+
+    computed = tiles.compute_missing(args.processes)
+    print("Computed {computed} of {total} tiles.".format(computed=computed, total=len(tiles.tiles())))
+    if args.npy is not None:
+        tiles.to_npy(args.npy)
+    if not args.no_table:
+        write_bcl_table(args.output, tiles.names, tiles.iter_rows())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
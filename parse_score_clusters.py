@@ -1,66 +1,104 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 
 ##Usage: parse_score_clusters.py myscores.csv clusters.txt outscore.csv
 ##myscores.csv is a list of scores in CSV format.  The pose/filename should be headed "description"
+##A Rosetta scorefile (e.g. score_mg.sc from merge_scores.py) can be given instead; its columnar cache is used if present.
 ##clusters.txt is the output from BCL:Cluster, and should list all files in the score file.
 ##outscore.csv is the output file, which will output each node as a block in the CSV file.
+##Each block ends with a summary line for the node: its size, the min and mean total_score of its members, and its best (lowest total_score) member.
 
-import os, sys, csv
+import os, sys, math
+from scorefile import ScoreFile, to_float
 
 scorename = sys.argv[1]
-scorefile = open(scorename, 'r')
 clustername = sys.argv[2]
-clusterfile = open(clustername, 'r')
 outname = sys.argv[3]
 outfile = open(outname, 'a')
 
-scores = []
-nodes = []
+#The score term used for the node summaries.
+statterm = 'total_score'
 
-#Convert each line of the score file to a list, and put each of those lists into another list.
-for line in scorefile:
-	line = line.replace('\n','').replace('\r','').replace(' ','').split(',')
-	scores.append(line)
-	
-#Convert each line of the cluster file to a list, and put each of those lists into another list.
-for line in clusterfile:
-	line = line.replace('\n','').replace(' ','').split(':')
-	nodes.append(line)
-	
-#Go through the header row of the score file and determine what column description is in.
-colnum = 0
-scorename = -1
-for col in scores[0]:
-	if (col == 'description'):
-		scorename = colnum
-	colnum = colnum + 1
+#Index the score file by description, so each leaf is found with one lookup.
+scores = {}
+if scorename.endswith('.csv'):
+	scorefile = open(scorename, 'r')
+	header = scorefile.readline().replace('\n','').replace('\r','').replace(' ','').split(',')
+	#Go through the header row of the score file and determine what column description is in.
+	if 'description' not in header:
+		sys.exit("No description column in " + scorename)
+	namecol = header.index('description')
+	statcol = header.index(statterm) if statterm in header else -1
+	for line in scorefile:
+		line = line.replace('\n','').replace('\r','').replace(' ','').split(',')
+		if len(line) <= namecol: continue
+		#If a description is listed more than once, the first line is used.
+		if line[namecol] not in scores:
+			scores[line[namecol]] = line
+	scorefile.close()
+else:
+	#Load the scorefile (from its cache, if merge_scores.py wrote one) and lay it out the same way.
+	scoretable = ScoreFile(scorename)
+	header = scoretable.header
+	statcol = header.index(statterm) if statterm in header else -1
+	columns = [scoretable.columns.get(col) for col in header]
+	for row, name in enumerate(scoretable.names):
+		scores[name] = [name if values is None else values[row] for values in columns]
 
 #We will assume that the node name is in the first column, the file name is in the third column in the node file, and the leaf is in the 7th column.
 nodeid = 0
 nodename = 2
 nodeleaf = 6
 
+#Write the summary line for a node: its size, and the min/mean statterm and best member of the members that were scored.
+def write_summary(size, values, best):
+	if values:
+		outfile.write(','.join(map(str, ['node_summary', 'size', size, 'min_' + statterm, min(values), 'mean_' + statterm, sum(values) / len(values), 'best', best])))
+	else:
+		outfile.write(','.join(map(str, ['node_summary', 'size', size, 'min_' + statterm, 'NA', 'mean_' + statterm, 'NA', 'best', 'NA'])))
+	outfile.write('\n')
+
 #We are assuming that all of the nodes are written consecutively.
-#Loop over the node file.
-curnode = ''
-for idx,node in enumerate(nodes):
+#Stream the node file, keeping the running stats of the current node.
+curnode = None
+size = 0
+values = []
+best = None
+bestval = math.inf
+for line in open(clustername, 'r'):
+	node = line.replace('\n','').replace(' ','').split(':')
 	#Check if the current line is a leaf.
-	if ( nodes[idx][nodeleaf] == '0' ): continue
+	if ( len(node) <= nodeleaf or node[nodeleaf] == '0' ): continue
 	#Check if the current line is a new node.
-	if (curnode != nodes[idx][nodeid]):
+	if (curnode != node[nodeid]):
+		#Finish the previous node.
+		if curnode is not None:
+			write_summary(size, values, best)
 		#Set our new current node.
-		curnode = nodes[idx][nodeid]
+		curnode = node[nodeid]
+		size = 0
+		values = []
+		best = None
+		bestval = math.inf
 		#Write out the node separator
 		outfile.write('--------------'+curnode+'--------------\n')
-	#Loop over the score file until we find a leaf for the current PDB file
-	found = False
-	for scidx,sc in enumerate(scores):
-		if ( nodes[idx][nodename] == scores[scidx][scorename] ):
-			#Write out that line and break out of the loop.
-			#print scores[scidx]
-			outfile.write(','.join(map(str,scores[scidx])))
-			outfile.write('\n')
-			found = True
-			break
-	if ( found == False ):
-		print "The file " + nodes[idx][nodename] + " was not found in the score file."
\ No newline at end of file
+	size = size + 1
+	#Look up the leaf for the current PDB file.
+	sc = scores.get(node[nodename])
+	if sc is None:
+		print("The file " + node[nodename] + " was not found in the score file.")
+		continue
+	#Write out that line.
+	outfile.write(','.join(map(str,sc)))
+	outfile.write('\n')
+	#Add the leaf to the node stats.
+	if statcol != -1:
+		value = to_float(str(sc[statcol]))
+		if not math.isnan(value):
+			values.append(value)
+			if value < bestval:
+				bestval = value
+				best = node[nodename]
+
+if curnode is not None:
+	write_summary(size, values, best)
+outfile.close()
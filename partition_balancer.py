@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+partition_balancer.py moves your pending SLURM jobs to partitions that can start them now.
+
+sinfo and squeue are each queried once per round.  From sinfo (one line per node and partition), each partition's
+idle CPUs and the largest idle CPU count and free memory of any one node are added up; from squeue, the pending CPUs
+queued in each partition (everyone's jobs).  Your pending jobs that their own partition can't start now (it has
+fewer idle CPUs than the job asks for) are then moved, in queue order, to the allowed partition with the most idle
+CPUs left that the job fits on (CPUs and memory per node), as long as that partition has fewer pending CPUs than
+idle CPUs.  Each move uses up the CPUs it needs, so the same idle CPUs are never handed out twice.
+
+The moves are made with one "scontrol update jobid=a,b,c partition=X" per batch of jobs.  --dry_run prints the
+commands instead, and --continuous repeats the round every --interval seconds.  Recorded sinfo/squeue outputs can be
+given with --sinfo_file/--squeue_file (and scontrol replaced with --scontrol) to try it without a cluster.
+
+Usage: partition_balancer.py --to short,main --dry_run
+       partition_balancer.py --from main --to short --max_moves 50
+       partition_balancer.py --continuous --interval 300
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+import argparse
+import getpass
+import subprocess
+import sys
+import time
+
+SINFO_FORMAT = '%P|%N|%C|%m|%e|%T'
+SQUEUE_FORMAT = '%i|%P|%C|%m|%D|%u|%r'
+
+# Node states whose idle CPUs can start jobs.
+USABLE_STATES = ['idle', 'mixed', 'mix', 'allocated', 'alloc', 'completing', 'comp']
+
+# Pending reasons that moving the job won't help with.
+HELD_REASONS = ['Dependency', 'DependencyNeverSatisfied', 'JobHeldUser', 'JobHeldAdmin', 'BeginTime',
+                'PartitionDown', 'ReqNodeNotAvail', 'AssocGrpCpuLimit', 'QOSMaxJobsPerUserLimit']
+
+
+class BalancerError(Exception):
+    """
+    Exception class for sinfo/squeue/scontrol failures.
+    """
+
+
+class Partition:
+    """
+    The capacity and queue of one partition.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialization of Partition.
+
+        :param name: The partition name.
+        """
+
+        self.name = name
+        self.idle_cpus = 0
+        self.node_cpus = 0
+        self.node_mem = 0
+        self.pending_cpus = 0
+
+
+class PendingJob:
+    """
+    A pending job, as squeue lists it.
+    """
+
+    def __init__(self, jobid: str, partition: str, cpus: int, mem: int, nodes: int, user: str, reason: str,
+                 tasks: int = 1):
+        """
+        Initialization of PendingJob.
+
+        :param jobid: The job id (the array's id, for the pending tasks of an array).
+        :param partition: The partition(s) it's queued in.
+        :param cpus: The CPUs it asks for, in total (over all its pending array tasks).
+        :param mem: The memory it asks for per node, in MB.
+        :param nodes: The nodes it asks for.
+        :param user: Its user.
+        :param reason: Why it's pending.
+        :param tasks: The number of pending array tasks it stands for, each asking for cpus / tasks CPUs.
+        """
+
+        self.jobid = jobid
+        self.partition = partition
+        self.cpus = cpus
+        self.mem = mem
+        self.nodes = nodes
+        self.user = user
+        self.reason = reason
+        self.tasks = tasks
+
+
+def mem_mb(text: str) -> int:
+    """
+    Convert a SLURM memory field (e.g. 2000, 2000M, 4G, 1T) to MB.
+    """
+
+    text = text.strip().rstrip('+')
+    scale = {'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024 ** 2}
+    if text and text[-1] in scale:
+        return int(float(text[:-1]) * scale[text[-1]])
+    try:
+        return int(float(text))
+    except ValueError:
+        return 0
+
+
+def array_size(jobid: str) -> int:
+    """
+    :return: The number of tasks in a squeue job id: 1, or the size of a pending array range like 123_[4-10%2].
+    """
+
+    if '_[' not in jobid:
+        return 1
+    from slurmit import expand_array
+    return len(expand_array(jobid.split('_[', 1)[1].rstrip(']')))
+
+
+def parse_sinfo(output: str) -> Dict[str, Partition]:
+    """
+    Parse sinfo -h -N -o '%P|%N|%C|%m|%e|%T' output.
+
+    :param output: The sinfo output.
+    :return: A dictionary of partition name to Partition.
+    """
+
+    partitions = {}
+    for line in output.splitlines():
+        fields = line.strip().split('|')
+        if len(fields) < 6:
+            continue
+        name = fields[0].rstrip('*')
+        partition = partitions.setdefault(name, Partition(name))
+        if fields[5].rstrip('*~#!%$@^-').lower() not in USABLE_STATES:
+            continue
+        # %C is allocated/idle/other/total.
+        idle = int(fields[2].split('/')[1])
+        partition.idle_cpus += idle
+        if idle > 0:
+            partition.node_cpus = max(partition.node_cpus, idle)
+            partition.node_mem = max(partition.node_mem, mem_mb(fields[4]))
+    return partitions
+
+
+def parse_squeue(output: str) -> List[PendingJob]:
+    """
+    Parse squeue -h -t PD -o '%i|%P|%C|%m|%D|%u|%r' output.
+
+    :param output: The squeue output.
+    :return: The pending jobs, in queue order.  A pending array range counts as its number of tasks times the CPUs
+    of each.
+    """
+
+    jobs = []
+    for line in output.splitlines():
+        fields = line.strip().split('|')
+        if len(fields) < 7:
+            continue
+        tasks = array_size(fields[0])
+        jobid = fields[0].split('_[', 1)[0]
+        jobs.append(PendingJob(jobid, fields[1], int(fields[2]) * tasks, mem_mb(fields[3]), int(fields[4] or 1),
+                               fields[5], fields[6].strip('()'), tasks))
+    return jobs
+
+
+def plan_moves(partitions: Dict[str, Partition], jobs: List[PendingJob], user: str, targets: List[str],
+               sources: Optional[List[str]] = None, max_moves: int = 0) -> List[Tuple[PendingJob, str]]:
+    """
+    Pick the pending jobs to move, and where.
+
+    :param partitions: The partitions, from parse_sinfo.
+    :param jobs: Everyone's pending jobs, from parse_squeue.
+    :param user: Only this user's jobs are moved.
+    :param targets: The partitions jobs may be moved to.
+    :param sources: Only move jobs from these partitions, defaults to any.
+    :param max_moves: The most jobs to move, 0 for no limit.
+    :return: A list of (job, target partition) moves.
+    """
+
+    for job in jobs:
+        if job.partition in partitions:
+            partitions[job.partition].pending_cpus += job.cpus
+
+    free = {name: part.idle_cpus - part.pending_cpus for name, part in partitions.items()}
+    moves = []
+    for job in jobs:
+        if max_moves and len(moves) >= max_moves:
+            break
+        if (job.user != user or ',' in job.partition or job.partition not in partitions or
+                (sources and job.partition not in sources) or job.reason in HELD_REASONS):
+            continue
+        # Jobs their own partition can start now are left alone.
+        if partitions[job.partition].idle_cpus >= job.cpus:
+            continue
+        # Array tasks each start on their own, so only one task has to fit on a node.
+        cpus_per_node = -(-(job.cpus // job.tasks) // max(1, job.nodes))
+        fits = [name for name in targets if name != job.partition and name in partitions and
+                free[name] >= job.cpus and partitions[name].node_cpus >= cpus_per_node and
+                partitions[name].node_mem >= job.mem]
+        if not fits:
+            continue
+        target = max(fits, key=lambda name: free[name])
+        free[target] -= job.cpus
+        # The job's CPUs are no longer queued in its old partition.
+        free[job.partition] += job.cpus
+        moves.append((job, target))
+    return moves
+
+
+def update_commands(moves: List[Tuple[PendingJob, str]], batch_size: int = 100,
+                    scontrol: str = 'scontrol') -> List[List[str]]:
+    """
+    :return: The scontrol commands making the moves, one per batch of up to batch_size jobs going to a partition.
+    """
+
+    bytarget = {}
+    for job, target in moves:
+        bytarget.setdefault(target, []).append(job.jobid)
+    commands = []
+    for target, jobids in bytarget.items():
+        for start in range(0, len(jobids), batch_size):
+            commands.append([scontrol, 'update', 'jobid=' + ','.join(jobids[start:start + batch_size]),
+                             'partition=' + target])
+    return commands
+
+
+def query(command: List[str], filename: Optional[str]) -> str:
+    """
+    :return: The output of a SLURM query, or the contents of a recorded output file instead.
+    """
+
+    if filename is not None:
+        with open(filename, 'r') as recorded:
+            return recorded.read()
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    except FileNotFoundError:
+        raise BalancerError("{cmd} is not available.  Are you running in a SLURM environment?".format(cmd=command[0]))
+    if result.returncode != 0:
+        raise BalancerError("{cmd} failed: {err}".format(cmd=command[0], err=result.stderr.strip()))
+    return result.stdout
+
+
+def balance(args: argparse.Namespace) -> int:
+    """
+    Run one round: query, plan and move (or print the moves).
+
+    :param args: The parsed arguments.
+    :return: The number of jobs moved.
+    """
+
+    partitions = parse_sinfo(query(['sinfo', '-h', '-N', '-o', SINFO_FORMAT], args.sinfo_file))
+    jobs = parse_squeue(query(['squeue', '-h', '-t', 'PD', '-o', SQUEUE_FORMAT], args.squeue_file))
+    targets = args.to.split(',') if args.to else sorted(partitions)
+    sources = args.source.split(',') if args.source else None
+    moves = plan_moves(partitions, jobs, args.user, targets, sources, args.max_moves)
+
+    for job, target in moves:
+        print("{jobid}: {source} -> {target} ({cpus} CPUs)".format(jobid=job.jobid, source=job.partition,
+                                                                  target=target, cpus=job.cpus))
+    for command in update_commands(moves, args.batch_size, args.scontrol):
+        if args.dry_run:
+            print(' '.join(command))
+            continue
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        if result.returncode != 0:
+            print("Warning: {cmd} failed: {out}".format(cmd=' '.join(command), out=result.stdout.strip()))
+    print("{verb} {num} pending jobs.".format(verb='Would move' if args.dry_run else 'Moved', num=len(moves)))
+    return len(moves)
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Move your pending SLURM jobs to partitions with idle CPUs they fit '
+                                     'on.')
+    parser.add_argument('--to', type=str, help='Comma separated partitions jobs may be moved to, defaults to all.')
+    parser.add_argument('--from', dest='source', type=str, help='Comma separated partitions to move jobs from, '
+                        'defaults to all.')
+    parser.add_argument('--user', type=str, default=getpass.getuser(), help='Whose jobs to move, defaults to you.')
+    parser.add_argument('--max_moves', type=int, default=0, help='The most jobs to move per round, 0 (the default) '
+                        'for no limit.')
+    parser.add_argument('--batch_size', type=int, default=100, help='The most jobs per scontrol update, defaults to '
+                        '100.')
+    parser.add_argument('--dry_run', action='store_true', help='Print the scontrol commands instead of running them.')
+    parser.add_argument('--continuous', action='store_true', help='Keep balancing, every --interval seconds.')
+    parser.add_argument('--interval', type=float, default=300, help='Seconds between rounds with --continuous.')
+    parser.add_argument('--sinfo_file', type=str, help="Recorded output of sinfo -h -N -o '" + SINFO_FORMAT.replace(
+                        '%', '%%') + "' to use instead of running sinfo.")
+    parser.add_argument('--squeue_file', type=str, help="Recorded output of squeue -h -t PD -o '" +
+                        SQUEUE_FORMAT.replace('%', '%%') + "' to use instead of running squeue.")
+    parser.add_argument('--scontrol', type=str, default='scontrol', help='The scontrol command.')
+    args = parser.parse_args(argv)
+
+    try:
+        while True:
+            balance(args)
+            if not args.continuous:
+                break
+            time.sleep(args.interval)
+    except BalancerError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,19 +1,9 @@
-#!/usr/bin/env python
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+#!/usr/bin/env python3
+#Writes the sequence of every .pdb/.cif file in the working directory to sequences.fas.
+#Sequences are read from the residue records (see pdbseq.py); PyRosetta is only started for files with noncanonical residues.
+import os
+from pdbseq import main
 
-seq_file = open("sequences.fas", "w")
+pdbs = [pdb for pdb in sorted(os.listdir(os.getcwd())) if pdb.endswith(".pdb") or pdb.endswith(".cif")]
 
-for pdb in sorted(os.listdir(os.getcwd())):
-  if pdb.endswith(".pdb") or pdb.endswith(".cif"):
-    pose = pose_from_file(pdb)
-    seq_file.write(">"+pdb+"\n")
-    seq_file.write(pose.sequence()+"\n")
-    continue
-    
-    
-    
-  else:
-    continue
-    
-seq_file.close()
+main(pdbs + ["--output", "sequences.fas"])
@@ -1,18 +1,9 @@
-#!/usr/bin/env python
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+#!/usr/bin/env python3
+#Writes the sequence of every .pdb file in the working directory to sequences.txt, one per line.
+#Sequences are read from the residue records (see pdbseq.py); PyRosetta is only started for files with noncanonical residues.
+import os
+from pdbseq import main
 
-seq_file = open("sequences.txt", "w")
+pdbs = [pdb for pdb in sorted(os.listdir(os.getcwd())) if pdb.endswith(".pdb")]
 
-for pdb in sorted(os.listdir(os.getcwd())):
-  if pdb.endswith(".pdb"):
-    pose = pose_from_pdb(pdb)
-    seq_file.write(pose.sequence()+"\n")
-    continue
-    
-    
-    
-  else:
-    continue
-    
-seq_file.close()
\ No newline at end of file
+main(pdbs + ["--plain", "--output", "sequences.txt"])
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+pdbatoms.py reads the ATOM/HETATM records of PDB files into NumPy arrays, and selects atoms from them.
+
+It is a lightweight replacement for loading a structure into PyMOL or PyRosetta when all a script needs is coordinates.
+
+Requires numpy.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import gzip
+
+import numpy as np
+
+# One record per atom.  Coordinates are kept in a separate (N, 3) array.
+ATOM_DTYPE = np.dtype([('record', 'U6'), ('serial', 'i4'), ('name', 'U4'), ('altloc', 'U1'), ('resn', 'U4'),
+                       ('chain', 'U1'), ('resi', 'i4'), ('icode', 'U1'), ('element', 'U2')])
+
+
+class PDBError(Exception):
+    """
+    Exception class for PDB files that can't be read or don't contain the requested atoms.
+    """
+
+
+def open_pdb(filename: str):
+    """
+    Open a PDB file for reading as text, transparently handling gzipped files.
+
+    :param filename: The PDB file.
+    :return: An open text file.
+    """
+
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt')
+    return open(filename, 'r')
+
+
+def read_pdb(filename: str, model: int = 1, hetatm: bool = True) -> Tuple[np.ndarray, np.ndarray, Dict[str, str]]:
+    """
+    Read the atoms of one model of a PDB file, and the score terms in its footer, in a single pass.
+
+    The footer terms are the "name value" lines after the last comment (#) line of the file, which is where Rosetta
+    writes extra score terms and filter values.
+
+    :param filename: The PDB file.
+    :param model: The MODEL to read from multi-model files, defaults to the first.
+    :param hetatm: Include HETATM records, defaults to True.
+    :return: A tuple of (atoms, coords, footer): a structured array of ATOM_DTYPE, an (N, 3) float64 array, and a
+    dictionary of footer term to value (as text).
+    """
+
+    records = []
+    coords = []
+    footer = {}
+    seen_comment = False
+    curmodel = 1
+    with open_pdb(filename) as pdbfile:
+        for line in pdbfile:
+            if line.startswith('#'):
+                seen_comment = True
+                footer = {}
+                continue
+            if line.startswith('ATOM') or line.startswith('HETATM'):
+                if curmodel != model or (not hetatm and line.startswith('HETATM')):
+                    continue
+                try:
+                    coords.append((float(line[30:38]), float(line[38:46]), float(line[46:54])))
+                    records.append((line[0:6].strip(), int(line[6:11] or 0), line[12:16].strip(), line[16],
+                                    line[17:21].strip(), line[21], int(line[22:26]), line[26], line[76:78].strip()))
+                except ValueError:
+                    raise PDBError("Malformed atom record in {filename}: {line}".format(filename=filename,
+                                                                                        line=line.rstrip()))
+                continue
+            if line.startswith('MODEL'):
+                try:
+                    curmodel = int(line[10:14])
+                except ValueError:
+                    curmodel += 1
+                continue
+            if seen_comment:
+                fields = line.split()
+                if len(fields) >= 2:
+                    footer[fields[0]] = fields[1]
+
+    atoms = np.array(records, dtype=ATOM_DTYPE)
+    return atoms, np.array(coords, dtype=np.float64).reshape(-1, 3), footer
+
+
+def read_atoms(filename: str, model: int = 1, hetatm: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Read the atoms of one model of a PDB file.
+
+    :param filename: The PDB file.
+    :param model: The MODEL to read from multi-model files, defaults to the first.
+    :param hetatm: Include HETATM records, defaults to True.
+    :return: A tuple of (atoms, coords): a structured array of ATOM_DTYPE and an (N, 3) float64 array.
+    """
+
+    atoms, coords, _ = read_pdb(filename, model, hetatm)
+    return atoms, coords
+
+
+def parse_ranges(spec: str) -> List[Tuple[int, int]]:
+    """
+    Parse a residue range specification, such as "1-100,120,130-140".
+
+    :param spec: The range specification.
+    :return: A list of inclusive (first, last) tuples.
+    """
+
+    ranges = []
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        # Allow negative residue numbers, e.g. -3--1.
+        dash = part.find('-', 1)
+        if dash == -1:
+            ranges.append((int(part), int(part)))
+        else:
+            ranges.append((int(part[:dash]), int(part[dash + 1:])))
+    return ranges
+
+
+class AtomSelection:
+    """
+    A simple atom selection: the PyMOL-free equivalent of "chain A and resi 1-100 and name CA".
+    """
+
+    def __init__(self, atoms: Optional[Sequence[str]] = ('CA',), chains: Optional[Sequence[str]] = None,
+                 residues: Optional[str] = None, hydrogens: bool = False, altloc: str = 'A'):
+        """
+        Initialization of AtomSelection.
+
+        :param atoms: The atom names to select, or None for all atoms.  Defaults to CA.
+        :param chains: The chains to select, or None for all chains.
+        :param residues: A residue range specification (see parse_ranges), or None for all residues.
+        :param hydrogens: Include hydrogens, defaults to False.
+        :param altloc: The alternate location to keep for atoms that have several, defaults to A.
+        """
+
+        self.atoms = None if atoms is None else set(atoms)
+        self.chains = None if chains is None else set(chains)
+        self.ranges = None if residues is None else parse_ranges(residues)
+        self.hydrogens = hydrogens
+        self.altloc = altloc
+
+
+    @classmethod
+    def from_args(cls, atoms: Optional[str], chains: Optional[str], residues: Optional[str]) -> 'AtomSelection':
+        """
+        Build a selection from comma-separated command line values.
+
+        :param atoms: Comma-separated atom names, or "all".
+        :param chains: Chain IDs, e.g. "AB", or None.
+        :param residues: A residue range specification, or None.
+        :return: The AtomSelection.
+        """
+
+        atomlist = None if atoms is None or atoms.lower() == 'all' else [name.strip() for name in atoms.split(',')]
+        return cls(atoms=atomlist, chains=None if chains is None else list(chains), residues=residues)
+
+
+    def mask(self, atoms: np.ndarray) -> np.ndarray:
+        """
+        Select atoms.
+
+        :param atoms: A structured array of ATOM_DTYPE.
+        :return: A boolean mask over atoms.
+        """
+
+        mask = np.isin(atoms['altloc'], [' ', '', self.altloc])
+        if self.atoms is not None:
+            mask &= np.isin(atoms['name'], list(self.atoms))
+        if self.chains is not None:
+            mask &= np.isin(atoms['chain'], list(self.chains))
+        if self.ranges is not None:
+            inrange = np.zeros(len(atoms), dtype=bool)
+            for first, last in self.ranges:
+                inrange |= (atoms['resi'] >= first) & (atoms['resi'] <= last)
+            mask &= inrange
+        if not self.hydrogens:
+            elements = np.char.strip(atoms['element'])
+            # Without an element column, fall back on the atom name (allowing old-style names such as 1HB).
+            ish = np.where(elements != '', elements == 'H',
+                           np.char.startswith(np.char.lstrip(atoms['name'], '0123456789'), 'H'))
+            mask &= ~ish
+        return mask
+
+
+def atom_keys(atoms: np.ndarray) -> List[Tuple[str, int, str, str]]:
+    """
+    Get an identifying key for each atom, used to match atoms between models.
+
+    :param atoms: A structured array of ATOM_DTYPE.
+    :return: A list of (chain, resi, icode, name) tuples.
+    """
+
+    return list(zip(atoms['chain'].tolist(), atoms['resi'].tolist(), atoms['icode'].tolist(),
+                    atoms['name'].tolist()))
+
+
+def residue_keys(atoms: np.ndarray) -> List[Tuple[str, int, str]]:
+    """
+    Get the PDB identity of each residue, in file order.  A new residue starts at every change of chain, residue
+    number or insertion code, which is how Rosetta numbers the residues of a pose it reads or writes.
+
+    :param atoms: A structured array of ATOM_DTYPE.
+    :return: A list of (chain, resi, icode) tuples, one per residue: the residue with pose number n is at n - 1.
+    """
+
+    keys = []
+    for key in zip(atoms['chain'].tolist(), atoms['resi'].tolist(), atoms['icode'].tolist()):
+        if not keys or key != keys[-1]:
+            keys.append(key)
+    return keys
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+pdbfooter.py extracts Rosetta score information from the end of PDB files: the pose energies table (per-residue score
+terms, between #BEGIN_POSE_ENERGIES_TABLE and #END_POSE_ENERGIES_TABLE) and the footer terms (the "name value" lines
+after the last comment line, where extra score terms and filter values are written).
+
+Both sit at the end of the file, so the file is read backwards from the end in blocks, stopping as soon as the start of
+the table (or the last comment line) has been found; the coordinates are never read.  Gzipped files can't be read
+backwards cheaply, so they are decompressed in one pass instead.
+
+Requires numpy.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import gzip
+import os
+
+import numpy as np
+
+from scorefile import to_float
+
+BEGIN_TABLE = '#BEGIN_POSE_ENERGIES_TABLE'
+END_TABLE = '#END_POSE_ENERGIES_TABLE'
+
+# Number of bytes read per step when reading backwards.
+BLOCK_SIZE = 65536
+
+# Rows of the energies table that are not residues.
+SUMMARY_ROWS = ['weights', 'pose']
+
+
+class FooterError(Exception):
+    """
+    Exception class for PDB files without the requested score information.
+    """
+
+
+def read_tail(filename: str, marker: str, block: int = BLOCK_SIZE) -> Optional[str]:
+    """
+    Read the end of a file, from the start of the last line beginning with marker.
+
+    :param filename: The file to read.
+    :param marker: The text that the wanted line starts with.
+    :param block: The number of bytes read per step, defaults to BLOCK_SIZE.
+    :return: The text from the last line starting with marker to the end of the file, or None if there is none.
+    """
+
+    key = marker.encode()
+    if filename.endswith('.gz'):
+        with gzip.open(filename, 'rb') as infile:
+            data = infile.read()
+        idx = data.rfind(b'\n' + key)
+        if idx != -1:
+            return data[idx + 1:].decode()
+        return data.decode() if data.startswith(key) else None
+
+    with open(filename, 'rb') as infile:
+        pos = infile.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0:
+            step = min(block, pos)
+            pos -= step
+            infile.seek(pos)
+            data = infile.read(step) + data
+            idx = data.rfind(b'\n' + key)
+            if idx != -1:
+                return data[idx + 1:].decode()
+        return data.decode() if data.startswith(key) else None
+
+
+def read_footer(filename: str) -> Dict[str, str]:
+    """
+    Read the footer terms of a PDB file: the "name value" lines after its last comment line.
+
+    :param filename: The PDB file.
+    :return: A dictionary of term to value (as text).  Empty if the file has no comment lines.
+    """
+
+    footer = {}
+    tail = read_tail(filename, '#')
+    if tail is None:
+        return footer
+    for line in tail.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) >= 2:
+            footer[fields[0]] = fields[1]
+    return footer
+
+
+def read_energy_table(filename: str, terms: Optional[Sequence[str]] = None, summary: bool = False) -> np.ndarray:
+    """
+    Read the pose energies table of a PDB file.
+
+    :param filename: The PDB file.
+    :param terms: The score terms (columns of the table) to keep, or None for all of them.
+    :param summary: Also keep the weights and pose rows, defaults to False.
+    :return: A structured array with a label field (e.g. GLU:NtermProteinFull_1) and one float64 field per term.
+    Values that are not numeric (NA) are NaN.
+    """
+
+    tail = read_tail(filename, BEGIN_TABLE)
+    if tail is None:
+        raise FooterError("No pose energies table in {filename}.".format(filename=filename))
+
+    lines = tail.splitlines()
+    header = None
+    rows = []
+    for line in lines[1:]:
+        if line.startswith(END_TABLE):
+            break
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == 'label':
+            header = fields[1:]
+            continue
+        if not summary and fields[0] in SUMMARY_ROWS:
+            continue
+        rows.append(fields)
+    if header is None:
+        raise FooterError("No label row in the pose energies table of {filename}.".format(filename=filename))
+
+    if terms is None:
+        terms = header
+    missing = [term for term in terms if term not in header]
+    if missing:
+        raise FooterError("{terms} not found in the pose energies table of {filename}.".format(
+            terms=', '.join(missing), filename=filename))
+    cols = [header.index(term) + 1 for term in terms]
+
+    width = max([len(fields[0]) for fields in rows] + [1])
+    table = np.empty(len(rows), dtype=[('label', 'U' + str(width))] + [(term, 'f8') for term in terms])
+    table['label'] = [fields[0] for fields in rows]
+    for term, col in zip(terms, cols):
+        table[term] = [to_float(fields[col]) if col < len(fields) else np.nan for fields in rows]
+    return table
+
+
+def _footer_values(args: Tuple[str, Sequence[str]]) -> List[float]:
+    """
+    Read the requested footer terms of one file.  A module-level function so it can be sent to worker processes.
+
+    :param args: A tuple of (filename, terms).
+    :return: The values of the terms, NaN for terms the file doesn't have.
+    """
+
+    filename, terms = args
+    footer = read_footer(filename)
+    return [to_float(footer.get(term, 'NA')) for term in terms]
+
+
+def _energy_table(args: Tuple[str, Optional[Sequence[str]], bool]) -> np.ndarray:
+    """
+    Read the energies table of one file in a worker process.
+
+    :param args: A tuple of (filename, terms, summary).
+    :return: The table (see read_energy_table).
+    """
+
+    filename, terms, summary = args
+    return read_energy_table(filename, terms, summary)
+
+
+def footer_table(filenames: Sequence[str], terms: Sequence[str], processes: int = 1) -> np.ndarray:
+    """
+    Read footer terms from many PDB files.
+
+    :param filenames: The PDB files.
+    :param terms: The footer terms to read.
+    :param processes: The number of processes reading files, defaults to 1.
+    :return: A structured array with a description field (the file name) and one float64 field per term, one row per
+    file in the order of filenames.  Terms a file doesn't have are NaN.
+    """
+
+    jobs = [(filename, list(terms)) for filename in filenames]
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            values = list(pool.map(_footer_values, jobs, chunksize=16))
+    else:
+        values = list(map(_footer_values, jobs))
+
+    width = max([len(filename) for filename in filenames] + [1])
+    table = np.empty(len(filenames), dtype=[('description', 'U' + str(width))] + [(term, 'f8') for term in terms])
+    table['description'] = filenames
+    if values:
+        values = np.array(values, dtype=np.float64).reshape(len(filenames), len(terms))
+        for idx, term in enumerate(terms):
+            table[term] = values[:, idx]
+    return table
+
+
+def energy_tables(filenames: Sequence[str], terms: Optional[Sequence[str]] = None, summary: bool = False,
+                  processes: int = 1) -> List[np.ndarray]:
+    """
+    Read the pose energies tables of many PDB files.
+
+    :param filenames: The PDB files.
+    :param terms: The score terms to keep, or None for all of them.
+    :param summary: Also keep the weights and pose rows, defaults to False.
+    :param processes: The number of processes reading files, defaults to 1.
+    :return: One structured array per file (see read_energy_table), in the order of filenames.
+    """
+
+    jobs = [(filename, terms, summary) for filename in filenames]
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            return list(pool.map(_energy_table, jobs, chunksize=16))
+    return list(map(_energy_table, jobs))
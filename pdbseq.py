@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+pdbseq.py extracts amino acid sequences from PDB and mmCIF files without building a PyRosetta pose.
+
+Only the residue records are read: the ATOM/HETATM records of the first model (or the SEQRES records, with --seqres),
+or the _atom_site (_pdbx_poly_seq_scheme) loop of mmCIF files.  Files are read by a pool of processes and the sequences
+are streamed out in input order, as FASTA or one sequence per line.  Files containing residues other than the 20
+canonical amino acids (and water) are handed to PyRosetta instead, which is only imported if such a file turns up.
+
+Usage: pdbseq.py *.pdb --output sequences.fas
+       pdbseq.py --list pdblist.txt --plain --output sequences.txt
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Tuple
+
+import argparse
+import gzip
+import os
+import sys
+
+THREE_TO_ONE = {'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C', 'GLN': 'Q', 'GLU': 'E', 'GLY': 'G',
+                'HIS': 'H', 'ILE': 'I', 'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F', 'PRO': 'P', 'SER': 'S',
+                'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V'}
+
+# Residues that are skipped, as PyRosetta skips them.
+WATERS = {'HOH', 'WAT', 'DOD', 'H2O'}
+
+# Letter used for noncanonical residues when PyRosetta is not used.
+UNKNOWN = 'X'
+
+# Whether PyRosetta has been initialized in this process.
+_rosetta_ready = False
+
+
+class SequenceError(Exception):
+    """
+    Exception class for structure files whose sequence can't be read.
+    """
+
+
+def _open(filename: str):
+    """
+    Open a structure file for reading as text, transparently handling gzipped files.
+
+    :param filename: The structure file.
+    :return: An open text file.
+    """
+
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rt')
+    return open(filename, 'r')
+
+
+def is_cif(filename: str) -> bool:
+    return filename.lower().replace('.gz', '').endswith(('.cif', '.mmcif'))
+
+
+def _pdb_residues(filename: str, seqres: bool) -> List[str]:
+    """
+    Read the residue names of a PDB file.
+
+    :param filename: The PDB file.
+    :param seqres: Read the SEQRES records instead of the ATOM/HETATM records.
+    :return: The three letter residue names, in order.
+    """
+
+    residues = []
+    last = None
+    with _open(filename) as pdbfile:
+        for line in pdbfile:
+            if seqres:
+                if line.startswith('SEQRES'):
+                    residues.extend(line[19:].split())
+                elif line.startswith('ATOM'):
+                    break
+                continue
+            if line.startswith('ATOM') or line.startswith('HETATM'):
+                # One residue per change of chain, residue number, insertion code or name.
+                key = line[17:27]
+                if key != last:
+                    last = key
+                    residues.append(line[17:21].strip())
+            elif line.startswith('ENDMDL'):
+                break
+    return residues
+
+
+def _cif_loop(lines: Iterator[str], category: str) -> Iterator[dict]:
+    """
+    Stream the rows of one loop_ category of an mmCIF file.
+
+    :param lines: The lines of the file.
+    :param category: The category, e.g. _atom_site.
+    :return: An iterator over dictionaries of item name to value.
+    """
+
+    columns = []
+    inloop = False
+    for line in lines:
+        if line.startswith(category + '.'):
+            columns.append(line.split()[0][len(category) + 1:])
+            inloop = True
+            continue
+        if not inloop:
+            continue
+        if not columns or line.startswith('#') or line.startswith('loop_') or line.startswith('_'):
+            if columns:
+                return
+            continue
+        fields = line.split()
+        if len(fields) == len(columns):
+            yield dict(zip(columns, fields))
+
+
+def _cif_residues(filename: str, seqres: bool) -> List[str]:
+    """
+    Read the residue names of an mmCIF file.
+
+    :param filename: The mmCIF file.
+    :param seqres: Read _pdbx_poly_seq_scheme (the full deposited sequence) instead of _atom_site.
+    :return: The three letter residue names, in order.
+    """
+
+    residues = []
+    last = None
+    with _open(filename) as ciffile:
+        if seqres:
+            for row in _cif_loop(ciffile, '_pdbx_poly_seq_scheme'):
+                residues.append(row['mon_id'])
+            return residues
+        model = None
+        for row in _cif_loop(ciffile, '_atom_site'):
+            # First model only.
+            if model is None:
+                model = row.get('pdbx_PDB_model_num')
+            elif row.get('pdbx_PDB_model_num') != model:
+                break
+            name = row.get('auth_comp_id', row.get('label_comp_id'))
+            key = (row.get('auth_asym_id', row.get('label_asym_id')), row.get('auth_seq_id', row.get('label_seq_id')),
+                   row.get('pdbx_PDB_ins_code'), name)
+            if key != last:
+                last = key
+                residues.append(name)
+    return residues
+
+
+def residue_names(filename: str, seqres: bool = False) -> List[str]:
+    """
+    Read the residue names of a PDB or mmCIF file.
+
+    :param filename: The structure file.
+    :param seqres: Read the deposited sequence (SEQRES) instead of the modeled residues.
+    :return: The three letter residue names, in order, without waters.
+    """
+
+    if is_cif(filename):
+        residues = _cif_residues(filename, seqres)
+    else:
+        residues = _pdb_residues(filename, seqres)
+    return [name for name in residues if name not in WATERS]
+
+
+def rosetta_sequence(filename: str) -> str:
+    """
+    Read the sequence of a structure file with PyRosetta, initializing it the first time it's needed in this process.
+
+    :param filename: The structure file.
+    :return: The sequence, as given by pose.sequence().
+    """
+
+    global _rosetta_ready
+    import pyrosetta
+    if not _rosetta_ready:
+        pyrosetta.init("-ignore_unrecognized_res -mute all")
+        _rosetta_ready = True
+    return pyrosetta.pose_from_file(filename).sequence()
+
+
+def sequence(filename: str, seqres: bool = False, fallback: bool = True) -> str:
+    """
+    Get the one letter sequence of a structure file.
+
+    :param filename: The structure file.
+    :param seqres: Read the deposited sequence (SEQRES) instead of the modeled residues.
+    :param fallback: Use PyRosetta for files with noncanonical residues.  Otherwise they are written as X.
+    :return: The sequence.
+    """
+
+    residues = residue_names(filename, seqres)
+    if fallback and not seqres and any(name not in THREE_TO_ONE for name in residues):
+        try:
+            return rosetta_sequence(filename)
+        except ImportError:
+            pass
+    return ''.join(THREE_TO_ONE.get(name, UNKNOWN) for name in residues)
+
+
+def _sequence_job(args: Tuple[str, bool, bool]) -> str:
+    """
+    Get the sequence of one file in a worker process.
+
+    :param args: A tuple of (filename, seqres, fallback).
+    :return: The sequence.
+    """
+
+    return sequence(*args)
+
+
+def iter_sequences(filenames: List[str], processes: int = 1, seqres: bool = False,
+                   fallback: bool = True) -> Iterator[Tuple[str, str]]:
+    """
+    Get the sequences of many structure files, in order.
+
+    :param filenames: The structure files.
+    :param processes: The number of processes reading files, defaults to 1.
+    :param seqres: Read the deposited sequence (SEQRES) instead of the modeled residues.
+    :param fallback: Use PyRosetta for files with noncanonical residues.
+    :return: An iterator over (filename, sequence) tuples.
+    """
+
+    jobs = [(filename, seqres, fallback) for filename in filenames]
+    if processes > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            yield from zip(filenames, pool.map(_sequence_job, jobs, chunksize=64))
+    else:
+        yield from zip(filenames, map(_sequence_job, jobs))
+
+
+def write_sequences(outfile, sequences: Iterable[Tuple[str, str]], fasta: bool = True) -> int:
+    """
+    Write sequences as they become available.
+
+    :param outfile: The open output file.
+    :param sequences: (name, sequence) tuples.
+    :param fasta: Write FASTA (>name lines), otherwise one sequence per line.
+    :return: The number of sequences written.
+    """
+
+    count = 0
+    for name, seq in sequences:
+        if fasta:
+            outfile.write('>' + name + '\n')
+        outfile.write(seq + '\n')
+        count += 1
+    return count
+
+
+def read_list(listfilename: str) -> List[str]:
+    """
+    Read a list of structure files, one per line.  A missing .pdb extension is added.
+
+    :param listfilename: The list file.
+    :return: The file names.
+    """
+
+    filenames = []
+    with open(listfilename, 'r') as listfile:
+        for line in listfile:
+            name = line.strip()
+            if not name:
+                continue
+            if not os.path.exists(name) and not name.lower().endswith(('.pdb', '.cif', '.gz')):
+                name += '.pdb'
+            filenames.append(name)
+    return filenames
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Extract the sequences of PDB/mmCIF files, without building '
+                                     'PyRosetta poses.')
+    parser.add_argument('files', nargs='*', help='The structure files.')
+    parser.add_argument('--list', type=str, help='A file listing structure files, one per line (.pdb optional).')
+    parser.add_argument('--output', type=str, default='-', help='The output file, defaults to stdout.')
+    parser.add_argument('--plain', action='store_true', help='Write one sequence per line instead of FASTA.')
+    parser.add_argument('--seqres', action='store_true', help='Read the deposited sequence (SEQRES records, or '
+                        '_pdbx_poly_seq_scheme for mmCIF) instead of the modeled residues.')
+    parser.add_argument('--no_fallback', action='store_true', help="Don't use PyRosetta for files with noncanonical "
+                        "residues; write those residues as X.")
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1, help='Number of processes reading '
+                        'files, defaults to the number of CPUs.')
+    args = parser.parse_args(argv)
+
+    filenames = list(args.files)
+    if args.list is not None:
+        filenames.extend(read_list(args.list))
+    if not filenames:
+        sys.exit("No structure files given.")
+
+    sequences = iter_sequences(filenames, args.processes, args.seqres, not args.no_fallback)
+    if args.output == '-':
+        write_sequences(sys.stdout, sequences, not args.plain)
+    else:
+        with open(args.output, 'w') as outfile:
+            write_sequences(outfile, sequences, not args.plain)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+pose_numbering.py translates residue numbers between PDB numbering (chain, residue number, insertion code) and Rosetta
+pose numbering (1 to N) for many structures at once.
+
+The complete map of a structure is built from its pose in one pass over pdb_info(), and saved in a disk cache keyed
+by the SHA-1 hash of the structure file, so structures that have been seen before (under any name) are never loaded
+again.  The cache doesn't record the PyRosetta flags used to load the pose; clear it (or use a different --cache_dir)
+if they change how structures are numbered.
+
+Used by the batch modes of scripts_rosetta/pdb2pose.py and scripts_rosetta/pose2pdb.py.  Queries are a table of
+(file, residue) lines; residues are pose numbers for pose2pdb and <number>[insertion code]<chain> (e.g. 45A, 45BA)
+for pdb2pose.
+"""
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import hashlib
+import os
+import re
+import sys
+
+CACHE_DIR = os.environ.get('POSE_NUMBERING_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'pose_numbering'))
+
+# The header of the batch output table.
+RESULT_HEADER = ['file', 'query', 'pose', 'chain', 'pdb_resnum', 'icode']
+
+PDB_RESIDUE = re.compile(r'^(-?\d+)([A-Za-z]?)(.)$')
+
+
+class NumberingError(Exception):
+    """
+    Exception class for residues or query tables that can't be translated.
+    """
+
+
+def file_hash(filename: str) -> str:
+    """
+    Hash the contents of a file.
+
+    :param filename: The file.
+    :return: The SHA-1 hex digest.
+    """
+
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def parse_pdb_residue(text: str) -> Tuple[str, int, str]:
+    """
+    Parse a PDB residue written as <number>[insertion code]<chain>, as pdb2pose.py takes them.
+
+    :param text: The residue, e.g. 45A or 45BA.
+    :return: A tuple of (chain, residue number, insertion code); the insertion code is ' ' if there is none.
+    """
+
+    match = PDB_RESIDUE.match(text.strip())
+    if match is None:
+        raise NumberingError("{text} is not a PDB residue (<number>[insertion code]<chain>).".format(text=text))
+    return match.group(3), int(match.group(1)), match.group(2) or ' '
+
+
+class NumberingMap:
+    """
+    The bidirectional PDB <-> pose numbering map of one structure.
+    """
+
+    def __init__(self, residues: List[Tuple[str, int, str]]):
+        """
+        Initialization of NumberingMap.
+
+        :param residues: The (chain, PDB residue number, insertion code) of each pose residue, in pose order.
+        """
+
+        self.residues = residues
+        self.index = {residue: posenum for posenum, residue in enumerate(residues, 1)}
+
+
+    @classmethod
+    def from_pose(cls, pose) -> 'NumberingMap':
+        """
+        Build the map of a pose.
+
+        :param pose: The PyRosetta pose.
+        :return: The map.
+        """
+
+        info = pose.pdb_info()
+        return cls([(info.chain(res), info.number(res), info.icode(res) or ' ') for res in range(1, pose.size() + 1)])
+
+
+    @classmethod
+    def load(cls, filename: str) -> 'NumberingMap':
+        """
+        Read a map saved by save().
+
+        :param filename: The map file.
+        :return: The map.
+        """
+
+        residues = []
+        with open(filename, 'r') as mapfile:
+            for line in mapfile:
+                chain, resnum, icode = line.rstrip('\n').split('\t')[1:4]
+                residues.append((chain, int(resnum), icode))
+        return cls(residues)
+
+
+    def save(self, filename: str):
+        """
+        Write the map as a table of pose number, chain, residue number and insertion code.  The file is written under
+        a temporary name and renamed, so other processes never see a partial map.
+
+        :param filename: The map file.
+        """
+
+        tmpname = filename + '.{pid}.tmp'.format(pid=os.getpid())
+        with open(tmpname, 'w') as mapfile:
+            for posenum, (chain, resnum, icode) in enumerate(self.residues, 1):
+                mapfile.write('{posenum}\t{chain}\t{resnum}\t{icode}\n'.format(posenum=posenum, chain=chain,
+                                                                               resnum=resnum, icode=icode))
+        os.replace(tmpname, filename)
+
+
+    def pdb2pose(self, chain: str, resnum: int, icode: str = ' ') -> int:
+        """
+        :return: The pose number of a PDB residue, or 0 if the pose doesn't have it (as pdb_info().pdb2pose()).
+        """
+
+        return self.index.get((chain, resnum, icode or ' '), 0)
+
+
+    def pose2pdb(self, posenum: int) -> Optional[Tuple[str, int, str]]:
+        """
+        :return: The (chain, residue number, insertion code) of a pose residue, or None if there is no such residue.
+        """
+
+        if 1 <= posenum <= len(self.residues):
+            return self.residues[posenum - 1]
+        return None
+
+
+def numbering_map(filename: str, load_pose: Callable, cache_dir: Optional[str] = CACHE_DIR) -> NumberingMap:
+    """
+    Get the numbering map of a structure, from the disk cache if it's been seen before.
+
+    :param filename: The structure file.
+    :param load_pose: A function loading a pose from a file (see rosetta_worker.py).
+    :param cache_dir: The cache directory, or None to not use the cache.
+    :return: The map.
+    """
+
+    if cache_dir is None:
+        return NumberingMap.from_pose(load_pose(filename))
+    cachename = os.path.join(cache_dir, file_hash(filename) + '.tsv')
+    if os.path.exists(cachename):
+        return NumberingMap.load(cachename)
+    numbering = NumberingMap.from_pose(load_pose(filename))
+    os.makedirs(cache_dir, exist_ok=True)
+    numbering.save(cachename)
+    return numbering
+
+
+def read_queries(filename: str) -> List[Tuple[str, str]]:
+    """
+    Read a query table: lines of file and residue, separated by tabs or spaces.  A header line starting with "file"
+    and blank or # lines are skipped.
+
+    :param filename: The query table, or - for stdin.
+    :return: A list of (file, residue) tuples.
+    """
+
+    queries = []
+    infile = sys.stdin if filename == '-' else open(filename, 'r')
+    with infile:
+        for line in infile:
+            fields = line.split()
+            if not fields or fields[0].startswith('#') or (not queries and fields[0] == 'file'):
+                continue
+            if len(fields) < 2:
+                raise NumberingError("Query line without a residue: {line}".format(line=line.rstrip()))
+            queries.append((fields[0], fields[1]))
+    return queries
+
+
+def translate(queries: Iterable[Tuple[str, str]], direction: str, load_pose: Callable,
+              cache_dir: Optional[str] = CACHE_DIR) -> Iterator[List[str]]:
+    """
+    Translate residues of many structures.  Each structure's map is built (or read from the cache) once, however many
+    queries it has.
+
+    :param queries: (file, residue) tuples.
+    :param direction: pdb2pose or pose2pdb.
+    :param load_pose: A function loading a pose from a file.
+    :param cache_dir: The cache directory, or None to not use the cache.
+    :return: An iterator over result rows (see RESULT_HEADER), in the order of queries.  Residues a structure
+    doesn't have give NA PDB fields (and a pose number of 0, for pdb2pose).
+    """
+
+    maps = {}  # type: Dict[str, NumberingMap]
+    for filename, residue in queries:
+        if filename not in maps:
+            maps[filename] = numbering_map(filename, load_pose, cache_dir)
+        numbering = maps[filename]
+        if direction == 'pdb2pose':
+            chain, resnum, icode = parse_pdb_residue(residue)
+            posenum = numbering.pdb2pose(chain, resnum, icode)
+            found = numbering.pose2pdb(posenum) if posenum else None
+        else:
+            if not residue.isdigit():
+                raise NumberingError("{residue} is not a pose residue number.".format(residue=residue))
+            posenum = int(residue)
+            found = numbering.pose2pdb(posenum)
+        if found is None:
+            yield [filename, residue, str(posenum), 'NA', 'NA', 'NA']
+        else:
+            yield [filename, residue, str(posenum), found[0], str(found[1]), found[2].strip()]
+
+
+def run_batch(args: List[str], load_pose: Callable, direction: str):
+    """
+    The batch mode of pdb2pose.py and pose2pdb.py: --batch <queries.tsv> [--output <results.tsv>] [--no_cache]
+    [--cache_dir <dir>].
+
+    :param args: The script's arguments.
+    :param load_pose: A function loading a pose from a file.
+    :param direction: pdb2pose or pose2pdb.
+    """
+
+    import argparse
+    parser = argparse.ArgumentParser(prog=direction + '.py', description='Translate residue numbers of many '
+                                     'structures, given as a table of file and residue lines.')
+    parser.add_argument('--batch', type=str, required=True, help='The query table, or - for stdin.')
+    parser.add_argument('--output', type=str, default='-', help='The output TSV, defaults to stdout.')
+    parser.add_argument('--cache_dir', type=str, default=CACHE_DIR, help='The numbering map cache, defaults to '
+                        '$POSE_NUMBERING_CACHE or ' + CACHE_DIR + '.')
+    parser.add_argument('--no_cache', action='store_true', help="Don't read or write the numbering map cache.")
+    args = parser.parse_args(args)
+
+    try:
+        queries = read_queries(args.batch)
+        outfile = sys.stdout if args.output == '-' else open(args.output, 'w')
+        try:
+            outfile.write('\t'.join(RESULT_HEADER) + '\n')
+            for row in translate(queries, direction, load_pose, None if args.no_cache else args.cache_dir):
+                outfile.write('\t'.join(row) + '\n')
+        finally:
+            if outfile is not sys.stdout:
+                outfile.close()
+    except NumberingError as err:
+        sys.exit(str(err))
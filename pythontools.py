@@ -1,33 +1,24 @@
 #Usage pullscores(pdbfile.pdb, output.csv, scoreterm1, scoreterm2, scoreterm3, ....)
 #Pulls the listed scoreterms from the pdbfile.pdb, and outputs them to output.csv.
-#NOT TESTED
-def pullscores(*arg):
-	#Set up filenames
-	pdbfilename = arg[0]
-	outputfilename = arg[1]
-	#Remove the filenames from arg.  What's left is the list of scoreterms.
-	arg.remove(arg[0])
-	arg.remove(arg[1])
-	#Open the pdb file for reading, and the output file for writing.
-	pdbfile = open(pdbfilename, 'r')
-	outputfile = open(outfilename, 'a')
+#The scoreterms are read from the end of the PDB file only (see pdbfooter.py).
+def pullscores(pdbfilename, outputfilename, *scoreterms):
+	#Import modules
+	from pdbfooter import read_footer
+	
+	#Read the footer terms (everything after the last comment line) into a dictionary.
+	footer = read_footer(pdbfilename)
 	
 	score_vals=[]
 	
 	#Loop over each requested scoreterm
-	for score_term in arg:
-		for pdbline in reversed(readlines(pdbfile)):
-			if pdbline.startswith('#'): #assumes all score terms are at the end of the file, no comments after them
-				print("WARNING: The scoreterm " + score_term + " was not found in the PDB file " + pdbfilename)
-				break
-			#Split the current line into scoreterm name and score.
-			(this_term, score)=pdbline.split()[:2]
-			#If we match the score term.
-			if this_term==score_term:
-				#Add the score term to the list of score values.
-				score_vals.append(score)
-				break
+	for score_term in scoreterms:
+		if score_term not in footer:
+			print("WARNING: The scoreterm " + score_term + " was not found in the PDB file " + pdbfilename)
+			continue
+		#Add the score term to the list of score values.
+		score_vals.append(footer[score_term])
 				
+	outfile = open(outputfilename, 'a')
 	outfile.write((', ').join(map(str, score_vals)))
 	outfile.write('\n')
 	outfile.close()
@@ -39,41 +30,16 @@ def pullscores(*arg):
 #The outer list contains one inner list per residue in the PDB file.
 #The outer list is returned.
 #If outfile is provided, writes the resulting list to file.
+#To read several scoreterms or many files at once, use pdbfooter.read_energy_table or pdbfooter.energy_tables directly.
 def scorebyres(pdbfilename, scoreterm="total", outfilename=""):
-	#Open the file for reading, as a list of lines.
-	pdbfile = open(pdbfilename, 'r').readlines()
+	#Import modules
+	from pdbfooter import read_energy_table
 	
-	#Remove lines up to the beginning of the pose energies table.
-	while True:
-		if pdbfile[0].startswith('#BEGIN_POSE_ENERGIES_TABLE'): break
-		pdbfile.remove(pdbfile[0])
-		
-	#Remove lines after the end of the pose energies table.
-	while True:
-		curlength = len(pdbfile) - 1
-		if pdbfile[curlength].startswith('#END_POSE_ENERGIES_TABLE'): break
-		pdbfile.remove(pdbfile[curlength])
-	
-	#Convert each line into a list, using whitespace as the delimiter.  Place this into the scoretable list.
-	scoretable = []
-	for pdbline in pdbfile:
-		scoretable.append(pdbline.split())
-		
-	#Search for scoreterm in the label row.
-	#First, fine the label row number.
-	for lineidx in range(len(scoretable)):
-		if scoretable[lineidx][0] == 'label':
-			#Now go through each item in that row.  Store the scoreterm row as scoretermcol.
-			for colidx in range(len(scoretable[lineidx])):
-				if scoretable[lineidx][colidx] == scoreterm:
-					scoretermcol = colidx
-					break
-
-	#Now, go through the scoretable again.  Pull out the residue identifier and the desired scoreterm and put in a list, reslist.  Skip the leading and ending rows.
-	reslist = []
-	for lineidx in range(len(scoretable)):
-		if (scoretable[lineidx][0].startswith('#') or scoretable[lineidx][0].startswith('label') or scoretable[lineidx][0].startswith('weights') or scoretable[lineidx][0].startswith('pose')): continue
-		reslist.append([scoretable[lineidx][0], scoretable[lineidx][scoretermcol]])
+	#Read the residue rows of the pose energies table (found by reading backwards from the end of the file).
+	scoretable = read_energy_table(pdbfilename, [scoreterm])
+	
+	#Pull out the residue identifier and the desired scoreterm and put in a list, reslist.
+	reslist = [[label, score] for label, score in zip(scoretable['label'].tolist(), scoretable[scoreterm].tolist())]
 		
 	#If outfilename is given, set up a file for output.
 	if (outfilename != ""):
@@ -82,6 +48,7 @@ def scorebyres(pdbfilename, scoreterm="total", outfilename=""):
 		for idx in range(len(reslist)):
 			outfile.write(','.join(map(str,reslist[idx])))
 			outfile.write('\n')
+		outfile.close()
 	
 	#Return the reslist.
 	return reslist;
@@ -91,6 +58,7 @@ def scorebyres(pdbfilename, scoreterm="total", outfilename=""):
 #Pulls a specific scoreterm for each residue in a PDB file.  By default, this is total_score.
 #If compare is specified, it computes (pdbfile score - compare pdb score), and outputs this.
 #If threshold is set, only those deltas whose absolute values are greater than threshold will be output.
+#To compare many designs to one parent, use compare_scorebyres_batch.
 
 def compare_scorebyres(pdbfile, scoreterm="total", compare="", threshold=0, outfilename=""):
 	#Create scoreterm lists for the two pdbfiles.
@@ -127,6 +95,67 @@ def compare_scorebyres(pdbfile, scoreterm="total", compare="", threshold=0, outf
 			
 	return outlist;
 	
+#Usage: pdb_residue_keys(pdbfile.pdb, labels)
+#Looks up the PDB identity of the residues of a pose energies table.  Each label (eg. ALA_12) ends in the pose number, and pose residue n is the nth residue of the ATOM/HETATM records.
+#Returns a list with the (chain, residue number, insertion code) of each label, or None where the pose number is past the residues of the file.
+def pdb_residue_keys(pdbfilename, labels):
+	#Import modules
+	from pdbatoms import read_atoms, residue_keys
+	
+	atoms, _ = read_atoms(pdbfilename)
+	keys = residue_keys(atoms)
+	posenums = [int(label.rsplit('_', 1)[-1]) for label in labels]
+	return [keys[posenum - 1] if 0 < posenum <= len(keys) else None for posenum in posenums]
+	
+#Usage: compare_scorebyres_batch(parent.pdb, [design1.pdb, design2.pdb, ...], scoreterms=("total",), threshold=0, outfilename="", processes=1)
+#Compares the per-residue scores of many designs to one parent.  The parent is read once, and the pose energies tables of all designs are read into one array (designs x residues x scoreterms).
+#The labels of the energies table end in the pose number (1..N), which shifts after any insertion or deletion.  Residues are instead matched by their PDB chain, residue number and insertion code, read from each file's ATOM/HETATM records, so designs with missing or extra residues don't misalign.
+#Returns (residues, deltas): the parent's residue labels, and an array of (design score - parent score) that is NaN where a design lacks a residue.
+#If outfilename is given, writes a long-format table with one line per design, residue and scoreterm whose delta has an absolute value greater than threshold (every line if threshold is 0).
+def compare_scorebyres_batch(parent, designs, scoreterms=("total",), threshold=0, outfilename="", processes=1):
+	#Import modules
+	import numpy as np
+	from pdbfooter import energy_tables, read_energy_table
+	
+	scoreterms = list(scoreterms)
+	
+	#Read the parent once, and index its residues by PDB chain, number and insertion code.
+	parenttable = read_energy_table(parent, scoreterms)
+	residues = parenttable['label'].tolist()
+	residx = dict((key, idx) for idx, key in enumerate(pdb_residue_keys(parent, residues)) if key is not None)
+	parentscores = np.stack([parenttable[term] for term in scoreterms], axis=-1)
+	
+	#Read every design, placing each residue at the parent residue with the same PDB chain, number and insertion code.
+	scores = np.full((len(designs), len(residues), len(scoreterms)), np.nan)
+	labels = np.full((len(designs), len(residues)), '', dtype=object)
+	for designidx, table in enumerate(energy_tables(designs, scoreterms, processes=processes)):
+		keys = pdb_residue_keys(designs[designidx], table['label'].tolist())
+		positions = np.array([residx.get(key, -1) for key in keys], dtype=int)
+		if len(table) != len(residues) or (positions == -1).any():
+			print("WARNING: " + designs[designidx] + " has " + str(len(table)) + " residues in its score table and " + parent + " has " + str(len(residues)) + ", and " + str(int((positions == -1).sum())) + " of its residues are not in " + parent + ".  Only residues with the same PDB chain and number are compared.")
+		found = positions != -1
+		scores[designidx, positions[found]] = np.stack([table[term] for term in scoreterms], axis=-1)[found]
+		labels[designidx, positions[found]] = table['label'][found]
+	
+	#Calculate all of the differences at once.
+	deltas = scores - parentscores[np.newaxis]
+	
+	#If outfilename is given, write every delta that passes the threshold.
+	if (outfilename != ""):
+		with np.errstate(invalid='ignore'):
+			keep = ~np.isnan(deltas)
+			if threshold != 0:
+				keep &= np.abs(deltas) > threshold
+		outfile = open(outfilename, 'w')
+		outfile.write(','.join(['design', 'parent_residue', 'design_residue', 'scoreterm', 'parent_score', 'design_score', 'delta']))
+		outfile.write('\n')
+		for designidx, resid, termidx in zip(*np.nonzero(keep)):
+			outfile.write(','.join(map(str, [designs[designidx], residues[resid], labels[designidx, resid], scoreterms[termidx], parentscores[resid, termidx], scores[designidx, resid, termidx], deltas[designidx, resid, termidx]])))
+			outfile.write('\n')
+		outfile.close()
+	
+	return residues, deltas;
+	
 #Usage: codopt(protein_sequence_string, dictionary_of_codons)
 #This function uses codon_tools to reverse translate a protein sequence back to DNA.  The DNA sequence is returned as a string.
 #usable_codons can be passed to create a custom set of codons to use.
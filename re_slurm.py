@@ -1,29 +1,24 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 #This script will attempt to execute any slurmit.py-generated sbatch submission script in the current directory.
-#It searches for any script named tmp_*.sh and submits it using sbatch.  If successful, the script is deleted.  If not, the script gets terminates.
-#Should be used alongside slurmit.py, in cases where slurm prevents submission of all of your jobs.  The failed jobs can be easily re-submitted in this way.
+#It searches for any script named tmp_*.sh and adds it to the submission queue (see slurm_queue.py), deleting the script.
+#The queue is then drained: scripts are submitted while the scheduler has room, backing off when SLURM refuses more jobs, instead of stopping at the first failure.
+#Should be used alongside slurmit.py, in cases where slurm prevents submission of all of your jobs.  Any slurm_queue.py drain options can be given, e.g. --max_pending 200 or --watch.
 
-import os, sys, subprocess, glob
+import glob
+import sys
 
-#This is an exception class to catch Argument errors.
-class ArgError(Exception):
-	def __init__(self, msg):
-		self.msg = msg
-		print(self.msg)
-			
-def main(argv):	
-	#Loop over all slurmit.py scripts in the current directory.  Assuming this is tmp_*.sh.
-	for script in glob.glob("tmp_*.sh"):
-		#Execute the script.  Keep the error code stored in code_sbatch.
+from slurm_queue import SubmitQueue, QUEUE_DIR, main as queue_main
+
+
+def main(argv):
+	#Queue all slurmit.py scripts in the current directory.  Assuming this is tmp_*.sh.
+	queue = SubmitQueue(QUEUE_DIR if '--queue' not in argv else argv[argv.index('--queue') + 1])
+	for script in sorted(glob.glob("tmp_*.sh")):
 		print(script)
-		code_sbatch = subprocess.call(['sbatch', script])
-			
-		#Clean up the script if code_sbatch is 0, which means that sbatch completed without an error.  Scripts that fail to submit won't be deleted for later re-submission.
-		if code_sbatch == 0:
-			#Delete the script.
-			os.remove(script)
-		else:
-			break
-		
+		queue.add_file(script, remove=True)
+
+	#Submit everything in the queue.
+	queue_main(['drain'] + argv)
+
 if __name__ == "__main__":
 	main(sys.argv[1:])
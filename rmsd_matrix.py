@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+rmsd_matrix.py computes all-vs-all RMSD matrices between PDB models with NumPy, without PyMOL.
+
+The selected atoms of every model are parsed once into an (N_models x N_atoms x 3) float32 array.  RMSDs are then
+computed block by block: with superposition (fit=True), the optimal rotation for every pair in a block comes from one
+batched SVD of the 3x3 covariance matrices (Kabsch), so intermediate arrays are only ever as large as one block.
+
+Requires numpy.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Tuple
+
+import numpy as np
+
+from pdbatoms import AtomSelection, PDBError, atom_keys, read_atoms
+
+# Number of models per side of a block of the pairwise matrix.
+DEFAULT_BLOCK = 256
+
+BCL_CORNER = 'bcl::storage::Table<double>'
+
+
+def _selected_atoms(args: Tuple[str, AtomSelection]) -> Tuple[List[tuple], np.ndarray]:
+    """
+    Read the selected atoms of one PDB file.  A module-level function so it can be sent to worker processes.
+
+    :param args: A tuple of (filename, selection).
+    :return: A tuple of (atom keys, coordinates).
+    """
+
+    filename, selection = args
+    atoms, coords = read_atoms(filename)
+    mask = selection.mask(atoms)
+    return atom_keys(atoms[mask]), coords[mask]
+
+
+def load_coords(filenames: List[str], selection: AtomSelection, processes: int = 1) -> np.ndarray:
+    """
+    Parse the selected atoms of every PDB file into one coordinate array.
+
+    Atoms are matched between files by chain, residue number, insertion code and atom name, in the order of the first
+    file.  Every file must contain every selected atom of the first file.
+
+    :param filenames: The PDB files.
+    :param selection: The atoms to use.
+    :param processes: The number of processes used to parse files, defaults to 1.
+    :return: An (N_models x N_atoms x 3) float32 array.
+    """
+
+    jobs = [(filename, selection) for filename in filenames]
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parsed = pool.map(_selected_atoms, jobs, chunksize=16)
+            return _stack(filenames, parsed)
+    return _stack(filenames, map(_selected_atoms, jobs))
+
+
+def _stack(filenames: List[str], parsed: Iterable[Tuple[List[tuple], np.ndarray]]) -> np.ndarray:
+    """
+    Stack parsed atoms into one array, matching atoms to the first model.
+
+    :param filenames: The PDB files, for error messages.
+    :param parsed: The (atom keys, coordinates) of each file, in order.
+    :return: An (N_models x N_atoms x 3) float32 array.
+    """
+
+    coords = None
+    refkeys = None
+    for idx, (keys, xyz) in enumerate(parsed):
+        if coords is None:
+            if not keys:
+                raise PDBError("No atoms were selected in {filename}.".format(filename=filenames[0]))
+            refkeys = keys
+            coords = np.empty((len(filenames), len(keys), 3), dtype=np.float32)
+        if keys != refkeys:
+            # Same atoms in a different order (or with extras): reorder to the first model.
+            order = {key: pos for pos, key in enumerate(keys)}
+            missing = [key for key in refkeys if key not in order]
+            if missing:
+                raise PDBError("{filename} is missing {count} selected atoms, e.g. {key}.".format(
+                    filename=filenames[idx], count=len(missing), key=' '.join(map(str, missing[0]))))
+            xyz = xyz[[order[key] for key in refkeys]]
+        coords[idx] = xyz
+    if coords is None:
+        raise PDBError("No PDB files given.")
+    return coords
+
+
+def _prepare(coords: np.ndarray, fit: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Convert a set of models to float64, centered if superposing, along with their squared norms.
+
+    :param coords: An (N x A x 3) coordinate array.
+    :param fit: Center the coordinates, for superposition.
+    :return: A tuple of (coordinates, squared norms).
+    """
+
+    xyz = np.asarray(coords, dtype=np.float64)
+    if fit:
+        xyz = xyz - xyz.mean(axis=1, keepdims=True)
+    return xyz, np.einsum('nak,nak->n', xyz, xyz)
+
+
+def rmsd_block(coords_a: np.ndarray, coords_b: np.ndarray, fit: bool = True) -> np.ndarray:
+    """
+    Compute the RMSD between every model of coords_a and every model of coords_b.
+
+    :param coords_a: An (I x A x 3) coordinate array.
+    :param coords_b: A (J x A x 3) coordinate array.
+    :param fit: Superimpose each pair before computing the RMSD (Kabsch).  If False, the RMSD of the coordinates as
+    they are is computed, like PyMOL's rms_cur/intra_rms_cur.
+    :return: An (I x J) float64 array of RMSDs.
+    """
+
+    natoms = coords_a.shape[1]
+    xa, ga = _prepare(coords_a, fit)
+    xb, gb = _prepare(coords_b, fit)
+
+    if fit:
+        # Covariance matrices of every pair: (I, 3, J, 3) -> (I, J, 3, 3).
+        cov = np.tensordot(xa, xb, axes=([1], [1])).transpose(0, 2, 1, 3)
+        sing = np.linalg.svd(cov, compute_uv=False)
+        # If the optimal orthogonal transform is a reflection, use the best proper rotation instead.
+        sing[..., 2] *= np.where(np.linalg.det(cov) < 0, -1.0, 1.0)
+        cross = sing.sum(axis=-1)
+    else:
+        cross = np.tensordot(xa, xb, axes=([1, 2], [1, 2]))
+
+    msd = (ga[:, None] + gb[None, :] - 2.0 * cross) / natoms
+    return np.sqrt(np.clip(msd, 0.0, None))
+
+
+def rmsd_matrix(coords: np.ndarray, fit: bool = True, block: int = DEFAULT_BLOCK) -> np.ndarray:
+    """
+    Compute the full all-vs-all RMSD matrix.  Only blocks on or above the diagonal are computed; the lower triangle is
+    filled in by symmetry.
+
+    :param coords: An (N x A x 3) coordinate array.
+    :param fit: Superimpose each pair (see rmsd_block).
+    :param block: The number of models per block.
+    :return: An (N x N) float64 array.
+    """
+
+    nmodels = coords.shape[0]
+    matrix = np.empty((nmodels, nmodels), dtype=np.float64)
+    for rstart in range(0, nmodels, block):
+        rend = min(rstart + block, nmodels)
+        for cstart in range(rstart, nmodels, block):
+            cend = min(cstart + block, nmodels)
+            values = rmsd_block(coords[rstart:rend], coords[cstart:cend], fit)
+            matrix[rstart:rend, cstart:cend] = values
+            matrix[cstart:cend, rstart:rend] = values.T
+    np.fill_diagonal(matrix, 0.0)
+    return matrix
+
+
+def write_bcl_table(filename: str, names: List[str], rows: Iterable[np.ndarray], mode: str = 'w'):
+    """
+    Write an RMSD matrix as a bcl::storage::Table<double>, the format BCL cluster reads (and paired_rmsds.py always
+    wrote).
+
+    :param filename: The output file.
+    :param names: The row/column labels (PDB file names).
+    :param rows: The matrix, as an iterable of (rows x N) blocks.
+    :param mode: The file open mode, defaults to w.
+    """
+
+    # Columns are as wide as the longest name plus two, but always wide enough to keep values apart.
+    width = max(max(len(name) for name in names) + 2, 12)
+    namefmt = '{:' + str(width) + 's}'
+    valfmt = '{:>' + str(width) + 'f}'
+    nameidx = 0
+    with open(filename, mode) as outfile:
+        outfile.write(namefmt.format(BCL_CORNER) + ''.join(('{:>' + str(width) + 's}').format(name) for name in names))
+        outfile.write('\n')
+        for block in rows:
+            for row in block:
+                outfile.write(namefmt.format(names[nameidx]) + ''.join(valfmt.format(val) for val in row.tolist()))
+                outfile.write('\n')
+                nameidx += 1
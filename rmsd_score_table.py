@@ -1,69 +1,228 @@
-from pymol import cmd
+#!/usr/bin/env python3
 
-#To be run from within pymol
 #This script will calculate the RMSD between a file (the root) and all other PDB files.
 #The results will be output to a file with selected Rosetta scoreterms included as well.
-#You can use "run rmsd_score_table.py" from the pymol terminal.
-#More likely, you want to run it from the command line, like so:
+#
+#Standalone (no PyMOL needed), for example:
+#rmsd_score_table.py --root pdb_file_to_compare_to.pdb --chains A --residues 1-100 --atoms CA --terms total_score,cstE,ligE --output table.csv --processes 8
+#Each PDB file is read once (coordinates and footer score terms together), and files are spread over --processes.
+#As with PyMOL's rms_cur, the RMSD is calculated without superposition unless --fit is given.
+#
+#The original PyMOL mode still works: edit the four variables below and run it from within pymol.
+#You can use "run rmsd_score_table.py" from the pymol terminal, or from the command line, like so:
 #pymol -qc rmsd_score_table.py
 
-#Change these four variables to match your specific case
+import argparse
+import os
+import sys
+
+#Whether we are being run from within PyMOL.  This has to be checked before anything imports pymol.
+IN_PYMOL = 'pymol' in sys.modules
+
+#Change these four variables to match your specific case (PyMOL mode only)
 rmsdroot = "pdb_file_to_compare_to.pdb"
 selector = "pymol selector for use in the RMSD calculation eg. chain a and resi 1-100 and name ca"
 outname = "output_score_table_name.csv"
-scores = ['total_score','cstE','ligE']			#List of score terms to include in the output csv table.  These should be exactly as seen in the output PDB footer.
-
-#Initialize a varaible for the header row of scoreterms.
-header = []
-#Add all of the scoreterms in scores to the header.
-header.extend(scores)
-#Add rmsd and description to the header.
-header.append("rmsd")
-header.append("description")
-
-#Open outfile for writing.
-outfile = open(outname, "a")
-#Add the header line to outfile.
-outfile.write(', '.join(header))
-outfile.write('\n')
-
-#Load the "root" PDB file (ie. the file that will be compared to all other pdb files.)
-cmd.load(rmsdroot, "root")
-#Iterate over all files in the directory.
-for filename in sorted(os.listdir(os.getcwd())):
-	#Initialize the list of scores.
-	score_vals = []
-	#If the file is a pdb file, load it as "decoy"
-	if filename.endswith(".pdb"):
-		cmd.load(filename, "decoy")
-	else: continue
-	#Calculate the RMSD between root and decoy over the atoms specified by selector.
-	rmsd = cmd.rms_cur("root and "+selector, "decoy and "+selector)
-	
-	#Read the PDB file into lines.
-	lines=open(filename).readlines()
-	#Iterate over each scoreterm in scores.
-	for score_term in scores:
-		#Going backwards through the PDB file, find the line starting with the current scoreterm.
-		#Exit if the scoreterm isn't found in the file.
-		for line in reversed(lines):
-			if line.startswith('#'):# assumes all score terms are at the end of the file, no comments after them
-				sys.exit(score_term+" was not found in "+filename)
-			#Split the line into the term name and the score.
-			(this_term, score)=line.split()[:2]
-			#If the term matches the desired scoreterm, store the score in score_vals and break (continue to next term).
-			if this_term==score_term:
-				score_vals.append(score)
-				break
-	
-	#Add the rmsd and filename to score_vals to complete that line of the table.
-	score_vals.append(rmsd)
-	score_vals.append(filename)
-	
-	#Add the scores to the outfile using CSV formatting.
-	outfile.write((', ').join(map(str, score_vals)))
-	outfile.write('\n')
-	#Delete the current decoy to make room for the next one and reduce memory footprint.
-	cmd.delete("decoy")
-
-outfile.close()
+scores = ['total_score','cstE','ligE']          #List of score terms to include in the output csv table.  These should be exactly as seen in the output PDB footer.
+scorefile = None            #Optionally, a merged scorefile (eg. "score_mg.sc" from merge_scores.py) to take the score terms from instead of each PDB footer.
+
+#Root coordinates and settings shared with worker processes in standalone mode.
+_root = None
+
+
+class ScoreTermError(Exception):
+    """
+    Exception class for score terms missing from a PDB footer.
+    """
+
+
+def run_pymol():
+    """
+    Build the table from within PyMOL, using the variables at the top of this script.
+    """
+
+    from pymol import cmd
+    from pdbfooter import read_footer
+
+    #If a merged scorefile is given, load just the needed columns (from its columnar cache, if there is one).
+    scoretable = None
+    if scorefile is not None:
+        from scorefile import ScoreFile
+        scoretable = ScoreFile(scorefile, columns=scores)
+
+    #Initialize a varaible for the header row of scoreterms.
+    header = []
+    #Add all of the scoreterms in scores to the header.
+    header.extend(scores)
+    #Add rmsd and description to the header.
+    header.append("rmsd")
+    header.append("description")
+
+    #Open outfile for writing.
+    outfile = open(outname, "a")
+    #Add the header line to outfile.
+    outfile.write(', '.join(header))
+    outfile.write('\n')
+
+    #Load the "root" PDB file (ie. the file that will be compared to all other pdb files.)
+    cmd.load(rmsdroot, "root")
+    #Iterate over all files in the directory.
+    for filename in sorted(os.listdir(os.getcwd())):
+        #Initialize the list of scores.
+        score_vals = []
+        #If the file is a pdb file, load it as "decoy"
+        if filename.endswith(".pdb"):
+            cmd.load(filename, "decoy")
+        else: continue
+        #Calculate the RMSD between root and decoy over the atoms specified by selector.
+        rmsd = cmd.rms_cur("root and "+selector, "decoy and "+selector)
+
+        #If we have the merged scorefile, look the terms up by description instead of reading the PDB file.
+        if scoretable is not None:
+            if filename[:-4] not in scoretable:
+                sys.exit(filename[:-4]+" was not found in "+scorefile)
+            for score_term in scores:
+                score_vals.append(scoretable.score(filename[:-4], score_term))
+        else:
+            #Read the footer terms from the end of the PDB file.
+            footer = read_footer(filename)
+            #Iterate over each scoreterm in scores, and exit if the scoreterm isn't found in the file.
+            for score_term in scores:
+                if score_term not in footer:
+                    sys.exit(score_term+" was not found in "+filename)
+                score_vals.append(footer[score_term])
+
+        #Add the rmsd and filename to score_vals to complete that line of the table.
+        score_vals.append(rmsd)
+        score_vals.append(filename)
+
+        #Add the scores to the outfile using CSV formatting.
+        outfile.write((', ').join(map(str, score_vals)))
+        outfile.write('\n')
+        #Delete the current decoy to make room for the next one and reduce memory footprint.
+        cmd.delete("decoy")
+
+    outfile.close()
+
+
+def _init_worker(root):
+    """
+    Store the root structure in each worker process.
+
+    :param root: A tuple of (root atom keys, root coordinates, selection, terms, fit).
+    """
+
+    global _root
+    _root = root
+
+
+def score_decoy(filename):
+    """
+    Read one decoy and calculate its row of the table: its footer score terms and its RMSD to the root.
+
+    :param filename: The decoy PDB file.
+    :return: A list of the score term values and the RMSD.
+    """
+
+    import numpy as np
+    from pdbatoms import PDBError, atom_keys, read_pdb
+    from rmsd_matrix import rmsd_block
+
+    rootkeys, rootcoords, selection, terms, fit = _root
+    atoms, coords, footer = read_pdb(filename)
+
+    mask = selection.mask(atoms)
+    keys = atom_keys(atoms[mask])
+    coords = coords[mask]
+    if keys != rootkeys:
+        order = {key: pos for pos, key in enumerate(keys)}
+        missing = [key for key in rootkeys if key not in order]
+        if missing:
+            raise PDBError("{filename} is missing {count} selected atoms, e.g. {key}.".format(
+                filename=filename, count=len(missing), key=' '.join(map(str, missing[0]))))
+        coords = coords[[order[key] for key in rootkeys]]
+    rmsd = float(rmsd_block(rootcoords[np.newaxis], coords[np.newaxis], fit)[0, 0])
+
+    values = []
+    for term in terms:
+        if term not in footer:
+            raise ScoreTermError(term + " was not found in " + filename)
+        values.append(footer[term])
+    return values + [rmsd]
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Calculate the RMSD of every PDB file to a root structure, and '
+                                     'tabulate it with score terms from the PDB footers.')
+    parser.add_argument('pdbs', nargs='*', help='The PDB files.  Defaults to every .pdb file in the current '
+                        'directory.')
+    parser.add_argument('--root', type=str, required=True, help='The PDB file that all other files are compared to.')
+    parser.add_argument('--atoms', type=str, default='CA', help='Comma-separated atom names to use, or "all".  '
+                        'Defaults to CA.')
+    parser.add_argument('--chains', type=str, help='Chain IDs to use, e.g. AB.  Defaults to all chains.')
+    parser.add_argument('--residues', type=str, help='Residue numbers to use, e.g. 1-100,120.  Defaults to all.')
+    parser.add_argument('--fit', action='store_true', help='Superimpose each structure on the root before '
+                        'calculating the RMSD.')
+    parser.add_argument('--terms', type=str, default=','.join(scores), help='Comma-separated score terms, as seen '
+                        'in the PDB footer.  Defaults to ' + ','.join(scores) + '.')
+    parser.add_argument('--scorefile', type=str, help='Take the score terms from this merged scorefile (e.g. '
+                        'score_mg.sc) instead of the PDB footers.')
+    parser.add_argument('--output', type=str, default='rmsd_score_table.csv', help='The output CSV table.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of processes reading PDB files.')
+    args = parser.parse_args(argv)
+
+    from concurrent.futures import ProcessPoolExecutor
+    from pdbatoms import AtomSelection, PDBError, atom_keys, read_atoms
+
+    pdblist = args.pdbs
+    if not pdblist:
+        pdblist = [name for name in sorted(os.listdir(os.getcwd())) if name.endswith(".pdb")]
+    terms = [term.strip() for term in args.terms.split(',') if term.strip()]
+
+    #Terms come from the merged scorefile if given, so the workers only need to compute RMSDs.
+    scoretable = None
+    if args.scorefile is not None:
+        from scorefile import ScoreFile
+        scoretable = ScoreFile(args.scorefile, columns=terms)
+
+    selection = AtomSelection.from_args(args.atoms, args.chains, args.residues)
+    rootatoms, rootcoords = read_atoms(args.root)
+    mask = selection.mask(rootatoms)
+    if not mask.any():
+        sys.exit("No atoms were selected in " + args.root)
+    root = (atom_keys(rootatoms[mask]), rootcoords[mask], selection, [] if scoretable else terms, args.fit)
+
+    with open(args.output, "w") as outfile:
+        outfile.write(', '.join(terms + ["rmsd", "description"]))
+        outfile.write('\n')
+
+        #Workers read files in parallel; map() hands the rows back in file order.
+        try:
+            if args.processes > 1:
+                with ProcessPoolExecutor(max_workers=args.processes, initializer=_init_worker,
+                                         initargs=(root,)) as pool:
+                    rows = list(pool.map(score_decoy, pdblist, chunksize=8))
+            else:
+                _init_worker(root)
+                rows = list(map(score_decoy, pdblist))
+        except (ScoreTermError, PDBError) as err:
+            sys.exit(str(err))
+
+        for filename, score_vals in zip(pdblist, rows):
+            if scoretable is not None:
+                description = os.path.basename(filename)[:-4]
+                if description not in scoretable:
+                    sys.exit(description + " was not found in " + args.scorefile)
+                score_vals = [scoretable.score(description, term) for term in terms] + score_vals
+            outfile.write(', '.join(map(str, score_vals + [os.path.basename(filename)])))
+            outfile.write('\n')
+
+
+if IN_PYMOL:
+    run_pymol()
+elif __name__ == "__main__":
+    main(sys.argv[1:])
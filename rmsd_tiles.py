@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+rmsd_tiles.py splits a large all-vs-all RMSD calculation into tiles of the upper triangle of the matrix.
+
+A tile directory holds the parsed coordinates (coords.npy), the model names (names.txt), the settings (tiles.json) and
+one file per finished tile (tile_RRRRR_CCCCC.npy).  Tiles are written atomically, so a killed job leaves no partial
+tiles behind and a rerun only computes the tiles that are missing.  Tiles can be computed by a local process pool or
+by the elements of a SLURM array (one tile per element), and are finally assembled into the BCL table or a
+memory-mapped .npy matrix.
+
+Requires numpy.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+import json
+import os
+
+import numpy as np
+
+from rmsd_matrix import rmsd_block
+
+DEFAULT_TILE = 2048
+
+# Coordinates of the tile set being worked on, opened once per worker process.
+_worker_tiles = None
+
+
+class TileError(Exception):
+    """
+    Exception class for incomplete or inconsistent tile directories.
+    """
+
+
+class TileSet:
+    """
+    A tiled all-vs-all RMSD calculation stored in a directory.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Open an existing tile directory.
+
+        :param directory: The tile directory, as made by TileSet.prepare().
+        """
+
+        self.directory = directory
+        settings_name = os.path.join(directory, 'tiles.json')
+        if not os.path.exists(settings_name):
+            raise TileError("{directory} is not a prepared tile directory.".format(directory=directory))
+        with open(settings_name, 'r') as settings:
+            self.settings = json.load(settings)
+        with open(os.path.join(directory, 'names.txt'), 'r') as namefile:
+            self.names = [line.rstrip('\n') for line in namefile]
+        self._coords = None
+
+
+    @classmethod
+    def prepare(cls, directory: str, names: List[str], coords: np.ndarray, tile: int = DEFAULT_TILE,
+                fit: bool = True) -> 'TileSet':
+        """
+        Create a tile directory.
+
+        :param directory: The tile directory.
+        :param names: The model names.
+        :param coords: The (N x A x 3) coordinates of the models.
+        :param tile: The number of models per side of a tile.
+        :param fit: Superimpose each pair (see rmsd_matrix.rmsd_block).
+        :return: The new TileSet.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'coords.npy'), coords)
+        with open(os.path.join(directory, 'names.txt'), 'w') as namefile:
+            namefile.writelines(name + '\n' for name in names)
+        with open(os.path.join(directory, 'tiles.json'), 'w') as settings:
+            json.dump({'nmodels': len(names), 'tile': tile, 'fit': fit}, settings, indent=1)
+        return cls(directory)
+
+
+    @property
+    def nmodels(self) -> int:
+        return self.settings['nmodels']
+
+
+    @property
+    def tile(self) -> int:
+        return self.settings['tile']
+
+
+    @property
+    def coords(self) -> np.ndarray:
+        if self._coords is None:
+            self._coords = np.load(os.path.join(self.directory, 'coords.npy'), mmap_mode='r')
+        return self._coords
+
+
+    @property
+    def nbands(self) -> int:
+        return (self.nmodels + self.tile - 1) // self.tile
+
+
+    def tiles(self) -> List[Tuple[int, int]]:
+        """
+        List the tiles on or above the diagonal.  The position of a tile in this list is its tile index.
+
+        :return: A list of (row band, column band) tuples.
+        """
+
+        return [(row, col) for row in range(self.nbands) for col in range(row, self.nbands)]
+
+
+    def tile_file(self, row: int, col: int) -> str:
+        return os.path.join(self.directory, 'tile_{row:05d}_{col:05d}.npy'.format(row=row, col=col))
+
+
+    def missing(self) -> List[int]:
+        """
+        Find the tiles that haven't been computed yet.
+
+        :return: The indices of the missing tiles.
+        """
+
+        return [idx for idx, (row, col) in enumerate(self.tiles()) if not os.path.exists(self.tile_file(row, col))]
+
+
+    def _band(self, band: int) -> slice:
+        return slice(band * self.tile, min((band + 1) * self.tile, self.nmodels))
+
+
+    def compute(self, index: int):
+        """
+        Compute one tile and write it to its file, unless it already exists.
+
+        :param index: The tile index.
+        """
+
+        row, col = self.tiles()[index]
+        filename = self.tile_file(row, col)
+        if os.path.exists(filename):
+            return
+        values = rmsd_block(self.coords[self._band(row)], self.coords[self._band(col)], self.settings['fit'])
+        if row == col:
+            np.fill_diagonal(values, 0.0)
+        # Write under a temporary name and rename, so an interrupted job never leaves a partial tile.
+        tmpname = filename[:-len('.npy')] + '.{pid}.tmp.npy'.format(pid=os.getpid())
+        np.save(tmpname, values.astype(np.float32))
+        os.replace(tmpname, filename)
+
+
+    def compute_missing(self, processes: int = 1) -> int:
+        """
+        Compute every missing tile.
+
+        :param processes: The number of worker processes.
+        :return: The number of tiles computed.
+        """
+
+        todo = self.missing()
+        if processes > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                     initargs=(self.directory,)) as pool:
+                list(pool.map(_compute_tile, todo))
+        else:
+            for index in todo:
+                self.compute(index)
+        return len(todo)
+
+
+    def _check_complete(self):
+        missing = self.missing()
+        if missing:
+            raise TileError("{count} of {total} tiles in {directory} have not been computed yet (e.g. tile "
+                            "{index}).".format(count=len(missing), total=len(self.tiles()), directory=self.directory,
+                                               index=missing[0]))
+
+
+    def iter_rows(self) -> Iterator[np.ndarray]:
+        """
+        Assemble the full matrix one band of rows at a time, so only one band is ever in memory.
+
+        :return: An iterator over (rows x N) float32 arrays, covering the matrix top to bottom.
+        """
+
+        self._check_complete()
+        for row in range(self.nbands):
+            rows = self._band(row)
+            band = np.empty((rows.stop - rows.start, self.nmodels), dtype=np.float32)
+            for col in range(self.nbands):
+                if col >= row:
+                    band[:, self._band(col)] = np.load(self.tile_file(row, col))
+                else:
+                    band[:, self._band(col)] = np.load(self.tile_file(col, row)).T
+            yield band
+
+
+    def to_npy(self, filename: str) -> np.ndarray:
+        """
+        Assemble the full matrix into a memory-mapped .npy file.
+
+        :param filename: The output .npy file.
+        :return: The memory-mapped (N x N) float32 matrix.
+        """
+
+        self._check_complete()
+        matrix = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32,
+                                           shape=(self.nmodels, self.nmodels))
+        for row, col in self.tiles():
+            values = np.load(self.tile_file(row, col))
+            matrix[self._band(row), self._band(col)] = values
+            matrix[self._band(col), self._band(row)] = values.T
+        matrix.flush()
+        return matrix
+
+
+def _init_worker(directory: str):
+    """
+    Open the tile set once in each worker process.
+
+    :param directory: The tile directory.
+    """
+
+    global _worker_tiles
+    _worker_tiles = TileSet(directory)
+
+
+def _compute_tile(index: int):
+    """
+    Compute one tile in a worker process.
+
+    :param index: The tile index.
+    """
+
+    _worker_tiles.compute(index)
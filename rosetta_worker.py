@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+rosetta_worker.py is a long-lived local worker that keeps PyRosetta initialized, so the scripts in scripts_rosetta/
+don't each pay the PyRosetta startup cost.
+
+The worker listens on a Unix socket and runs the scripts_rosetta scripts on request, one at a time.  Loaded poses are
+kept in an LRU cache keyed by the file's path and modification time, so querying the same structure again skips
+loading it (a changed file is reloaded).  Every script is a thin client: if a worker is running it sends its
+arguments there, otherwise it initializes PyRosetta and runs in its own process as before.
+
+Start a worker (it runs until stopped, so background it):
+    rosetta_worker.py &
+    rosetta_worker.py --cache 200 --flags "-ignore_unrecognized_res -extra_res_fa LIG.params" &
+Check on it, or stop it:
+    rosetta_worker.py --status
+    rosetta_worker.py --stop
+
+Cached poses are shared between requests, so scripts must not modify the poses they load (clone them first).
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import traceback
+
+# Default socket, one per user.
+SOCKET = os.environ.get('ROSETTA_WORKER_SOCKET',
+                        os.path.join(tempfile.gettempdir(), 'rosetta_worker_{uid}.sock'.format(uid=os.getuid())))
+
+# Flags PyRosetta is initialized with, as used by the scripts.
+DEFAULT_FLAGS = '-ignore_unrecognized_res'
+
+# Default number of poses kept in the cache.
+DEFAULT_CACHE = 64
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts_rosetta')
+
+# Whether PyRosetta has been initialized in this process.
+_initialized = False
+
+
+class WorkerError(Exception):
+    """
+    Exception class for failed requests to the worker.
+    """
+
+
+def init_rosetta(flags: str = DEFAULT_FLAGS):
+    """
+    Initialize PyRosetta once per process.
+
+    :param flags: The initialization flags.
+    """
+
+    global _initialized
+    if not _initialized:
+        import pyrosetta
+        pyrosetta.init(flags)
+        _initialized = True
+
+
+class PoseCache:
+    """
+    An LRU cache of loaded poses, keyed by absolute path and modification time.
+    """
+
+    def __init__(self, size: int = DEFAULT_CACHE):
+        """
+        Initialization of PoseCache.
+
+        :param size: The maximum number of poses kept.
+        """
+
+        self.size = size
+        self.poses = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def load(self, filename: str):
+        """
+        Get the pose for a file, loading it if it isn't cached or has changed since it was loaded.
+
+        :param filename: The structure file.
+        :return: The pose.  Shared with later requests, so don't modify it.
+        """
+
+        import pyrosetta
+        path = os.path.abspath(filename)
+        key = (path, os.stat(path).st_mtime_ns)
+        pose = self.poses.get(key)
+        if pose is not None:
+            self.poses.move_to_end(key)
+            self.hits += 1
+            return pose
+
+        self.misses += 1
+        pose = pyrosetta.pose_from_file(path)
+        # Drop poses of older versions of the same file, then the least recently used ones.
+        for old in [old for old in self.poses if old[0] == path]:
+            del self.poses[old]
+        self.poses[key] = pose
+        while len(self.poses) > self.size:
+            self.poses.popitem(last=False)
+        return pose
+
+
+def load_pose(filename: str):
+    """
+    Load a pose in-process, without a cache.  PyRosetta is initialized the first time a pose is needed.
+
+    :param filename: The structure file.
+    :return: The pose.
+    """
+
+    import pyrosetta
+    init_rosetta()
+    return pyrosetta.pose_from_file(filename)
+
+
+@contextlib.contextmanager
+def _capture(stdout, stderr):
+    """
+    Redirect the stdout and stderr file descriptors of this process into files, so output written by Rosetta's C++
+    code is captured as well as Python's.
+
+    :param stdout: An open binary file for stdout.
+    :param stderr: An open binary file for stderr.
+    """
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = os.dup(1), os.dup(2)
+    os.dup2(stdout.fileno(), 1)
+    os.dup2(stderr.fileno(), 2)
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+
+
+def _script(name: str):
+    """
+    Import a scripts_rosetta script.
+
+    :param name: The script name, without .py.
+    :return: The script module.
+    """
+
+    if not name.isidentifier() or not os.path.exists(os.path.join(SCRIPTS_DIR, name + '.py')):
+        raise WorkerError("No script named {name} in {scripts}.".format(name=name, scripts=SCRIPTS_DIR))
+    if SCRIPTS_DIR not in sys.path:
+        sys.path.insert(0, SCRIPTS_DIR)
+    module = importlib.import_module(name)
+    if not hasattr(module, 'run'):
+        raise WorkerError("{name} can't be run by the worker.".format(name=name))
+    return module
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    Handles one request: a JSON line with the command, and a JSON line back with the result.
+    """
+
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            response = self.server.worker.handle(request)
+        except Exception:
+            response = {'status': 1, 'stdout': '', 'stderr': traceback.format_exc()}
+        self.wfile.write((json.dumps(response) + '\n').encode())
+
+
+class Worker:
+    """
+    The worker: PyRosetta, the pose cache, and the socket it listens on.
+    """
+
+    def __init__(self, socket_name: str = SOCKET, cache: int = DEFAULT_CACHE, flags: str = DEFAULT_FLAGS):
+        """
+        Initialization of Worker.
+
+        :param socket_name: The Unix socket to listen on.
+        :param cache: The number of poses to cache.
+        :param flags: The PyRosetta initialization flags.
+        """
+
+        self.socket_name = socket_name
+        self.cache = PoseCache(cache)
+        self.flags = flags
+        self.requests = 0
+        self.server = None
+
+
+    def handle(self, request: Dict) -> Dict:
+        """
+        Carry out one request.
+
+        :param request: The request, with a command (run, status or stop) and, for run, the script name, its
+        arguments and the client's working directory.
+        :return: The response, with the exit status and captured stdout/stderr.
+        """
+
+        self.requests += 1
+        command = request.get('command')
+        if command == 'status':
+            status = {'pid': os.getpid(), 'requests': self.requests, 'cached': len(self.cache.poses),
+                      'cache_size': self.cache.size, 'hits': self.cache.hits, 'misses': self.cache.misses,
+                      'flags': self.flags}
+            return {'status': 0, 'stdout': json.dumps(status, indent=1) + '\n', 'stderr': ''}
+        if command == 'stop':
+            # Shut down from another thread, since serve_forever() is waiting on this request.
+            import threading
+            threading.Thread(target=self.server.shutdown).start()
+            return {'status': 0, 'stdout': 'Stopping worker {pid}.\n'.format(pid=os.getpid()), 'stderr': ''}
+        if command != 'run':
+            raise WorkerError("Unknown command {command}.".format(command=command))
+
+        module = _script(request['script'])
+        olddir = os.getcwd()
+        status = 0
+        with tempfile.TemporaryFile() as stdout, tempfile.TemporaryFile() as stderr:
+            with _capture(stdout, stderr):
+                try:
+                    os.chdir(request.get('cwd', olddir))
+                    module.run(request.get('args', []), self.cache.load)
+                except SystemExit as err:
+                    status = err.code if isinstance(err.code, int) else (0 if err.code is None else 1)
+                    if err.code is not None and not isinstance(err.code, int):
+                        print(err.code, file=sys.stderr)
+                except Exception:
+                    status = 1
+                    traceback.print_exc()
+                finally:
+                    os.chdir(olddir)
+            stdout.seek(0)
+            stderr.seek(0)
+            return {'status': status, 'stdout': stdout.read().decode(errors='replace'),
+                    'stderr': stderr.read().decode(errors='replace')}
+
+
+    def serve(self):
+        """
+        Initialize PyRosetta and serve requests until stopped.
+        """
+
+        if os.path.exists(self.socket_name):
+            if request(self.socket_name, {'command': 'status'}) is not None:
+                raise WorkerError("A worker is already listening on {socket}.".format(socket=self.socket_name))
+            # Left behind by a worker that was killed.
+            os.unlink(self.socket_name)
+
+        init_rosetta(self.flags)
+        self.server = socketserver.UnixStreamServer(self.socket_name, _Handler)
+        self.server.worker = self
+        os.chmod(self.socket_name, 0o600)
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if os.path.exists(self.socket_name):
+                os.unlink(self.socket_name)
+
+
+def request(socket_name: str, message: Dict) -> Optional[Dict]:
+    """
+    Send a request to a worker.
+
+    :param socket_name: The worker's Unix socket.
+    :param message: The request.
+    :return: The response, or None if no worker is listening on socket_name.
+    """
+
+    if not os.path.exists(socket_name):
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_name)
+            conn.sendall((json.dumps(message) + '\n').encode())
+            with conn.makefile('rb') as reply:
+                line = reply.readline()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+    if not line:
+        raise WorkerError("The worker on {socket} closed the connection without a reply.".format(socket=socket_name))
+    return json.loads(line.decode())
+
+
+def run_script(name: str, run: Callable[[List[str], Callable], None], args: List[str]):
+    """
+    Run a scripts_rosetta script in the worker if one is running, otherwise in this process.  Set
+    ROSETTA_WORKER_SOCKET to use a different socket, or to an empty string to never use a worker.
+
+    :param name: The script name, without .py.
+    :param run: The script's run(args, load_pose) function.
+    :param args: The script's command line arguments.
+    """
+
+    response = None
+    if SOCKET:
+        response = request(SOCKET, {'command': 'run', 'script': name, 'args': args, 'cwd': os.getcwd()})
+    if response is None:
+        run(args, load_pose)
+        return
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    if response['status']:
+        sys.exit(response['status'])
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Run a PyRosetta worker for the scripts in scripts_rosetta/, '
+                                     'keeping PyRosetta initialized and recently used poses loaded.')
+    parser.add_argument('--socket', type=str, default=SOCKET, help='The Unix socket to listen on, defaults to '
+                        '$ROSETTA_WORKER_SOCKET or ' + SOCKET + '.')
+    parser.add_argument('--cache', type=int, default=DEFAULT_CACHE, help='Number of poses to keep loaded, defaults '
+                        'to {cache}.'.format(cache=DEFAULT_CACHE))
+    parser.add_argument('--flags', type=str, default=DEFAULT_FLAGS, help='PyRosetta init flags, defaults to "' +
+                        DEFAULT_FLAGS + '".')
+    parser.add_argument('--status', action='store_true', help='Show the status of the running worker.')
+    parser.add_argument('--stop', action='store_true', help='Stop the running worker.')
+    args = parser.parse_args(argv)
+
+    if args.status or args.stop:
+        response = request(args.socket, {'command': 'stop' if args.stop else 'status'})
+        if response is None:
+            sys.exit("No worker is listening on " + args.socket)
+        sys.stdout.write(response['stdout'])
+        return
+
+    try:
+        Worker(args.socket, args.cache, args.flags).serve()
+    except WorkerError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+scorecache.py manages a columnar binary cache of a merged scorefile.
+
+The cache is a directory next to the scorefile (score_mg.sc -> score_mg.sc.cols/) holding one raw little-endian
+float64 file per score term, a string table for the description column (UTF-8 bytes plus int64 end offsets), and a
+JSON manifest.  Every file is append-only, so new rows can be added without rewriting old ones, and every column can be
+memory-mapped on its own, so readers only touch the columns they ask for.
+
+Requires numpy.
+"""
+
+from typing import Dict, Iterable, List, Optional
+
+import json
+import math
+import os
+
+import numpy as np
+
+from scorefile import file_stamp
+
+# Suffix added to the scorefile name to get the cache directory.
+CACHE_SUFFIX = '.cols'
+MANIFEST = 'manifest.json'
+CACHE_VERSION = 1
+
+FLOAT_DTYPE = np.dtype('<f8')
+OFFSET_DTYPE = np.dtype('<i8')
+
+
+class ScoreCacheError(Exception):
+    """
+    Exception class for missing, stale or inconsistent score caches.
+    """
+
+
+def cache_dir(scorefilename: str) -> str:
+    """
+    Get the cache directory for a scorefile.
+
+    :param scorefilename: The merged scorefile.
+    :return: The name of its cache directory.
+    """
+
+    return scorefilename + CACHE_SUFFIX
+
+
+class ScoreCache:
+    """
+    A columnar cache of a merged scorefile.
+    """
+
+    def __init__(self, directory: str):
+        """
+        Open an existing cache.
+
+        :param directory: The cache directory.
+        """
+
+        self.directory = directory
+        manifest_name = os.path.join(directory, MANIFEST)
+        if not os.path.exists(manifest_name):
+            raise ScoreCacheError("No score cache manifest in {directory}.".format(directory=directory))
+        with open(manifest_name, 'r') as manifest:
+            self.manifest = json.load(manifest)
+        if self.manifest.get('version') != CACHE_VERSION:
+            raise ScoreCacheError("Score cache {directory} was written by an incompatible version.".format(
+                directory=directory))
+
+
+    @classmethod
+    def create(cls, directory: str, header: List[str], namecol: str = 'description') -> 'ScoreCache':
+        """
+        Create a new, empty cache, replacing any existing one in directory.
+
+        :param directory: The cache directory.
+        :param header: The header of the scorefile.  Every column except namecol is stored as a float column.
+        :param namecol: The name of the column holding the pose name.
+        :return: The new ScoreCache.
+        """
+
+        os.makedirs(directory, exist_ok=True)
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+
+        columns = [col for col in header if col != namecol]
+        manifest = {'version': CACHE_VERSION, 'namecol': namecol, 'nrows': 0, 'header': list(header),
+                    'columns': [{'name': col, 'file': 'col_{idx:04d}.f8'.format(idx=idx)}
+                                for idx, col in enumerate(columns)],
+                    'sources': {}, 'scorefile': None}
+        for col in manifest['columns']:
+            open(os.path.join(directory, col['file']), 'wb').close()
+        open(os.path.join(directory, 'names.dat'), 'wb').close()
+        open(os.path.join(directory, 'names.off'), 'wb').close()
+        with open(os.path.join(directory, MANIFEST), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1)
+
+        return cls(directory)
+
+
+    @classmethod
+    def for_scorefile(cls, scorefilename: str) -> Optional['ScoreCache']:
+        """
+        Open the cache of a scorefile, if there is one and it matches the scorefile on disk.
+
+        :param scorefilename: The merged scorefile.
+        :return: The ScoreCache, or None if there is no current cache.
+        """
+
+        try:
+            cache = cls(cache_dir(scorefilename))
+        except ScoreCacheError:
+            return None
+        if cache.manifest.get('scorefile') != file_stamp(scorefilename):
+            return None
+        return cache
+
+
+    @property
+    def namecol(self) -> str:
+        return self.manifest['namecol']
+
+
+    @property
+    def header(self) -> List[str]:
+        return self.manifest['header']
+
+
+    @property
+    def columns(self) -> List[str]:
+        return [col['name'] for col in self.manifest['columns']]
+
+
+    @property
+    def nrows(self) -> int:
+        return self.manifest['nrows']
+
+
+    @property
+    def sources(self) -> Dict[str, Dict[str, int]]:
+        return self.manifest['sources']
+
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+
+    def column(self, name: str) -> np.ndarray:
+        """
+        Memory-map one score column.
+
+        :param name: The score term.
+        :return: A read-only float64 array with one value per row (NaN where the row had no numeric value).
+        """
+
+        for col in self.manifest['columns']:
+            if col['name'] == name:
+                if self.nrows == 0:
+                    return np.zeros(0, dtype=FLOAT_DTYPE)
+                return np.memmap(self._path(col['file']), dtype=FLOAT_DTYPE, mode='r', shape=(self.nrows,))
+        raise ScoreCacheError("Column {name} is not in the score cache {directory}.".format(name=name,
+                                                                                            directory=self.directory))
+
+
+    def names(self) -> List[str]:
+        """
+        Read the description column.
+
+        :return: The pose names, in row order.
+        """
+
+        if self.nrows == 0:
+            return []
+        blob = np.fromfile(self._path('names.dat'), dtype=np.uint8).tobytes()
+        ends = np.fromfile(self._path('names.off'), dtype=OFFSET_DTYPE, count=self.nrows)
+        starts = np.concatenate(([0], ends[:-1]))
+        return [blob[start:end].decode('utf-8') for start, end in zip(starts.tolist(), ends.tolist())]
+
+
+    def _trim(self):
+        """
+        Cut every data file back to the row count in the manifest, dropping anything left by an interrupted append.
+        """
+
+        nrows = self.nrows
+        for col in self.manifest['columns']:
+            with open(self._path(col['file']), 'r+b') as colfile:
+                colfile.truncate(nrows * FLOAT_DTYPE.itemsize)
+        with open(self._path('names.off'), 'r+b') as offfile:
+            offfile.truncate(nrows * OFFSET_DTYPE.itemsize)
+        namelen = 0
+        if nrows > 0:
+            namelen = int(np.fromfile(self._path('names.off'), dtype=OFFSET_DTYPE)[nrows - 1])
+        with open(self._path('names.dat'), 'r+b') as namefile:
+            namefile.truncate(namelen)
+
+
+    def append(self, names: List[str], values: Dict[str, Iterable[float]]):
+        """
+        Append rows to the cache.  The manifest is not saved; call save() once all appends are done.
+
+        :param names: The pose names of the new rows.
+        :param values: A dictionary of score term to the new rows' values.  Terms missing from the dictionary are
+        filled with NaN.
+        """
+
+        nnew = len(names)
+        if nnew == 0:
+            return
+
+        self._trim()
+        for col in self.manifest['columns']:
+            colvals = values.get(col['name'])
+            if colvals is None:
+                data = np.full(nnew, math.nan, dtype=FLOAT_DTYPE)
+            else:
+                data = np.asarray(colvals, dtype=FLOAT_DTYPE)
+            if data.shape != (nnew,):
+                raise ScoreCacheError("Column {name} has {got} values for {nnew} rows.".format(
+                    name=col['name'], got=data.shape[0], nnew=nnew))
+            with open(self._path(col['file']), 'ab') as colfile:
+                data.tofile(colfile)
+
+        encoded = [name.encode('utf-8') for name in names]
+        with open(self._path('names.dat'), 'ab') as namefile:
+            offset = namefile.tell()
+            namefile.write(b''.join(encoded))
+        ends = offset + np.cumsum([len(name) for name in encoded], dtype=OFFSET_DTYPE)
+        with open(self._path('names.off'), 'ab') as offfile:
+            ends.astype(OFFSET_DTYPE).tofile(offfile)
+
+        self.manifest['nrows'] += nnew
+
+
+    def save(self, scorefilename: Optional[str] = None):
+        """
+        Write the manifest.
+
+        :param scorefilename: If given, stamp the cache as matching this scorefile in its current state.
+        """
+
+        if scorefilename is not None:
+            self.manifest['scorefile'] = file_stamp(scorefilename)
+        tmpname = self._path(MANIFEST + '.tmp')
+        with open(tmpname, 'w') as manifest_file:
+            json.dump(self.manifest, manifest_file, indent=1)
+        os.replace(tmpname, self._path(MANIFEST))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+scorefile.py is a shared reader for Rosetta scorefiles (.sc) and merged score tables.
+
+The file is streamed once.  Only the requested score columns are kept (as compact float arrays), together with a hash
+index from description (pose name) to row, so looking up any number of poses costs a single pass over the file.
+"""
+
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import heapq
+import math
+import os
+
+# Extensions stripped from pose names in list files.
+PDB_EXTENSIONS = ['.pdb.gz', '.pdb']
+
+class ScoreFileError(Exception):
+    """
+    Exception class for malformed or incomplete scorefiles.
+    """
+
+
+def to_float(value: str) -> float:
+    """
+    Convert a scorefile field to a float, returning NaN for fields that are not numeric.
+
+    :param value: The text of the field.
+    :return: The field as a float, or NaN.
+    """
+
+    try:
+        return float(value)
+    except ValueError:
+        return math.nan
+
+
+def file_stamp(filename: str) -> Dict[str, int]:
+    """
+    Get the modification time and size of a file, used to decide whether a merge or cache is still current.
+
+    :param filename: The file to stamp.
+    :return: A dictionary with mtime (in ns) and size.
+    """
+
+    stat = os.stat(filename)
+    return {'mtime': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def read_names(listfilename: str) -> List[str]:
+    """
+    Read a list of pose names (one per line), as used by best_score.py.  A trailing .pdb/.pdb.gz extension is removed.
+
+    :param listfilename: The name of the list file.
+    :return: The list of pose names, in file order.
+    """
+
+    names = []
+    with open(listfilename, 'r') as listfile:
+        for line in listfile:
+            name = line.strip()
+            if not name:
+                continue
+            for ext in PDB_EXTENSIONS:
+                if name.endswith(ext):
+                    name = name[:-len(ext)]
+                    break
+            names.append(name)
+    return names
+
+
+def iter_rows(filename: str, with_lines: bool = False) -> Iterator:
+    """
+    Stream a scorefile, yielding the header once and then each data row as a list of fields.
+
+    Rosetta .sc files put every header and data line behind a "SCORE:" tag; anything else (e.g. SEQUENCE: lines) is
+    skipped.  Files without any SCORE: tag are treated as plain tables with a header on the first line.  Repeated
+    header lines (e.g. from cat-ing several scorefiles together) are dropped.
+
+    :param filename: The scorefile to read.
+    :param with_lines: If True, yield (fields, line) tuples so the original text can be written back out unchanged.
+    :return: An iterator over the header and the data rows.
+    """
+
+    with open(filename, 'r') as scorefile:
+        tagged = None
+        header = None
+        for line in scorefile:
+            if tagged is None:
+                if not line.strip():
+                    continue
+                tagged = line.startswith('SCORE:') or line.startswith('SEQUENCE:')
+            if tagged:
+                if not line.startswith('SCORE:'):
+                    continue
+                fields = line.split()[1:]
+            else:
+                fields = line.split()
+            if not fields:
+                continue
+            if header is None:
+                header = fields
+            elif fields == header:
+                continue
+            yield (fields, line) if with_lines else fields
+
+
+class ScoreFile:
+    """
+    A Rosetta scorefile, streamed once and indexed by description.
+    """
+
+    def __init__(self, filename: str, columns: Optional[Iterable[str]] = None, namecol: str = 'description',
+                 use_cache: bool = True):
+        """
+        Initialization of ScoreFile.  The file is read immediately.
+
+        :param filename: The scorefile to read.  Either a Rosetta .sc file (SCORE: lines) or a whitespace/tab
+        separated table whose first line is the header.
+        :param columns: The score columns to keep in memory.  Defaults to all columns.
+        :param namecol: The name of the column holding the pose name, defaults to description.
+        :param use_cache: If a current columnar cache (see scorecache.py / merge_scores.py) exists for filename, load
+        the columns from it instead of parsing the text.  Defaults to True.
+        """
+
+        self.filename = filename
+        self.namecol = namecol
+        self.header = []
+        self.names = []
+        self.index = {}
+        self.columns = {}
+        self._wanted = None if columns is None else list(columns)
+
+        if not (use_cache and self._read_cache()):
+            self._read()
+
+
+    def _read_cache(self) -> bool:
+        """
+        Load the requested columns from the scorefile's columnar cache, if it has a current one.
+
+        :return: True if the columns were loaded from the cache.
+        """
+
+        try:
+            from scorecache import ScoreCache
+        except ImportError:
+            return False
+        cache = ScoreCache.for_scorefile(self.filename)
+        if cache is None or cache.namecol != self.namecol:
+            return False
+
+        if self._wanted is None:
+            self._wanted = cache.columns
+        missing = [col for col in self._wanted if col not in cache.columns]
+        if missing:
+            raise ScoreFileError("Columns {missing} not found in {name}.".format(missing=', '.join(missing),
+                                                                                name=self.filename))
+
+        self.header = list(cache.header)
+        self.names = cache.names()
+        # Later rows for the same description replace earlier ones, as when reading the text.
+        self.index = {name: row for row, name in enumerate(self.names)}
+        self.columns = {col: cache.column(col) for col in self._wanted}
+        return True
+
+
+    def _read(self):
+        """
+        Read the scorefile, filling self.header, self.names, self.index and self.columns.
+        """
+
+        rows = iter_rows(self.filename)
+        try:
+            self.header = next(rows)
+        except StopIteration:
+            raise ScoreFileError("No header line found in {name}.".format(name=self.filename))
+
+        if self.namecol not in self.header:
+            raise ScoreFileError("No {col} column in the header of {name}.".format(col=self.namecol,
+                                                                                  name=self.filename))
+        namepos = self.header.index(self.namecol)
+
+        if self._wanted is None:
+            self._wanted = [col for col in self.header if col != self.namecol]
+        missing = [col for col in self._wanted if col not in self.header]
+        if missing:
+            raise ScoreFileError("Columns {missing} not found in {name}.".format(missing=', '.join(missing),
+                                                                                name=self.filename))
+
+        # Pair each kept column with its position in the row, and the float array holding it.
+        wanted = [(self.header.index(col), array('d')) for col in self._wanted]
+        self.columns = {col: values for col, (_, values) in zip(self._wanted, wanted)}
+        minlen = max([namepos] + [pos for pos, _ in wanted]) + 1
+
+        for fields in rows:
+            # Skip truncated rows (e.g. from a job killed while writing).
+            if len(fields) < minlen:
+                continue
+            name = fields[namepos]
+            # Later rows for the same description (e.g. from requeued jobs) replace earlier ones.
+            if name in self.index:
+                row = self.index[name]
+                for pos, values in wanted:
+                    values[row] = to_float(fields[pos])
+                continue
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            for pos, values in wanted:
+                values.append(to_float(fields[pos]))
+
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index
+
+
+    def score(self, name: str, term: str = 'total_score') -> float:
+        """
+        Look up a single score.
+
+        :param name: The pose name (description).
+        :param term: The score term, defaults to total_score.
+        :return: The score, as a float.
+        """
+
+        return self.columns[term][self.index[name]]
+
+
+    def row(self, name: str) -> Dict[str, float]:
+        """
+        Look up all kept columns for a pose.
+
+        :param name: The pose name (description).
+        :return: A dictionary of column name to score.
+        """
+
+        row = self.index[name]
+        return {col: values[row] for col, values in self.columns.items()}
+
+
+    def top_n(self, names: Iterable[str], topnum: int, term: str = 'total_score',
+              missing: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """
+        Select the best (lowest) scoring poses from names using a bounded heap.
+
+        :param names: The pose names to consider.
+        :param topnum: The number of poses to return.
+        :param term: The score term to rank by, defaults to total_score.
+        :param missing: If given, names not found in the scorefile are appended to this list.
+        :return: A list of (name, score) tuples, ordered best to worst.
+        """
+
+        values = self.columns[term]
+        candidates = []
+        for name in names:
+            row = self.index.get(name)
+            if row is None:
+                if missing is not None:
+                    missing.append(name)
+                continue
+            # Rows without a numeric score can't be ranked.
+            if math.isnan(values[row]):
+                continue
+            candidates.append((float(values[row]), name))
+
+        return [(name, score) for score, name in heapq.nsmallest(topnum, candidates)]
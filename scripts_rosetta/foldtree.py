@@ -1,19 +1,20 @@
-#!/usr/bin/python
-## usage: python pose2pdb.py <posefile>
+#!/usr/bin/env python3
+## usage: python foldtree.py <posefile>
+## Runs in the PyRosetta worker if one is running (see rosetta_worker.py), otherwise in this process.
 
 import os, sys
 
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rosetta_worker import run_script
 
-def main(argv):
-    args = sys.argv
-
-    pose = pose_from_pdb(args[1])
+def run(args, load_pose):
+    pose = load_pose(args[0])
     
-    print "The foldtree for pose " + args[1] + " is:\n"
-    print pose.fold_tree()
+    print("The foldtree for pose " + args[0] + " is:\n")
+    print(pose.fold_tree())
+
+def main(argv):
+    run_script('foldtree', run, argv)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
@@ -1,34 +1,87 @@
-#!/usr/bin/python
-## usage: python pairwisecst.py <posefile> <cstfile> <start_res> <end_res> <offset>
+#!/usr/bin/env python3
+## usage: python pairwisecst.py <posefile> <cstfile> <start_res> <end_res> <offset> [--cutoff <angstroms>] [--min_sep <residues>] [--stdev 0.2] [--verbose]
+## Writes a CA-CA AtomPair constraint for each pair of residues from start_res to end_res.
+## --cutoff only writes pairs closer than the cutoff, and --min_sep only pairs at least that many residues apart in sequence.
+## Runs in the PyRosetta worker if one is running (see rosetta_worker.py), otherwise in this process.
 
 
-import os, sys
+import os, sys, argparse
 
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rosetta_worker import run_script
 
 
-def main(argv):
-    args = sys.argv
+def pair_distances(coords, cutoff=None, min_sep=1):
+    """
+    Find the residue pairs to constrain, in order of first then second residue.
+    With a cutoff, a KD-tree finds the close pairs (if scipy is installed), so the full distance matrix is never built.
+    Returns the first and second indices into coords, and the distances.
+    """
+    import numpy as np
+
+    tree = None
+    if cutoff is not None:
+        try:
+            from scipy.spatial import cKDTree
+            tree = cKDTree(coords)
+        except ImportError:
+            tree = None
+
+    if tree is not None:
+        pairs = tree.query_pairs(cutoff, output_type='ndarray')
+        first, second = pairs[:, 0], pairs[:, 1]
+    else:
+        first, second = np.triu_indices(len(coords), k=1)
+
+    dists = np.linalg.norm(coords[first] - coords[second], axis=1)
+    keep = (second - first) >= min_sep
+    if cutoff is not None:
+        keep &= dists <= cutoff
+    first, second, dists = first[keep], second[keep], dists[keep]
+    order = np.lexsort((second, first))
+    return first[order], second[order], dists[order]
+
+
+def run(args, load_pose):
+    import numpy as np
 
-    pose_file = args[1]
-    cst_file = args[2]
-    start_res = int(args[3])
-    end_res = int(args[4])
-    apply_offset = int(args[5])
+    parser = argparse.ArgumentParser(prog='pairwisecst.py')
+    parser.add_argument('pose_file', type=str)
+    parser.add_argument('cst_file', type=str)
+    parser.add_argument('start_res', type=int)
+    parser.add_argument('end_res', type=int)
+    parser.add_argument('apply_offset', type=int)
+    parser.add_argument('--cutoff', type=float, help='Only constrain pairs with CA atoms closer than this (in A).')
+    parser.add_argument('--min_sep', type=int, default=1, help='Only constrain pairs at least this many residues apart.')
+    parser.add_argument('--stdev', type=str, default='0.2', help='The standard deviation of the HARMONIC function.')
+    parser.add_argument('--verbose', action='store_true', help='Print every pair and its distance.')
+    args = parser.parse_args(args)
 
-    pose = pose_from_pdb(pose_file)
+    pose = load_pose(args.pose_file)
 
-    with open(cst_file, 'w') as afile:
+    #Pull out the CA coordinates once.
+    residues = np.arange(args.start_res, args.end_res + 1)
+    coords = np.empty((len(residues), 3))
+    for idx, res in enumerate(residues.tolist()):
+        atom = pose.residue(res).xyz("CA")
+        coords[idx] = (atom.x, atom.y, atom.z)
+
+    first, second, dists = pair_distances(coords, args.cutoff, args.min_sep)
+    first = residues[first].tolist()
+    second = residues[second].tolist()
+    dists = dists.tolist()
+
+    if args.verbose:
+        sys.stdout.write(''.join(str(res1) + " " + str(res2) + " " + str(dist) + "\n" for res1, res2, dist in zip(first, second, dists)))
+
+    with open(args.cst_file, 'w') as afile:
         #afile.write('Resnum Phi Psi Omega\n')   #Some kind of header
-        for first_res in range(start_res,end_res):
-            atom1 = pose.residue(first_res).xyz("CA")
-            for second_res in range(first_res+1,end_res+1):
-                atom2 = pose.residue(second_res).xyz("CA")
-                diff_vector = atom1 - atom2
-                print str(first_res) + " " + str(second_res) + " " + str(diff_vector.norm)
-                afile.write('AtomPair CA ' + str(first_res + apply_offset) + ' CA ' + str(second_res + apply_offset) + ' HARMONIC ' + str(diff_vector.norm) + ' 0.2\n')
-                #print 'AtomPair CA ' + str(first_res) + ' CA ' + str(second_res) + ' HARMONIC ' + str(diff_vector.norm) + ' 0.2\n'
+        afile.write(''.join('AtomPair CA ' + str(res1 + args.apply_offset) + ' CA ' + str(res2 + args.apply_offset) + ' HARMONIC ' + str(dist) + ' ' + args.stdev + '\n'
+                            for res1, res2, dist in zip(first, second, dists)))
+    print("Wrote " + str(len(dists)) + " constraints to " + args.cst_file)
+
+def main(argv):
+    run_script('pairwisecst', run, argv)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
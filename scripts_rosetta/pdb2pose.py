@@ -1,19 +1,26 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 ## usage: python pdb2pose.py <posefile> <pdb1> <pdb2> <pdb3>.....
+## batch usage: python pdb2pose.py --batch <queries.tsv> [--output <results.tsv>]   (see pose_numbering.py)
+## Runs in the PyRosetta worker if one is running (see rosetta_worker.py), otherwise in this process.
 
 import os, sys
 
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rosetta_worker import run_script
 
-def main(argv):
-    args = sys.argv
+def run(args, load_pose):
+    if args and args[0].startswith('--batch'):
+        from pose_numbering import run_batch
+        run_batch(args, load_pose, 'pdb2pose')
+        return
 
-    pose = pose_from_pdb(args[1])
+    pose = load_pose(args[0])
     
-    for res in range(2,len(args)):
-        print("PDB residue " + str(args[res]) + " is Pose residue " + str(pose.pdb_info().pdb2pose(args[res][-1],int(args[res][0:-1]))))
+    for res in args[1:]:
+        print("PDB residue " + str(res) + " is Pose residue " + str(pose.pdb_info().pdb2pose(res[-1],int(res[0:-1]))))
+
+def main(argv):
+    run_script('pdb2pose', run, argv)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
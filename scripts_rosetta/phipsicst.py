@@ -1,33 +1,155 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 ## usage: python phipsicst.py <posefile> <cstfile> <start_res> <end_res> <offset>
+## Runs in the PyRosetta worker if one is running (see rosetta_worker.py), otherwise in this process.
+##
+## batch usage: python phipsicst.py --batch <pdb1> <pdb2> ... [--outdir <dir> | --combined <cstfile>] [--offset 0] [--processes 8]
+## Batch mode writes phi/psi constraints for every residue of every structure, computed with NumPy straight from the
+## N, CA and C coordinates (no PyRosetta).  Residues are numbered 1 to N in file order, counting residues with a
+## complete backbone, which is how Rosetta numbers a protein-only pose.  No phi constraint is written for the first
+## residue of a chain or after a chain break (C-N distance over 2 A), and no psi constraint before one.
+## Each structure gets <outdir>/<name>.cst (default: next to the PDB file), or all go into one --combined file.
 
 
-import os, sys
+import os, sys, argparse
 
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rosetta_worker import run_script
 
+#Longest C-N distance (in A) still treated as a peptide bond.
+PEPTIDE_BOND = 2.0
 
-def main(argv):
-    args = sys.argv
 
-    pose_file = args[1]
-    cst_file = args[2]
-    start_res = int(args[3])
-    end_res = int(args[4])
-    apply_offset = int(args[5])
+def run(args, load_pose):
+    pose_file = args[0]
+    cst_file = args[1]
+    start_res = int(args[2])
+    end_res = int(args[3])
+    apply_offset = int(args[4])
 
-    pose = pose_from_pdb(pose_file)
+    pose = load_pose(pose_file)
 
     with open(cst_file, 'w') as afile:
         for res in range(start_res,end_res+1):
             phi = pose.phi(res)
             psi = pose.psi(res)
-            print "Phi angle for " + str(res) + ": " + str(phi)
+            print("Phi angle for " + str(res) + ": " + str(phi))
             afile.write('Dihedral C ' + str(res - 1 + apply_offset) + ' N ' + str(res + apply_offset) + ' CA ' + str(res + apply_offset) + ' C ' + str(res + apply_offset) + ' HARMONIC ' + str(phi) + ' 20\n')
-            print "Psi angle for " + str(res) + ": " + str(psi)
+            print("Psi angle for " + str(res) + ": " + str(psi))
             afile.write('Dihedral N ' + str(res + apply_offset) + ' CA ' + str(res + apply_offset) + ' C ' + str(res + apply_offset) + ' N ' + str(res + 1 + apply_offset) + ' HARMONIC ' + str(psi) + ' 20\n')
 
+def dihedrals(p0, p1, p2, p3):
+    """
+    Dihedral angles (in degrees) of four (N x 3) arrays of points.
+    """
+    import numpy as np
+
+    b0 = p0 - p1
+    b1 = p2 - p1
+    b2 = p3 - p2
+    b1 = b1 / np.linalg.norm(b1, axis=1)[:, np.newaxis]
+    v = b0 - np.einsum('ij,ij->i', b0, b1)[:, np.newaxis] * b1
+    w = b2 - np.einsum('ij,ij->i', b2, b1)[:, np.newaxis] * b1
+    x = np.einsum('ij,ij->i', v, w)
+    y = np.einsum('ij,ij->i', np.cross(b1, v), w)
+    return np.degrees(np.arctan2(y, x))
+
+def backbone_dihedrals(filename):
+    """
+    Compute phi and psi for every residue of a PDB file.
+    Returns phi and psi arrays (NaN at termini and chain breaks), one value per residue with a complete backbone.
+    """
+    import numpy as np
+    from pdbatoms import AtomSelection, read_atoms
+
+    atoms, coords = read_atoms(filename, hetatm=False)
+    mask = AtomSelection(atoms=('N', 'CA', 'C')).mask(atoms)
+    atoms = atoms[mask]
+    coords = coords[mask]
+
+    #Collect the N, CA and C of each residue, in file order.
+    residx = {}
+    slots = {'N': 0, 'CA': 1, 'C': 2}
+    backbone = np.full((len(atoms), 3, 3), np.nan)
+    chains = []
+    for key, name, xyz in zip(zip(atoms['chain'].tolist(), atoms['resi'].tolist(), atoms['icode'].tolist()), atoms['name'].tolist(), coords):
+        if key not in residx:
+            residx[key] = len(residx)
+            chains.append(key[0])
+        backbone[residx[key], slots[name]] = xyz
+    backbone = backbone[:len(residx)]
+    complete = ~np.isnan(backbone).any(axis=(1, 2))
+    backbone = backbone[complete]
+    chains = np.array(chains)[complete]
+
+    N, CA, C = backbone[:, 0], backbone[:, 1], backbone[:, 2]
+    #Residue i is bonded to residue i+1 if they are in the same chain and the C-N distance is a peptide bond.
+    bonded = (chains[:-1] == chains[1:]) & (np.linalg.norm(C[:-1] - N[1:], axis=1) <= PEPTIDE_BOND)
+
+    phi = np.full(len(backbone), np.nan)
+    psi = np.full(len(backbone), np.nan)
+    if len(backbone) > 1:
+        phi[1:] = np.where(bonded, dihedrals(C[:-1], N[1:], CA[1:], C[1:]), np.nan)
+        psi[:-1] = np.where(bonded, dihedrals(N[:-1], CA[:-1], C[:-1], N[1:]), np.nan)
+    return phi, psi
+
+def dihedral_csts(job):
+    """
+    Build the dihedral constraint lines for one structure.  job is (filename, offset, stdev).
+    """
+    filename, apply_offset, stdev = job
+    phi, psi = backbone_dihedrals(filename)
+    lines = []
+    for res, (phival, psival) in enumerate(zip(phi.tolist(), psi.tolist()), 1):
+        if phival == phival:
+            lines.append('Dihedral C ' + str(res - 1 + apply_offset) + ' N ' + str(res + apply_offset) + ' CA ' + str(res + apply_offset) + ' C ' + str(res + apply_offset) + ' HARMONIC ' + str(phival) + ' ' + stdev + '\n')
+        if psival == psival:
+            lines.append('Dihedral N ' + str(res + apply_offset) + ' CA ' + str(res + apply_offset) + ' C ' + str(res + apply_offset) + ' N ' + str(res + 1 + apply_offset) + ' HARMONIC ' + str(psival) + ' ' + stdev + '\n')
+    return ''.join(lines)
+
+def run_batch(argv):
+    from concurrent.futures import ProcessPoolExecutor
+
+    parser = argparse.ArgumentParser(prog='phipsicst.py --batch', description='Write phi/psi dihedral constraints for many structures, without PyRosetta.')
+    parser.add_argument('pdbs', nargs='+', help='The PDB files.')
+    parser.add_argument('--outdir', type=str, help='Write <outdir>/<name>.cst for each structure.  Defaults to next to each PDB file.')
+    parser.add_argument('--combined', type=str, help='Write all constraints to this one file, with a # line naming each structure.')
+    parser.add_argument('--offset', type=int, default=0, help='Added to every residue number.')
+    parser.add_argument('--stdev', type=str, default='20', help='The standard deviation of the HARMONIC function, defaults to 20.')
+    parser.add_argument('--processes', type=int, default=1, help='Number of processes.')
+    args = parser.parse_args(argv)
+
+    jobs = [(pdb, args.offset, args.stdev) for pdb in args.pdbs]
+    if args.outdir is not None:
+        os.makedirs(args.outdir, exist_ok=True)
+    combined = open(args.combined, 'w') if args.combined is not None else None
+
+    pool = ProcessPoolExecutor(max_workers=args.processes) if args.processes > 1 else None
+    try:
+        results = pool.map(dihedral_csts, jobs, chunksize=8) if pool is not None else map(dihedral_csts, jobs)
+        for pdb, csts in zip(args.pdbs, results):
+            if combined is not None:
+                combined.write('# ' + pdb + '\n')
+                combined.write(csts)
+                continue
+            name = os.path.basename(pdb)
+            for ext in ['.gz', '.pdb']:
+                if name.endswith(ext):
+                    name = name[:-len(ext)]
+            outdir = args.outdir if args.outdir is not None else os.path.dirname(pdb)
+            with open(os.path.join(outdir, name + '.cst'), 'w') as afile:
+                afile.write(csts)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        if combined is not None:
+            combined.close()
+
+def main(argv):
+    if argv and argv[0] == '--batch':
+        run_batch(argv[1:])
+    else:
+        run_script('phipsicst', run, argv)
+
 if __name__ == "__main__":
     main(sys.argv[1:])
 
@@ -1,19 +1,26 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 ## usage: python pose2pdb.py <posefile> <res1> <res2> <res3>.....
+## batch usage: python pose2pdb.py --batch <queries.tsv> [--output <results.tsv>]   (see pose_numbering.py)
+## Runs in the PyRosetta worker if one is running (see rosetta_worker.py), otherwise in this process.
 
 import os, sys
 
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rosetta_worker import run_script
 
-def main(argv):
-    args = sys.argv
+def run(args, load_pose):
+    if args and args[0].startswith('--batch'):
+        from pose_numbering import run_batch
+        run_batch(args, load_pose, 'pose2pdb')
+        return
 
-    pose = pose_from_pdb(args[1])
+    pose = load_pose(args[0])
     
-    for res in range(2,len(args)):
-        print("Pose residue " + str(args[res]) + " is PDB residue " + str(pose.pdb_info().pose2pdb(int(args[res]))))
+    for res in args[1:]:
+        print("Pose residue " + str(res) + " is PDB residue " + str(pose.pdb_info().pose2pdb(int(res))))
+
+def main(argv):
+    run_script('pose2pdb', run, argv)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
-
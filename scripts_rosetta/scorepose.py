@@ -1,35 +1,39 @@
-#!/usr/bin/python
+#!/usr/bin/env python3
 ## usage: python scorepose.py <posefile> <weights>
+## Runs in the PyRosetta worker if one is running (see rosetta_worker.py), otherwise in this process.
 
 import os, sys, argparse
 
-from pyrosetta import *
-init("-ignore_unrecognized_res")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from rosetta_worker import run_script
+
+def run(args, load_pose):
+    from pyrosetta import create_score_function
 
-def main(argv):
     parser = argparse.ArgumentParser(description='My Description')
     parser.add_argument('posefile', type=str)
     parser.add_argument('-w', '--weights', type=str, default='talaris2013')
     parser.add_argument('-s', '--start', type=int)
     parser.add_argument('-e', '--end', type=int)
-    args = parser.parse_args()
+    args = parser.parse_args(args)
        
-    pose = pose_from_pdb(args.posefile)
+    #Score a copy, since the loaded pose may be shared with other requests in the worker.
+    pose = load_pose(args.posefile).clone()
     
     myscore = create_score_function(args.weights)
     myscore.show(pose)
     
     if args.start is None:
-        print
+        print()
     else:
-        try:
-            args.end
-        except:
-            print "Must define --end if you have defined --start."
+        if args.end is None:
+            print("Must define --end if you have defined --start.")
         else:
             for res in range(args.start,args.end):
                 pose.energies().show(res)
 
+def main(argv):
+    run_script('scorepose', run, argv)
+
 if __name__ == "__main__":
     main(sys.argv[1:])
-
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+slurm_ledger.py keeps a small SQLite ledger of the array elements of a slurmit.py job: for each index, its file, the
+submission that last ran it, and its state, exit code, runtime and max RSS.
+
+slurmit.py records every array submission (sbatch or --local) in <job>_ledger.sqlite.  Results are collected from
+the per-element exit code tables of --pack tasks and --local runs (<job>_exitcodes/), and from sacct for plain
+arrays (and for --pack tasks that died before recording their elements).
+
+Usage: slurm_ledger.py show <job>                       (update the ledger, and count the elements in each state)
+       slurm_ledger.py resubmit-failed <job> [--submit]  (the --array of the elements that failed or are missing)
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+from slurmit import array_spec, expand_array
+
+# States in which an element may still finish without being resubmitted.
+ACTIVE_STATES = ['SUBMITTED', 'PENDING', 'RUNNING', 'REQUEUED', 'RESIZING', 'SUSPENDED', 'CONFIGURING', 'COMPLETING']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    submit_id TEXT,
+    submitted REAL,
+    pack INTEGER,
+    argv TEXT
+);
+CREATE TABLE IF NOT EXISTS elements (
+    idx INTEGER PRIMARY KEY,
+    file TEXT,
+    submit_id TEXT,
+    task INTEGER,
+    submitted REAL,
+    state TEXT,
+    exit_code INTEGER,
+    runtime REAL,
+    max_rss_kb INTEGER
+);
+"""
+
+
+class LedgerError(Exception):
+    """
+    Exception class for jobs without a ledger, or ledgers that can't be updated.
+    """
+
+
+def ledger_name(jobname: str) -> str:
+    """
+    :return: The ledger file of a job, in the current directory (next to its logs and <job>_exitcodes/).
+    """
+
+    return jobname + '_ledger.sqlite'
+
+
+def rss_kb(text: str) -> Optional[int]:
+    """
+    Convert a sacct MaxRSS field (e.g. 1234K, 5.5M, 2G) to KB.
+
+    :param text: The MaxRSS field.
+    :return: The max RSS in KB, or None if the field is empty.
+    """
+
+    if not text:
+        return None
+    scale = {'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3}
+    if text[-1] in scale:
+        return int(float(text[:-1]) * scale[text[-1]])
+    return int(float(text)) // 1024
+
+
+def parse_sacct(output: str) -> Dict[Tuple[str, int], Dict]:
+    """
+    Parse sacct -P -n --format=JobID,State,ExitCode,ElapsedRaw,MaxRSS output into one record per array task.
+
+    :param output: The sacct output.
+    :return: A dictionary of (job id, task id) to a dictionary of state, exit_code, runtime and max_rss_kb.
+    """
+
+    tasks = {}
+    for line in output.splitlines():
+        fields = line.split('|')
+        if len(fields) < 5 or '_' not in fields[0]:
+            continue
+        jobid, step = (fields[0].split('.', 1) + [''])[:2]
+        submit_id, taskid = jobid.split('_', 1)
+        # Pending tasks are listed together, e.g. 123_[5-100%10].
+        taskids = expand_array(taskid.strip('[]')) if taskid.startswith('[') else [int(taskid)]
+        for task in taskids:
+            record = tasks.setdefault((submit_id, task), {'state': None, 'exit_code': None, 'runtime': None,
+                                                          'max_rss_kb': None})
+            rss = rss_kb(fields[4])
+            if rss is not None and (record['max_rss_kb'] is None or rss > record['max_rss_kb']):
+                record['max_rss_kb'] = rss
+            if step:
+                continue
+            record['state'] = fields[1].split()[0] if fields[1] else None
+            if fields[2]:
+                code, signal = (int(value) for value in fields[2].split(':'))
+                record['exit_code'] = 128 + signal if signal else code
+            record['runtime'] = float(fields[3]) if fields[3] else None
+    return tasks
+
+
+def run_sacct(jobids: List[str], sacct: str = 'sacct') -> str:
+    """
+    :return: The sacct records of jobs, or '' if sacct isn't available.
+    """
+
+    try:
+        return subprocess.run([sacct, '-j', ','.join(jobids), '-P', '-n',
+                               '--format=JobID,State,ExitCode,ElapsedRaw,MaxRSS'], stdout=subprocess.PIPE,
+                              universal_newlines=True).stdout
+    except FileNotFoundError:
+        return ''
+
+
+class Ledger:
+    """
+    The ledger of one job's array elements.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Initialization of Ledger.  The ledger is created if it doesn't exist.
+
+        :param filename: The SQLite file.
+        """
+
+        self.filename = filename
+        self.db = sqlite3.connect(filename)
+        self.db.executescript(SCHEMA)
+
+
+    @classmethod
+    def open_existing(cls, jobname: str) -> 'Ledger':
+        """
+        :return: The ledger of a job, which must exist.
+        """
+
+        if not os.path.exists(ledger_name(jobname)):
+            raise LedgerError("No ledger for {job} ({name}) in this directory.".format(job=jobname,
+                                                                                       name=ledger_name(jobname)))
+        return cls(ledger_name(jobname))
+
+
+    def close(self):
+        self.db.close()
+
+
+    def record_submission(self, submit_id: str, elements: List[Tuple[int, Optional[str]]], argv: List[str],
+                          pack: Optional[int] = None):
+        """
+        Record a submission of some of the job's elements.  Their earlier results are replaced.
+
+        :param submit_id: The SLURM job id, or "local" for --local runs.
+        :param elements: The (index, file) elements submitted, in --array order.
+        :param argv: The slurmit.py arguments, so the job can be resubmitted.
+        :param pack: The --pack value, if the elements are packed.
+        """
+
+        now = time.time()
+        with self.db:
+            self.db.execute("INSERT INTO submissions VALUES (?, ?, ?, ?)", (submit_id, now, pack, json.dumps(argv)))
+            self.db.executemany(
+                "INSERT OR REPLACE INTO elements VALUES (?, ?, ?, ?, ?, 'SUBMITTED', NULL, NULL, NULL)",
+                [(idx, arrayfile, submit_id, pos // pack if pack else idx, now)
+                 for pos, (idx, arrayfile) in enumerate(elements)])
+
+
+    def rename_submission(self, old_id: str, new_id: str):
+        """
+        Replace a placeholder submission id (e.g. of a script waiting in slurm_queue.py) by the SLURM job id.
+        """
+
+        with self.db:
+            self.db.execute("UPDATE submissions SET submit_id = ? WHERE submit_id = ?", (new_id, old_id))
+            self.db.execute("UPDATE elements SET submit_id = ? WHERE submit_id = ?", (new_id, old_id))
+
+
+    def last_argv(self) -> List[str]:
+        """
+        :return: The slurmit.py arguments of the last submission.
+        """
+
+        row = self.db.execute("SELECT argv FROM submissions ORDER BY submitted DESC LIMIT 1").fetchone()
+        if row is None:
+            raise LedgerError("No submissions in {name}.".format(name=self.filename))
+        return json.loads(row[0])
+
+
+    def read_exitcodes(self, exitdir: str):
+        """
+        Update the ledger from the exit code tables of --pack tasks and --local runs.  A row only counts if its table
+        was written after the element was last submitted, so tables left from earlier submissions are ignored.
+
+        :param exitdir: The <job>_exitcodes directory.
+        """
+
+        updates = []
+        for tablename in sorted(glob.glob(os.path.join(exitdir, '*.tsv')), key=os.path.getmtime):
+            mtime = os.path.getmtime(tablename)
+            with open(tablename, 'r') as table:
+                header = table.readline().rstrip('\n').split('\t')
+                for line in table:
+                    row = dict(zip(header, line.rstrip('\n').split('\t')))
+                    if not row.get('index') or not row.get('exit_code'):
+                        continue
+                    code = int(row['exit_code'])
+                    maxrss = int(row['max_rss_kb']) if row.get('max_rss_kb') else None
+                    updates.append(('COMPLETED' if code == 0 else 'FAILED', code, float(row['seconds']), maxrss,
+                                    int(row['index']), mtime))
+        with self.db:
+            self.db.executemany("UPDATE elements SET state = ?, exit_code = ?, runtime = ?, max_rss_kb = ? "
+                                "WHERE idx = ? AND submitted <= ?", updates)
+
+
+    def read_sacct(self, sacct: Callable[[List[str]], str] = run_sacct):
+        """
+        Update the ledger from sacct.  Plain array tasks are elements; elements of --pack tasks only take the task's
+        state if their task didn't record them (e.g. it was killed, or is still pending), as MISSING if it ended.
+
+        :param sacct: A function returning sacct output for a list of job ids.
+        """
+
+        jobids = [row[0] for row in self.db.execute("SELECT DISTINCT submit_id FROM elements WHERE state IN ({states})"
+                                                    .format(states=','.join('?' * len(ACTIVE_STATES))),
+                                                    ACTIVE_STATES)
+                  if row[0].isdigit()]
+        if not jobids:
+            return
+        tasks = parse_sacct(sacct(jobids))
+        packed = {row[0] for row in self.db.execute("SELECT submit_id FROM submissions WHERE pack IS NOT NULL")}
+
+        updates = []
+        for (submit_id, task), record in tasks.items():
+            if record['state'] is None:
+                continue
+            if submit_id in packed:
+                state = record['state'] if record['state'] in ACTIVE_STATES else 'MISSING'
+                updates.append((state, None, None, None, submit_id, task))
+            else:
+                updates.append((record['state'], record['exit_code'], record['runtime'], record['max_rss_kb'],
+                                submit_id, task))
+        with self.db:
+            self.db.executemany("UPDATE elements SET state = ?, exit_code = ?, runtime = ?, max_rss_kb = ? "
+                                "WHERE submit_id = ? AND task = ? AND state IN ({states})".format(
+                                    states=','.join('?' * len(ACTIVE_STATES))),
+                                [update + tuple(ACTIVE_STATES) for update in updates])
+
+
+    def update(self, exitdir: str, sacct: Callable[[List[str]], str] = run_sacct):
+        """
+        Update the ledger from the exit code tables, then from sacct.
+        """
+
+        if os.path.isdir(exitdir):
+            self.read_exitcodes(exitdir)
+        self.read_sacct(sacct)
+
+
+    def summary(self) -> Dict[str, int]:
+        """
+        :return: The number of elements in each state.
+        """
+
+        return dict(self.db.execute("SELECT state, COUNT(*) FROM elements GROUP BY state ORDER BY state"))
+
+
+    def unfinished(self) -> List[int]:
+        """
+        :return: The indices of the elements that failed or are missing: neither completed nor still active.
+        """
+
+        return [row[0] for row in self.db.execute(
+            "SELECT idx FROM elements WHERE state != 'COMPLETED' AND state NOT IN ({states}) ORDER BY idx".format(
+                states=','.join('?' * len(ACTIVE_STATES))), ACTIVE_STATES)]
+
+
+def replace_array(argv: List[str], spec: str) -> List[str]:
+    """
+    :return: slurmit.py arguments with --array replaced by spec.
+    """
+
+    newargv = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+        elif arg == '--array':
+            skip = True
+        elif not arg.startswith('--array='):
+            newargv.append(arg)
+    return newargv + ['--array', spec]
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Show the array elements of a slurmit.py job, and resubmit the ones '
+                                     'that failed or are missing.')
+    parser.add_argument('command', choices=['show', 'resubmit-failed'])
+    parser.add_argument('job', type=str, help='The job name (--job of slurmit.py).')
+    parser.add_argument('--submit', action='store_true', help='With resubmit-failed, rerun slurmit.py with the '
+                        'arguments of the last submission and the new --array.')
+    parser.add_argument('--sacct', type=str, default='sacct', help='The sacct command, defaults to sacct.')
+    args = parser.parse_args(argv)
+
+    try:
+        ledger = Ledger.open_existing(args.job)
+        ledger.update(args.job + '_exitcodes', lambda jobids: run_sacct(jobids, args.sacct))
+        for state, count in ledger.summary().items():
+            print("{state}: {count}".format(state=state, count=count))
+        if args.command == 'show':
+            return
+
+        failed = ledger.unfinished()
+        if not failed:
+            print("No failed or missing elements.")
+            return
+        spec = array_spec(failed)
+        print("--array " + spec)
+        if args.submit:
+            slurmit = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'slurmit.py')
+            newargv = replace_array(ledger.last_argv(), spec)
+            ledger.close()
+            sys.exit(subprocess.call([sys.executable, slurmit] + newargv))
+    except LedgerError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
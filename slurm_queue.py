@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+slurm_queue.py is an on-disk queue of SLURM scripts, drained by submitting them with sbatch at a rate the scheduler
+accepts.
+
+Scripts are added with "slurm_queue.py add" (or slurmit.py --queue, or re_slurm.py), each with the directory it
+should be submitted from.  "slurm_queue.py drain" then submits them in order.  Before each round it counts the user's
+pending jobs (array elements included) with squeue, and only submits while that count, plus the array elements of
+the scripts submitted since, is below --max_pending.  When sbatch is refused because of a submission limit (e.g.
+QOSMaxSubmitJobPerUserLimit), the script stays queued and the drain backs off exponentially; each successful
+submission speeds it back up.  Scripts sbatch rejects for other reasons are moved to failed/.  With --watch, the
+drain keeps running and submits scripts as they're added, so thousands of generated scripts go in without anyone
+re-running anything.
+
+The queue is a directory (default $SLURM_QUEUE or ~/.slurm_queue) of JSON entries in pending/, so it survives
+restarts.  Only one drain runs per queue at a time.  sbatch and squeue can be replaced (--sbatch, --squeue), e.g. by
+stub scripts for testing.
+
+Usage: slurm_queue.py add tmp_*.sh [--remove]
+       slurm_queue.py drain [--max_pending 500] [--watch]
+       slurm_queue.py status
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+import argparse
+import fcntl
+import getpass
+import json
+import os
+import subprocess
+import sys
+import time
+
+from slurmit import expand_array
+
+QUEUE_DIR = os.environ.get('SLURM_QUEUE', os.path.join(os.path.expanduser('~'), '.slurm_queue'))
+
+# sbatch errors that mean "not now": the script is kept and submitted again after a backoff.
+LIMIT_ERRORS = ['QOSMaxSubmitJobPerUserLimit', 'AssocMaxSubmitJobLimit', 'MaxSubmitJobLimit',
+                'Socket timed out', 'Resource temporarily unavailable', 'slurm_load_jobs error']
+
+
+class QueueError(Exception):
+    """
+    Exception class for queues that can't be used (e.g. another drain holds the lock).
+    """
+
+
+class SubmitQueue:
+    """
+    A directory of queued SLURM scripts: pending/ (one JSON entry each, submitted in name order), failed/ and a log
+    of submitted scripts.
+    """
+
+    def __init__(self, directory: str = QUEUE_DIR):
+        """
+        Initialization of SubmitQueue.  The directories are created if needed.
+
+        :param directory: The queue directory.
+        """
+
+        self.directory = directory
+        self.pending_dir = os.path.join(directory, 'pending')
+        self.failed_dir = os.path.join(directory, 'failed')
+        self.log = os.path.join(directory, 'submitted.log')
+        os.makedirs(self.pending_dir, exist_ok=True)
+        os.makedirs(self.failed_dir, exist_ok=True)
+        self._lockfile = None
+
+
+    def add(self, script: str, cwd: str, name: str, ledger: Optional[Dict[str, str]] = None) -> str:
+        """
+        Queue a script.
+
+        :param script: The text of the script.
+        :param cwd: The directory to submit it from (relative log paths are relative to it).
+        :param name: A name for the entry, e.g. the script's file name.
+        :param ledger: If the job has a ledger (see slurm_ledger.py), {'filename': ..., 'submit_id': ...} with the
+        placeholder submission id to replace by the SLURM job id once submitted.
+        :return: The entry's file.
+        """
+
+        entry = os.path.join(self.pending_dir, '{stamp:020d}_{name}.json'.format(stamp=time.time_ns(),
+                                                                                 name=os.path.basename(name)))
+        tmpname = entry + '.tmp'
+        with open(tmpname, 'w') as entryfile:
+            json.dump({'name': name, 'cwd': os.path.abspath(cwd), 'script': script, 'ledger': ledger}, entryfile)
+        # Renamed into place, so a drain never reads a partial entry.
+        os.replace(tmpname, entry)
+        return entry
+
+
+    def add_file(self, filename: str, remove: bool = False) -> str:
+        """
+        Queue a script file, to be submitted from its current directory.
+
+        :param filename: The script.
+        :param remove: Delete the script once it's queued.
+        :return: The entry's file.
+        """
+
+        with open(filename, 'r') as scriptfile:
+            entry = self.add(scriptfile.read(), os.getcwd(), filename)
+        if remove:
+            os.remove(filename)
+        return entry
+
+
+    def pending(self) -> List[str]:
+        """
+        :return: The pending entries, oldest first.
+        """
+
+        return [os.path.join(self.pending_dir, name) for name in sorted(os.listdir(self.pending_dir))
+                if name.endswith('.json')]
+
+
+    def lock(self):
+        """
+        Take the queue's drain lock.
+        """
+
+        self._lockfile = open(os.path.join(self.directory, 'drain.lock'), 'w')
+        try:
+            fcntl.flock(self._lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lockfile.close()
+            self._lockfile = None
+            raise QueueError("Another drain is already running on {queue}.".format(queue=self.directory))
+
+
+    def submit(self, entry: str, sbatch: str = 'sbatch') -> Tuple[str, str]:
+        """
+        Submit one entry.  Submitted entries are logged and removed, rejected ones moved to failed/, and ones refused
+        because of a submission limit left in pending/.
+
+        :param entry: The entry's file.
+        :param sbatch: The sbatch command.
+        :return: A tuple of (submitted, limit or failed; the job id, or sbatch's error).
+        """
+
+        with open(entry, 'r') as entryfile:
+            job = json.load(entryfile)
+        try:
+            result = subprocess.run([sbatch], input=job['script'], cwd=job['cwd'], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE, universal_newlines=True)
+        except FileNotFoundError:
+            raise QueueError("{sbatch} is not available.  Are you running in a SLURM environment?".format(
+                sbatch=sbatch))
+        message = (result.stdout + result.stderr).strip()
+
+        if result.returncode == 0 and result.stdout.split():
+            jobid = result.stdout.split()[-1]
+            with open(self.log, 'a') as logfile:
+                logfile.write('\t'.join([time.strftime('%Y-%m-%d %H:%M:%S'), jobid, job['cwd'], job['name']]) + '\n')
+            if job.get('ledger'):
+                from slurm_ledger import Ledger
+                ledger = Ledger(job['ledger']['filename'])
+                ledger.rename_submission(job['ledger']['submit_id'], jobid)
+                ledger.close()
+            os.remove(entry)
+            return 'submitted', jobid
+        if any(error in message for error in LIMIT_ERRORS):
+            return 'limit', message
+        job['error'] = message
+        with open(os.path.join(self.failed_dir, os.path.basename(entry)), 'w') as failfile:
+            json.dump(job, failfile)
+        os.remove(entry)
+        return 'failed', message
+
+
+def script_jobs(script: str) -> int:
+    """
+    :return: The number of jobs a SLURM script submits: the size of its #SBATCH --array, or 1.
+    """
+
+    for line in script.splitlines():
+        fields = line.replace('=', ' ').split()
+        if fields[:2] == ['#SBATCH', '--array'] and len(fields) > 2:
+            return len(expand_array(fields[2].split('%')[0]))
+    return 1
+
+
+def pending_jobs(squeue: str = 'squeue', user: Optional[str] = None) -> Optional[int]:
+    """
+    Count a user's pending jobs, with each array element counted separately (as submission limits count them).
+
+    :param squeue: The squeue command.
+    :param user: The user, defaults to the current one.
+    :return: The number of pending jobs, or None if squeue failed.
+    """
+
+    try:
+        result = subprocess.run([squeue, '-u', user or getpass.getuser(), '-h', '-r', '-t', 'PD', '-o', '%i'],
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+    except FileNotFoundError:
+        return None
+    if result.returncode != 0:
+        return None
+    return len(result.stdout.split())
+
+
+def drain(queue: SubmitQueue, max_pending: int = 500, interval: float = 1.0, min_interval: float = 0.1,
+          backoff: float = 30.0, max_backoff: float = 900.0, watch: bool = False, poll: float = 60.0,
+          sbatch: str = 'sbatch', count_pending: Callable[[], Optional[int]] = pending_jobs,
+          sleep: Callable[[float], None] = time.sleep) -> Dict[str, int]:
+    """
+    Submit the queued scripts, keeping the user's pending jobs below max_pending.  The delay between submissions
+    halves after each success (down to min_interval); a submission limit error waits, then doubles the wait (up to
+    max_backoff).
+
+    :param queue: The queue.
+    :param max_pending: Don't submit while the user has this many pending jobs.
+    :param interval: The starting delay between submissions, in seconds.
+    :param min_interval: The shortest delay between submissions.
+    :param backoff: The first wait after a submission limit error.
+    :param max_backoff: The longest wait.
+    :param watch: Keep running when the queue is empty, waiting for new scripts.
+    :param poll: How long to wait before looking again when the queue is empty or too many jobs are pending.
+    :param sbatch: The sbatch command.
+    :param count_pending: A function returning the user's pending job count, or None if it can't be counted.
+    :param sleep: The function used to wait.
+    :return: The number of scripts submitted and failed.
+    """
+
+    counts = {'submitted': 0, 'failed': 0}
+    delay = interval
+    wait = backoff
+    while True:
+        entries = queue.pending()
+        if not entries:
+            if not watch:
+                return counts
+            sleep(poll)
+            continue
+
+        npending = count_pending()
+        if npending is not None and npending >= max_pending:
+            print("{num} jobs pending, waiting.".format(num=npending))
+            sleep(poll)
+            continue
+        # Without a pending count, submit one script at a time.
+        room = 1 if npending is None else max_pending - npending
+
+        for entry in entries:
+            # Each script takes up room for all its array elements, as squeue counts them.
+            if room <= 0:
+                break
+            with open(entry, 'r') as entryfile:
+                njobs = script_jobs(json.load(entryfile)['script'])
+            status, message = queue.submit(entry, sbatch)
+            if status == 'limit':
+                print("Submission limit reached, waiting {wait:.0f} s: {message}".format(wait=wait, message=message))
+                sleep(wait)
+                wait = min(max_backoff, wait * 2)
+                delay = min(max_backoff, delay * 2)
+                break
+            counts[status] += 1
+            if status == 'submitted':
+                room -= njobs
+                print("Submitted {name} as {jobid}.".format(name=os.path.basename(entry), jobid=message))
+                delay = max(min_interval, delay / 2)
+                wait = backoff
+            else:
+                print("sbatch rejected {name}, moved to failed/: {message}".format(name=os.path.basename(entry),
+                                                                                  message=message))
+            sleep(delay)
+
+
+def main(argv):
+    """
+    main()
+    """
+
+    parser = argparse.ArgumentParser(description='Queue SLURM scripts on disk and submit them at a rate the '
+                                     'scheduler accepts.')
+    parser.add_argument('command', choices=['add', 'drain', 'status'])
+    parser.add_argument('scripts', nargs='*', help='With add, the scripts to queue.')
+    parser.add_argument('--queue', type=str, default=QUEUE_DIR, help='The queue directory, defaults to $SLURM_QUEUE '
+                        'or ' + QUEUE_DIR + '.')
+    parser.add_argument('--remove', action='store_true', help='With add, delete the scripts once queued.')
+    parser.add_argument('--max_pending', type=int, default=500, help="Don't submit while this many of your jobs "
+                        "(array elements) are pending, defaults to 500.")
+    parser.add_argument('--interval', type=float, default=1.0, help='The starting delay between submissions, in '
+                        'seconds.')
+    parser.add_argument('--backoff', type=float, default=30.0, help='The first wait after a submission limit error, in '
+                        'seconds; doubled after each one.')
+    parser.add_argument('--max_backoff', type=float, default=900.0, help='The longest wait, in seconds.')
+    parser.add_argument('--poll', type=float, default=60.0, help='How often to look again when the queue is empty or '
+                        'too many jobs are pending, in seconds.')
+    parser.add_argument('--watch', action='store_true', help='Keep running, submitting scripts as they are added.')
+    parser.add_argument('--sbatch', type=str, default='sbatch', help='The sbatch command.')
+    parser.add_argument('--squeue', type=str, default='squeue', help='The squeue command.')
+    args = parser.parse_args(argv)
+
+    queue = SubmitQueue(args.queue)
+    try:
+        if args.command == 'add':
+            for script in args.scripts:
+                queue.add_file(script, args.remove)
+            print("Queued {num} scripts in {queue}.".format(num=len(args.scripts), queue=args.queue))
+        elif args.command == 'status':
+            print("pending: {num}".format(num=len(queue.pending())))
+            print("failed: {num}".format(num=len(os.listdir(queue.failed_dir))))
+        else:
+            queue.lock()
+            counts = drain(queue, args.max_pending, args.interval, backoff=args.backoff, max_backoff=args.max_backoff,
+                           watch=args.watch, poll=args.poll, sbatch=args.sbatch,
+                           count_pending=lambda: pending_jobs(args.squeue))
+            print("Submitted {submitted}, failed {failed}.".format(**counts))
+    except QueueError as err:
+        sys.exit(str(err))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,13 +3,36 @@
 slurmit.py is a script used to submit jobs to a SLURM processor automatically.
 """
 
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 import argparse
 import glob
 import os
+import shlex
 import subprocess
 import sys
+import time
+
+# The columns of the per-element exit code tables written by --pack tasks and --local runs.
+PACK_HEADER = ['index', 'file', 'exit_code', 'seconds', 'max_rss_kb']
+
+# Runs a command (argv[2:]) and writes its max RSS in KB to the file descriptor argv[1], exiting as the command did.
+# A forked child starts with its parent's peak RSS, so the command is forked from this small interpreter rather than
+# from slurmit.py, whose own memory would otherwise be counted.
+RSS_WRAPPER = """
+import os, resource, signal, sys
+pid = os.fork()
+if pid == 0:
+    os.execvp(sys.argv[2], sys.argv[2:])
+status = os.waitpid(pid, 0)[1]
+os.write(int(sys.argv[1]), str(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss).encode())
+if os.WIFSIGNALED(status):
+    if os.WTERMSIG(status) not in (signal.SIGKILL, signal.SIGSTOP):
+        signal.signal(os.WTERMSIG(status), signal.SIG_DFL)
+    os.kill(os.getpid(), os.WTERMSIG(status))
+sys.exit(os.waitstatus_to_exitcode(status))
+"""
 
 # This is an exception class to catch Argument errors.
 class ArgError(Exception):
@@ -186,6 +209,17 @@ class SlurmBuilder:
         :param args: The result of self.parser.parse_args()
         """
 
+        # --queue and --local are other ways of running the script.
+        if args.queue and (args.local is not None or args.no_slurm):
+            raise ArgError("--queue submits the script to SLURM later, so it can't be used with --local or "
+                           "--no_slurm.")
+
+        # --local replaces --no_slurm, and needs at least one worker.
+        if args.local is not None and args.no_slurm:
+            raise ArgError("You have given both --local and --no_slurm.  --local runs the whole job without SLURM.")
+        if args.local is not None and args.local < 1:
+            raise ArgError("--local must be at least 1.")
+
         # If the user specifies --outfiles (identical prefixes for the log and the error files), they cannot specifiy
         # either --output or --error.
         if args.outfiles is not None and (args.log is not None or args.err is not None):
@@ -228,6 +262,10 @@ class SlurmBuilder:
                 raise ArgError("You have created an array submission with --arraygen without putting '$file' in the "
                                "--command parameter.")
 
+            # --pack groups array elements into tasks, so it needs at least one element per task.
+            if args.pack is not None and args.pack < 1:
+                raise ArgError("--pack must be at least 1.")
+
             # If we are using special filename arrays, make sure arrayformat contains arr and [$job].
             if args.arrayformat is not None and '$arr' not in args.arrayformat and '${arr' not in args.arrayformat:
                 raise ArgError("You have given --arrayformat without referencing $arr.  The $arr variable is used to "
@@ -241,6 +279,8 @@ class SlurmBuilder:
                 raise ArgError("You have given --arrayformat, but aren't using --arraygen.")
             if args.sleep is not None:
                 raise ArgError("You have given --sleep, but aren't using --array or --arraygen.")
+            if args.pack is not None:
+                raise ArgError("You have given --pack, but aren't using --array or --arraygen.")
 
 
     @staticmethod
@@ -252,10 +292,12 @@ class SlurmBuilder:
         :return: The processed args.
         """
 
-        # If outfiles, outfiles, log, and err are all empty, generate log and err based on jobname.
+        # If outfiles, outfiles, log, and err are all empty, generate log and err based on jobname.  Elements of
+        # --local arrays run at the same time, so each gets its own files.
         if args.outfiles is None and args.log is None and args.err is None:
-            args.log = args.job + '.log'
-            args.err = args.job + '.err'
+            suffix = '_%a' if args.local is not None and (args.array is not None or args.arraygen is not None) else ''
+            args.log = args.job + suffix + '.log'
+            args.err = args.job + suffix + '.err'
 
         # If outfiles is defined, set log and err based on outfiles.
         if args.outfiles is not None:
@@ -279,6 +321,18 @@ class SlurmBuilder:
         if args.arraygen is not None and args.arrayformat is None:
             args.arrayformat = '${arr[$job]}'
 
+        # With --pack, --array still lists the elements (files) to run, and the SLURM array becomes one task per
+        # --pack elements.  Any % throttle applies to the tasks.
+        args.pack_elements = None
+        if args.pack is not None:
+            args.pack_elements = args.array.split('%')[0]
+            numtasks = -(-len(expand_array(args.pack_elements)) // args.pack)
+            args.array = "0-" + str(numtasks - 1) + (args.array[args.array.find('%'):] if '%' in args.array else '')
+
+        # Queued scripts are throttled by slurm_queue.py, so they don't need the default start delay.
+        if args.queue and args.begin == 'now+5minutes':
+            args.begin = 'now'
+
         # If args.openmode is not defined, set it according to whether requeue is set.
         # If it is defined, use whatever the user said.
         if args.openmode is None:
@@ -337,8 +391,17 @@ class SlurmBuilder:
             if args.sleep:
                 script.append("sleep $( expr " + str(args.sleep) + " \* $SLURM_ARRAY_TASK_ID )")
 
-        # Add the command line to the bottom of the script.  If using a "special" array, run it with srun.
-        if args.arraygen is not None:
+        # Add the command line to the bottom of the script.  With --pack, this task's elements are run by a worker
+        # pool (see run_pack).  If using a "special" array, run it with srun.
+        if args.pack is not None:
+            worker = ['python3', os.path.abspath(__file__), 'pack-worker', '--task', '$job', '--pack', str(args.pack),
+                      '--elements', args.pack_elements, '--workers', str(args.cpus), '--command', args.command,
+                      '--exitdir', args.job + '_exitcodes']
+            if args.arraygen is not None:
+                worker += ['--arraygen', args.arraygen, '--arrayformat', args.arrayformat]
+            # $job is expanded by the task's shell; everything else is passed through as is.
+            script.append(' '.join('"$job"' if word == '$job' else shlex.quote(word) for word in worker))
+        elif args.arraygen is not None:
             script.append("arr=(" + args.arraygen + ")")
             script.append("file=" + args.arrayformat)
             script.append("srun " + args.command)
@@ -404,6 +467,15 @@ def build_slurm() -> SlurmBuilder:
     slurm_builder.add_control_arg(cmd_var="no_slurm", vartype=bool, action="store_true", helptxt="Execute the script "
                                   "in bash, not using SLURM.  For testing purposes.  If running an array, the lowest "
                                   "index array member will be used.")
+    slurm_builder.add_control_arg(cmd_var="queue", vartype=bool, action="store_true", helptxt="Add the script to the "
+                                  "submission queue ($SLURM_QUEUE or ~/.slurm_queue) instead of running sbatch; "
+                                  "slurm_queue.py drain submits it when the scheduler has room.  --begin defaults to "
+                                  "now, as the queue does the throttling.")
+    slurm_builder.add_control_arg(cmd_var="local", vartype=int, helptxt="Run the whole job on this machine, this "
+                                  "many array elements at a time, instead of submitting it to SLURM (e.g. on a "
+                                  "workstation, or on a node of an allocation you already hold).  Each element gets "
+                                  "its own log and err files, with %%a filled in (<job>_%%a.log and .err by "
+                                  "default).  --sleep and --pack are ignored.")
     slurm_builder.add_control_arg(cmd_var="command", vartype=str, helptxt="The job's command: in other words what you "
                                   "would type into a bash shell to run it normally.  Surround with single quotes or "
                                   "use backslahes to escape symbols to make sure it is parsed correctly.  The variable "
@@ -425,6 +497,11 @@ def build_slurm() -> SlurmBuilder:
                                   'strings.  For example, to remove the pdb extension, set to ${arr[$job]%%.pdb} .  If '
                                   'left out, the default is to use the array elements unmodified.  You must use $arr '
                                   'and $job as the array and array element variable names.', array_var=True)
+    slurm_builder.add_control_arg(cmd_var="pack", vartype=int, helptxt="Run this many array elements (e.g. --arraygen "
+                                  "files) in each SLURM array task, instead of one.  Each task runs its elements "
+                                  "with a pool of --cpus workers (without srun), and records the exit code and "
+                                  "runtime of each in <job>_exitcodes/task_<task>.tsv.  --array, if given, still "
+                                  "lists the elements to run.", array_var=True)
     slurm_builder.add_control_arg(cmd_var="sleep", vartype=int, helptxt="Add a sleep command before running the main "
                                   "command when running arrays.  The delay time will be the value given, in seconds, "
                                   "times the array ID.  For example, if you give --sleep 5, the array job with index "
@@ -433,63 +510,283 @@ def build_slurm() -> SlurmBuilder:
     return slurm_builder
 
 
-def run_bash(args: argparse.Namespace):
+def array_spec(indices: List[int]) -> str:
     """
-    This function runs the job specified in a simple bash format, for testing.  In array mode, only the first case will be executed.
+    Compress a list of array indices into a SLURM --array specification, e.g. [0, 1, 2, 5, 7, 8] -> "0-2,5,7-8".
 
-    :param args: An argparse namespace object built from the argparse argument
+    :param indices: The array indices.
+    :return: The --array specification.
     """
 
-    # Get the command
-    command = args.command
-    # If we are using an array, generate array paramters
-    if args.array:
-        # Get the first index of args.array.  This can be comma or hyphen separated
-        indices = [args.array.find("-"), args.array.find(",")]
-        # If we have only -1 (- and , not found), just use args.array as our index.
-        if set(indices) == {-1}:
-            array_idx = args.array
-        # If we have something that's not -1, use that
-        elif -1 in indices:
-            array_idx = args.array[:max(indices)]
-        # Otherwise, use the smaller index
+    ranges = []
+    for idx in sorted(set(indices)):
+        if ranges and idx == ranges[-1][1] + 1:
+            ranges[-1][1] = idx
         else:
-            array_idx = args.array[:min(indices)]
+            ranges.append([idx, idx])
+    return ",".join(str(first) if first == last else "{first}-{last}".format(first=first, last=last)
+                    for first, last in ranges)
+
+
+def expand_array(spec: str) -> List[int]:
+    """
+    Expand a SLURM --array specification into its indices, e.g. "0-2,5,7-11:2%4" -> [0, 1, 2, 5, 7, 9, 11].
+
+    :param spec: The --array specification.  A % throttle is ignored.
+    :return: The array indices, in the order given.
+    """
+
+    indices = []
+    for part in spec.split('%')[0].split(','):
+        part, _, step = part.partition(':')
+        first, _, last = part.partition('-')
+        indices.extend(range(int(first), int(last or first) + 1, int(step or 1)))
+    return indices
 
-        if args.log is not None:
-            args.log = args.log.replace('%%a', str(array_idx))
-        if args.err is not None:
-            args.err = args.err.replace('%%a', str(array_idx))
 
-        # If we have arraygen, get the glob string and format accordingly
-        arrayfile = None
-        if args.arraygen:
-            arrayfile = glob.glob(args.arraygen)[int(array_idx)]
-        # TODO: We're ignoring args.arrayformat at the moment.
+def max_array_size() -> Optional[int]:
+    """
+    Get the cluster's MaxArraySize from scontrol.
+
+    :return: MaxArraySize (array indices must be below it), or None if SLURM isn't available.
+    """
+
+    try:
+        config = subprocess.run(['scontrol', 'show', 'config'], stdout=subprocess.PIPE, universal_newlines=True).stdout
+    except FileNotFoundError:
+        return None
+    for line in config.splitlines():
+        fields = line.split('=')
+        if len(fields) == 2 and fields[0].strip() == 'MaxArraySize':
+            return int(fields[1])
+    return None
 
-        # If we have arrayfile, substitute "$file" for arrayfile
-        if arrayfile:
-            command = command.replace(r'$file', arrayfile)
-        # Replace "$job" with array_idx
-        command = command.replace('$job', array_idx)
 
-    # Execute the command
-    if args.log is not None:
-        args.log = open(args.log, "w")
-    if args.err is not None:
-        args.err = open(args.err, "w")
-    print("Running '{command}' without SLURM.".format(command=command))
-    code_sbatch = subprocess.call(command.split(), stdout=args.log, stderr=args.err)
+def array_files(arraygen: str) -> List[str]:
+    """
+    Expand --arraygen exactly as the arr=(...) line of a SLURM script does, so indices refer to the same files.
+
+    :param arraygen: The --arraygen pattern.
+    :return: The array elements.
+    """
 
-    print("slurmit.py's command completed with code {code_sbatch}.".format(code_sbatch=code_sbatch))
+    listing = subprocess.run(['bash', '-c', 'arr=(' + arraygen + '); printf "%s\\0" "${arr[@]}"'],
+                             stdout=subprocess.PIPE, check=True).stdout
+    return [name.decode() for name in listing.split(b'\0')[:-1]]
 
 
+def run_element(index: Optional[int], arrayfile: Optional[str], command: str, arrayformat: Optional[str],
+                stdout=None, stderr=None) -> Tuple[int, float, int]:
+    """
+    Run one array element in bash, with $job (and $file, from --arrayformat) set as in a SLURM array task.
+
+    :param index: The array index, or None for a job that isn't an array.
+    :param arrayfile: The --arraygen element at index, or None for numeric arrays.
+    :param command: The --command.
+    :param arrayformat: The --arrayformat, or None for numeric arrays.
+    :param stdout: Where the element's stdout goes, defaults to ours.
+    :param stderr: Where the element's stderr goes, defaults to ours.
+    :return: A tuple of (exit code, runtime in seconds, max RSS in KB of bash and the command, or None if it
+    couldn't be measured).
+    """
+
+    env = dict(os.environ)
+    lines = []
+    if index is not None:
+        env['SLURMIT_JOB'] = str(index)
+        lines.append('job=$SLURMIT_JOB')
+    if arrayfile is not None:
+        # Only this element of arr is set, which is all --arrayformat may refer to.
+        env['SLURMIT_FILE'] = arrayfile
+        lines += ['declare -a arr', 'arr[$job]=$SLURMIT_FILE', 'file=' + arrayformat]
+    lines += ['unset SLURMIT_JOB SLURMIT_FILE', command]
+
+    start = time.time()
+    readfd, writefd = os.pipe()
+    try:
+        process = subprocess.Popen([sys.executable, '-S', '-c', RSS_WRAPPER, str(writefd), 'bash', '-c',
+                                    '\n'.join(lines)], env=env, stdout=stdout, stderr=stderr, pass_fds=(writefd,))
+    finally:
+        os.close(writefd)
+    with os.fdopen(readfd, 'r') as rssfile:
+        maxrss = rssfile.read()
+    process.wait()
+    return process.returncode, time.time() - start, int(maxrss) if maxrss else None
+
+
+def run_pack(argv: List[str]):
+    """
+    Run the array elements of one --pack task with a pool of workers, recording the exit code of each.  This is what
+    the SLURM scripts written with --pack call (slurmit.py pack-worker ...).
+
+    :param argv: The command line arguments, excluding the script name and pack-worker.
+    """
+
+    parser = argparse.ArgumentParser(prog='slurmit.py pack-worker', description='Run the array elements of one '
+                                     '--pack task.')
+    parser.add_argument('--task', type=int, required=True, help='The SLURM array task index.')
+    parser.add_argument('--pack', type=int, required=True, help='The number of elements per task.')
+    parser.add_argument('--elements', type=str, required=True, help='The --array specification of all elements.')
+    parser.add_argument('--workers', type=int, default=1, help='The number of elements run at once.')
+    parser.add_argument('--command', type=str, required=True, help='The command run for each element.')
+    parser.add_argument('--arraygen', type=str, help='The files to loop over, as in slurmit.py.')
+    parser.add_argument('--arrayformat', type=str, default='${arr[$job]}', help='The formatting of $file.')
+    parser.add_argument('--exitdir', type=str, required=True, help='The directory of exit code tables; this task '
+                        'writes task_<task>.tsv.')
+    args = parser.parse_args(argv)
+
+    indices = expand_array(args.elements)[args.task * args.pack:(args.task + 1) * args.pack]
+    files = array_files(args.arraygen) if args.arraygen is not None else None
+    if files is not None and indices and max(indices) >= len(files):
+        raise ArgError("Array index {idx} is past the {num} files matching {arraygen}.".format(
+            idx=max(indices), num=len(files), arraygen=args.arraygen))
+
+    os.makedirs(args.exitdir, exist_ok=True)
+    exitcodes = os.path.join(args.exitdir, 'task_{task}.tsv'.format(task=args.task))
+    failed = 0
+    with open(exitcodes, 'w') as exitfile, ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        exitfile.write('\t'.join(PACK_HEADER) + '\n')
+        exitfile.flush()
+        jobs = [(idx, files[idx] if files is not None else None) for idx in indices]
+        results = pool.map(lambda job: run_element(job[0], job[1], args.command, args.arrayformat), jobs)
+        # Rows are written as elements finish (in order), so a killed task still records what it completed.
+        for (idx, arrayfile), (code, seconds, maxrss) in zip(jobs, results):
+            exitfile.write('\t'.join([str(idx), arrayfile or '', str(code), '%.1f' % seconds,
+                                      '' if maxrss is None else str(maxrss)]) + '\n')
+            exitfile.flush()
+            failed += code != 0
+
+    print("slurmit.py pack task {task}: {num} elements, {failed} failed.".format(task=args.task, num=len(indices),
+                                                                                failed=failed))
+    sys.exit(1 if failed else 0)
+
+
+def log_name(pattern: str, index: Optional[int], jobname: str) -> str:
+    """
+    Fill in a SLURM --output/--error filename pattern for a job run without SLURM.
+
+    :param pattern: The filename pattern.
+    :param index: The array index, or None for a job that isn't an array.
+    :param jobname: The job name.
+    :return: The filename.  %a is the array index, %x the job name, and %A and %j are "local".
+    """
+
+    # Protect %% first, so e.g. %%a stays a literal %a.
+    name = pattern.replace('%%', '\0')
+    name = name.replace('%a', '' if index is None else str(index)).replace('%x', jobname)
+    name = name.replace('%A', 'local').replace('%j', 'local')
+    return name.replace('\0', '%')
+
+
+def array_elements(args: argparse.Namespace) -> List[Tuple[Optional[int], Optional[str]]]:
+    """
+    Expand the elements of a job: every (index, file) of --array/--arraygen, or a single (None, None) if the job
+    isn't an array.
+
+    :param args: The processed args.
+    :return: The elements, in --array order.
+    """
+
+    if args.array is None:
+        return [(None, None)]
+    indices = expand_array(args.pack_elements if args.pack_elements is not None else args.array)
+    if args.arraygen is None:
+        return [(idx, None) for idx in indices]
+    files = array_files(args.arraygen)
+    if indices and max(indices) >= len(files):
+        raise ArgError("Array index {idx} is past the {num} files matching {arraygen}.".format(
+            idx=max(indices), num=len(files), arraygen=args.arraygen))
+    return [(idx, files[idx]) for idx in indices]
+
+
+def run_local(args: argparse.Namespace, workers: int, elements: Optional[List] = None) -> List[int]:
+    """
+    Run a job's elements on this machine with a pool of workers, instead of submitting it to SLURM.  Each element gets
+    its own log and err files (from --log/--err, with %a filled in), and its exit code and runtime are recorded in
+    <job>_exitcodes/local.tsv.
+
+    :param args: The processed args.
+    :param workers: The number of elements run at once.
+    :param elements: The (index, file) elements to run, defaults to all of them.
+    :return: The indices of the elements that failed.
+    """
+
+    if elements is None:
+        elements = array_elements(args)
+    mode = 'a' if args.openmode == 'append' else 'w'
+
+    def run(element):
+        index, arrayfile = element
+        with open(log_name(args.log, index, args.job), mode) as log, \
+                open(log_name(args.err, index, args.job), mode) as err:
+            return run_element(index, arrayfile, args.command, args.arrayformat, stdout=log, stderr=err)
+
+    exitdir = args.job + '_exitcodes'
+    os.makedirs(exitdir, exist_ok=True)
+    failed = []
+    start = time.time()
+    print("Running {num} element(s) of {job} without SLURM, {workers} at a time.".format(num=len(elements),
+                                                                                         job=args.job,
+                                                                                         workers=workers))
+    with open(os.path.join(exitdir, 'local.tsv'), 'w') as exitfile, ThreadPoolExecutor(max_workers=workers) as pool:
+        exitfile.write('\t'.join(PACK_HEADER) + '\n')
+        for (index, arrayfile), (code, seconds, maxrss) in zip(elements, pool.map(run, elements)):
+            exitfile.write('\t'.join(['' if index is None else str(index), arrayfile or '', str(code),
+                                      '%.1f' % seconds, '' if maxrss is None else str(maxrss)]) + '\n')
+            exitfile.flush()
+            if code != 0:
+                failed.append(index)
+
+    print("slurmit.py ran {num} element(s) in {seconds:.1f} s: {ok} succeeded, {bad} failed.".format(
+        num=len(elements), seconds=time.time() - start, ok=len(elements) - len(failed), bad=len(failed)))
+    if failed and args.array is not None:
+        print("To rerun the failed elements, use --array " + array_spec(failed))
+    return failed
+
+
+def record_submission(args: argparse.Namespace, argv: List[str], submit_id: str, elements: Optional[List] = None):
+    """
+    Record the elements of an array submission in the job's ledger (see slurm_ledger.py), so failed or missing
+    elements can be found and resubmitted later.
+
+    :param args: The processed args.
+    :param argv: The slurmit.py arguments.
+    :param submit_id: The SLURM job id, or "local".
+    :param elements: The (index, file) elements, defaults to all of them.
+    """
+
+    from slurm_ledger import Ledger, ledger_name
+    ledger = Ledger(ledger_name(args.job))
+    ledger.record_submission(submit_id, array_elements(args) if elements is None else elements, argv,
+                             args.pack if submit_id != 'local' else None)
+    ledger.close()
+
+
+def run_bash(args: argparse.Namespace):
+    """
+    This function runs the job specified in a simple bash format, for testing.  In array mode, only the first case will be executed.
+
+    :param args: An argparse namespace object built from the argparse argument
+    """
+
+    run_local(args, 1, array_elements(args)[:1])
+
 
 def main(argv):
     """
     main()
     """
 
+    # The worker run inside each --pack array task.
+    if argv and argv[0] == 'pack-worker':
+        run_pack(argv[1:])
+        return
+    # Resubmitting the failed elements of a job, from its ledger.
+    if argv and argv[0] == 'resubmit-failed':
+        from slurm_ledger import main as ledger_main
+        ledger_main(argv)
+        return
+
     # Create a SlurmBuilder
     slurm_builder = build_slurm()
     # Have slurm_builder process arguments
@@ -502,12 +799,45 @@ def main(argv):
 
     # If desired, execute the script.  Keep the error code stored in code_sbatch.
     code_sbatch = 0
-    if args.no_execute is not True and args.no_slurm is not True:
+    if args.no_execute is not True and args.queue:
+        from slurm_queue import SubmitQueue
+        # The ledger names the submission after the queue entry until slurm_queue.py submits it.
+        placeholder = 'queued:' + str(time.time_ns())
+        ledger = None
+        if args.array is not None:
+            record_submission(args, argv, placeholder)
+            from slurm_ledger import ledger_name
+            ledger = {'filename': os.path.abspath(ledger_name(args.job)), 'submit_id': placeholder}
+        with open(scriptname, 'r') as scriptfile:
+            entry = SubmitQueue().add(scriptfile.read(), os.getcwd(), scriptname, ledger)
+        print("Queued {script} as {entry}.".format(script=scriptname, entry=entry))
+    elif args.no_execute is not True and args.no_slurm is not True and args.local is None:
+        # Array indices must be below MaxArraySize, or sbatch rejects the whole array.
+        maxsize = max_array_size() if args.array is not None else None
+        if maxsize is not None and max(expand_array(args.array)) >= maxsize:
+            raise ArgError("The array goes up to index {last}, but MaxArraySize is {maxsize}.  Use --pack to run "
+                           "several elements per array task.".format(last=max(expand_array(args.array)),
+                                                                    maxsize=maxsize))
         # Run the script, waiting for it to finish.
         try:
-            code_sbatch = subprocess.call(['sbatch', scriptname])
+            submitted = subprocess.run(['sbatch', scriptname], stdout=subprocess.PIPE, universal_newlines=True)
         except FileNotFoundError:
             raise FileNotFoundError("sbatch is not available.  Are you running in a SLURM environment?")
+        print(submitted.stdout, end='')
+        code_sbatch = submitted.returncode
+        # Record the array's elements under the SLURM job id ("Submitted batch job <id>").
+        if code_sbatch == 0 and args.array is not None and submitted.stdout.split():
+            record_submission(args, argv, submitted.stdout.split()[-1])
+    elif args.no_execute is not True and args.local is not None:
+        elements = array_elements(args)
+        if args.array is not None:
+            record_submission(args, argv, 'local', elements)
+        code_sbatch = 1 if run_local(args, args.local, elements) else 0
+        if args.array is not None:
+            from slurm_ledger import Ledger, ledger_name
+            ledger = Ledger(ledger_name(args.job))
+            ledger.read_exitcodes(args.job + '_exitcodes')
+            ledger.close()
     elif args.no_execute is not True and args.no_slurm is True:
         run_bash(args)
 
@@ -0,0 +1,71 @@
+"""
+Check partition_balancer.py against recorded sinfo and squeue output (tests/fixtures/).
+
+In the fixtures, main has 4 idle CPUs (c003 is drained), short 28 (c103 is down) and bigmem 32.  alice's pending jobs
+are: 5001 (8 CPUs), the array range 5002_[3-12%4] (10 one-CPU tasks), 5003 (held by a dependency), 5005 (queued in
+main and short), 5006 (100G, only fits on bigmem), 5007 (64 CPUs, fits nowhere) and 5009 (2 CPUs, which main can
+start).  5004 and 5008 are bob's.
+"""
+
+import os
+
+import partition_balancer
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SINFO = os.path.join(FIXTURES, 'sinfo_nodes.txt')
+SQUEUE = os.path.join(FIXTURES, 'squeue_pending.txt')
+
+
+def plan(targets, **kwargs):
+    with open(SINFO, 'r') as sinfo, open(SQUEUE, 'r') as squeue:
+        partitions = partition_balancer.parse_sinfo(sinfo.read())
+        jobs = partition_balancer.parse_squeue(squeue.read())
+    return [(job.jobid, target) for job, target in
+            partition_balancer.plan_moves(partitions, jobs, 'alice', targets, **kwargs)]
+
+
+def test_parse_fixtures():
+    with open(SINFO, 'r') as sinfo, open(SQUEUE, 'r') as squeue:
+        partitions = partition_balancer.parse_sinfo(sinfo.read())
+        jobs = partition_balancer.parse_squeue(squeue.read())
+    assert {name: (part.idle_cpus, part.node_cpus, part.node_mem) for name, part in partitions.items()} == {
+        'main': (4, 4, 9000), 'short': (28, 16, 60000), 'bigmem': (32, 32, 500000)}
+    array = jobs[1]
+    assert (array.jobid, array.tasks, array.cpus, array.mem) == ('5002', 10, 10, 2000)
+
+
+def test_plan_one_target():
+    assert plan(['short']) == [('5001', 'short'), ('5002', 'short')]
+
+
+def test_plan_all_targets():
+    # 5006 only fits on bigmem; the array goes to short once bigmem has fewer CPUs left.
+    assert plan(['main', 'short', 'bigmem']) == [('5001', 'bigmem'), ('5002', 'short'), ('5006', 'bigmem')]
+
+
+def test_plan_limits():
+    assert plan(['short', 'bigmem'], max_moves=1) == [('5001', 'bigmem')]
+    assert plan(['short', 'bigmem'], sources=['short']) == []
+
+
+def test_update_commands():
+    with open(SINFO, 'r') as sinfo, open(SQUEUE, 'r') as squeue:
+        moves = partition_balancer.plan_moves(partition_balancer.parse_sinfo(sinfo.read()),
+                                              partition_balancer.parse_squeue(squeue.read()), 'alice',
+                                              ['main', 'short', 'bigmem'])
+    assert partition_balancer.update_commands(moves) == [
+        ['scontrol', 'update', 'jobid=5001,5006', 'partition=bigmem'],
+        ['scontrol', 'update', 'jobid=5002', 'partition=short']]
+    assert partition_balancer.update_commands(moves, batch_size=1)[:2] == [
+        ['scontrol', 'update', 'jobid=5001', 'partition=bigmem'],
+        ['scontrol', 'update', 'jobid=5006', 'partition=bigmem']]
+
+
+def test_main_dry_run(capsys):
+    partition_balancer.main(['--sinfo_file', SINFO, '--squeue_file', SQUEUE, '--user', 'alice', '--to', 'short',
+                             '--dry_run'])
+    assert capsys.readouterr().out.splitlines() == [
+        '5001: main -> short (8 CPUs)',
+        '5002: main -> short (10 CPUs)',
+        'scontrol update jobid=5001,5002 partition=short',
+        'Would move 2 pending jobs.']
@@ -0,0 +1,58 @@
+"""
+Check slurm_queue.py's drain with the stub sbatch and squeue in tests/fixtures/bin/.
+"""
+
+import os
+
+import slurm_queue
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+SBATCH = os.path.join(FIXTURES, 'bin', 'sbatch')
+SQUEUE = os.path.join(FIXTURES, 'bin', 'squeue')
+
+
+def test_pending_jobs(monkeypatch):
+    monkeypatch.setenv('SQUEUE_FIXTURE', os.path.join(FIXTURES, 'squeue_pending_ids.txt'))
+    assert slurm_queue.pending_jobs(SQUEUE) == 5
+    assert slurm_queue.pending_jobs(os.path.join(FIXTURES, 'bin', 'no_squeue')) is None
+
+
+def test_script_jobs():
+    assert slurm_queue.script_jobs('#!/bin/bash\n#SBATCH --array=0-999%50\n') == 1000
+    assert slurm_queue.script_jobs('#!/bin/bash\n#SBATCH --array 1-10,20\n') == 11
+    assert slurm_queue.script_jobs('#!/bin/bash\necho\n') == 1
+
+
+def test_drain(tmp_path):
+    queue = slurm_queue.SubmitQueue(str(tmp_path / 'queue'))
+    queue.add('#!/bin/bash\necho one\n', str(tmp_path), 'one.sh')
+    queue.add('#!/bin/bash\n#LIMIT_ONCE\necho two\n', str(tmp_path), 'two.sh')
+    queue.add('#!/bin/bash\n#REJECT\necho three\n', str(tmp_path), 'three.sh')
+    waits = []
+    counts = slurm_queue.drain(queue, sbatch=SBATCH, count_pending=lambda: 0, sleep=waits.append)
+
+    assert counts == {'submitted': 2, 'failed': 1}
+    # The submission limit waits --backoff, then two.sh is submitted on the next round.
+    assert 30.0 in waits
+    assert queue.pending() == []
+    assert len(os.listdir(queue.failed_dir)) == 1
+    with open(queue.log, 'r') as log:
+        assert [line.split('\t')[1] for line in log] == ['1001', '1002']
+
+
+def test_drain_counts_array_elements(tmp_path):
+    queue = slurm_queue.SubmitQueue(str(tmp_path / 'queue'))
+    for num in range(3):
+        queue.add('#!/bin/bash\n#SBATCH --array=0-999\necho $SLURM_ARRAY_TASK_ID\n', str(tmp_path),
+                  'array{num}.sh'.format(num=num))
+    rounds = []
+
+    def count_pending():
+        rounds.append(len(queue.pending()))
+        return 0
+
+    counts = slurm_queue.drain(queue, max_pending=1500, sbatch=SBATCH, count_pending=count_pending,
+                               sleep=lambda seconds: None)
+    assert counts == {'submitted': 3, 'failed': 0}
+    # 1000 elements fit in the first round, and the second script fills it up.
+    assert rounds == [3, 1]